@@ -0,0 +1,211 @@
+"""Runs the crawl end to end against the local mock server and reports its throughput.
+
+Every stage of the crawl (brands, brand devices, device details, device
+specs) is run against ``benchmarks.mock_server`` serving the saved pages,
+so the numbers can be compared between changes without touching the site.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_crawl [--repeat N] [--latency 0.02] [--error-rate 0.0]
+
+The memory cache of parsed pages is off, so that every repeat fetches and
+parses the pages again, ``--memory-cache`` measures it instead, emptied
+before every round, the stages then report the pages actually fetched.
+"""
+
+import argparse
+import asyncio
+from dataclasses import dataclass
+import statistics
+import time
+from typing import Callable, List
+from urllib.parse import urlsplit
+
+from benchmarks.mock_server import DEFAULT_FIXTURES_DIR, MockGsmarena, fixture_name
+from utils.crawler import Crawler
+from utils.fetcher import FetchStats, Fetcher, set_fetcher
+from utils.helper import set_base_url
+from utils.memory_cache import MemoryCache, set_memory_cache
+from utils.ratelimit import AdaptiveRateLimiter
+from utils.scraper import (
+    get_brand_devices_generator,
+    get_brands,
+    get_device_details_async,
+    get_device_specs_async,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> float | None:
+    """The peak resident memory of the process in MB, None where it can't be read"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass
+class StageResult:
+    name: str
+    pages: int
+    wall_time: float
+    cpu_time: float
+    latencies: List[float]
+    peak_rss: float | None
+
+    def report(self) -> str:
+        latencies = sorted(self.latencies) or [0.0]
+        p50 = statistics.median(latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        rss = f"{self.peak_rss:7.1f} MB" if self.peak_rss is not None else "    n/a"
+        return (
+            f"{self.name:<15} {self.pages:6d} pages"
+            f" {self.pages / self.wall_time:9.1f} pages/s"
+            f"  p50 {p50 * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms"
+            f"  cpu {self.cpu_time:6.2f} s  peak rss {rss}"
+        )
+
+
+def run_stage(
+    name: str, stage: Callable[[], int], latencies: List[float]
+) -> StageResult:
+    """
+    Times one stage of the crawl
+
+    :param name: The name printed in the report
+
+    :param stage: Runs the stage and returns the number of pages it fetched
+
+    :param latencies: Filled with the latency of every request by the fetcher
+    """
+    latencies.clear()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    pages = stage()
+    return StageResult(
+        name=name,
+        pages=pages,
+        wall_time=time.perf_counter() - wall_start,
+        cpu_time=time.process_time() - cpu_start,
+        latencies=list(latencies),
+        peak_rss=peak_rss_mb(),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument(
+        "--memory-cache",
+        action="store_true",
+        help="keep the parsed pages in memory within a round",
+    )
+    args = parser.parse_args(argv)
+
+    latencies: List[float] = []
+
+    def on_stats(stats: FetchStats) -> None:
+        latencies.append(stats.total_time)
+
+    server = MockGsmarena(
+        fixtures_dir=args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=0,
+        seed=0,
+    )
+    # No cache, so that every page goes over the wire, and a rate limiter
+    # fast enough not to be the bottleneck of a local server
+    fetcher = Fetcher(
+        pool_maxsize=args.concurrency,
+        on_stats=on_stats,
+        rate_limiter=AdaptiveRateLimiter(
+            initial_rate=10_000, max_rate=10_000, burst=args.concurrency
+        ),
+    )
+    set_fetcher(fetcher)
+    memory_cache = MemoryCache() if args.memory_cache else MemoryCache(max_bytes=0)
+    set_memory_cache(memory_cache)
+
+    with server:
+        set_base_url(server.base_url)
+
+        brands = get_brands()
+        devices = [
+            device
+            for brand in brands
+            for device in get_brand_devices_generator(brand.gsmarena_link)
+        ]
+        # Only the device pages that were saved can be served
+        device_links = [
+            device.gsmarena_link
+            for device in devices
+            if fixture_name(urlsplit(device.gsmarena_link).path) in server.pages
+        ]
+        if not device_links:
+            raise SystemExit("No saved device page is linked from the saved listings")
+
+        def brands_stage() -> int:
+            requests = len(latencies)
+            for _ in range(args.repeat):
+                memory_cache.clear()
+                get_brands()
+            return len(latencies) - requests
+
+        def devices_stage() -> int:
+            requests = len(latencies)
+            for _ in range(args.repeat):
+                memory_cache.clear()
+                for brand in brands:
+                    for _ in get_brand_devices_generator(brand.gsmarena_link):
+                        pass
+            return len(latencies) - requests
+
+        def device_stage(extract) -> Callable[[], int]:
+            links = device_links * args.repeat
+
+            async def crawl():
+                async with Crawler(args.concurrency, args.concurrency) as crawler:
+                    await asyncio.gather(*(extract(link, crawler) for link in links))
+
+            def stage() -> int:
+                # The pages actually fetched, requests for a page already being
+                # fetched are shared when the memory cache is on
+                requests = len(latencies)
+                memory_cache.clear()
+                asyncio.run(crawl())
+                return len(latencies) - requests
+
+            return stage
+
+        results = [
+            run_stage("brands", brands_stage, latencies),
+            run_stage("brand devices", devices_stage, latencies),
+            run_stage(
+                "device details", device_stage(get_device_details_async), latencies
+            ),
+            run_stage("device specs", device_stage(get_device_specs_async), latencies),
+        ]
+
+    print(
+        f"{len(server.pages)} saved pages, {len(brands)} brands, {len(devices)} devices,"
+        f" {args.repeat} rounds, {server.requests} requests served"
+    )
+    for result in results:
+        print(result.report())
+    fetcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compares the BeautifulSoup extractors with the single-pass lxml ones on the saved device pages.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_extractor [--repeat N]
+"""
+
+import argparse
+import glob
+from inspect import getsourcefile
+from os.path import abspath, basename, dirname, join
+import time
+
+from bs4 import BeautifulSoup
+
+from utils.extractor import device_details, device_specs
+from utils.lxml_extractor import (
+    device_details_from_html,
+    device_specs_from_html,
+    parse_html,
+)
+
+
+# Get the directory path of this file
+current_dir = dirname(abspath(getsourcefile(lambda: 0)))
+
+
+def extract_with_bs4(page: str):
+    document = BeautifulSoup(page, "lxml")
+    return device_details(document), device_specs(document)
+
+
+def extract_with_lxml(page: str):
+    root = parse_html(page)
+    return device_details_from_html(root), device_specs_from_html(root)
+
+
+def pages_per_second(extract, pages, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            extract(page)
+    return repeat * len(pages) / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument(
+        "--fixtures",
+        default=join(current_dir, "fixtures"),
+        help="directory of the saved pages",
+    )
+    args = parser.parse_args(argv)
+
+    pages = []
+    for path in sorted(glob.glob(join(args.fixtures, "*.html"))):
+        with open(path, encoding="utf-8") as file:
+            page = file.read()
+        # Only device pages have a specs list
+        if 'id="specs-list"' not in page:
+            continue
+        if extract_with_bs4(page) != extract_with_lxml(page):
+            raise SystemExit(f"Extractors disagree on {basename(path)}")
+        pages.append(page)
+
+    old = pages_per_second(extract_with_bs4, pages, args.repeat)
+    new = pages_per_second(extract_with_lxml, pages, args.repeat)
+
+    print(f"{len(pages)} device pages, {args.repeat} rounds, identical output")
+    print(f"BeautifulSoup: {old:10.1f} pages/s")
+    print(f"lxml:          {new:10.1f} pages/s ({new / old:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measures the memory of a catalog of spec records, plain dataclasses vs the slotted ones.
+
+Both kinds of records are built from the same rows of values, each row with
+its own copy of every string, like the values of separately parsed pages.
+The memory is measured once the rows are dropped, so each kind is charged
+for what its records keep: the plain ones every copy, the slotted ones the
+interned strings. Every row has the specs of the same page but its name,
+the best case for interning, a real catalog has more distinct values.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_records [--count 50000]
+"""
+
+import argparse
+from dataclasses import astuple, fields, make_dataclass
+import gc
+from inspect import getsourcefile
+from os.path import abspath, dirname, join
+import time
+import tracemalloc
+
+from utils.classes import DeviceSpecs
+from utils.lxml_extractor import device_specs_from_html
+
+
+# Get the directory path of this file
+current_dir = dirname(abspath(getsourcefile(lambda: 0)))
+
+# DeviceSpecs as it was before the records were slotted
+PlainDeviceSpecs = make_dataclass(
+    "PlainDeviceSpecs", [(field.name, field.type, None) for field in fields(DeviceSpecs)]
+)
+
+
+def sample_values():
+    with open(
+        join(current_dir, "fixtures", "apple_iphone_16_pro_max-13123.html"),
+        encoding="utf-8",
+    ) as file:
+        return astuple(device_specs_from_html(file.read()))
+
+
+def source_rows(values, count: int):
+    """The values of the records, a copy of every string per row as a parser gives"""
+    rows = []
+    for i in range(count):
+        row = [None if value is None else (value + " ")[:-1] for value in values]
+        row[0] = f"{values[0]} #{i}"
+        rows.append(row)
+    return rows
+
+
+def measure(record_type, values, count: int):
+    gc.collect()
+    tracemalloc.start()
+    rows = source_rows(values, count)
+    start = time.perf_counter()
+    records = [record_type(*row) for row in rows]
+    elapsed = time.perf_counter() - start
+    del rows
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    gc.collect()
+    return size, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    values = sample_values()
+    plain_size, plain_time = measure(PlainDeviceSpecs, values, args.count)
+    slotted_size, slotted_time = measure(DeviceSpecs, values, args.count)
+
+    print(f"{args.count} DeviceSpecs records, {len(values)} fields each")
+    print(
+        f"dataclass:         {plain_size / 2**20:9.1f} MB"
+        f" ({plain_size / args.count:6.0f} B/record), built in {plain_time:.2f} s"
+    )
+    print(
+        f"slotted, interned: {slotted_size / 2**20:9.1f} MB"
+        f" ({slotted_size / args.count:6.0f} B/record), built in {slotted_time:.2f} s"
+        f" ({plain_size / slotted_size:.1f}x smaller)"
+    )
+
+
+if __name__ == "__main__":
+    main()
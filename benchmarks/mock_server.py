@@ -0,0 +1,238 @@
+"""A local stand-in of gsmarena serving the saved pages, for offline crawls and benchmarks.
+
+A request for ``/<name>.php`` or ``/<name>.php3`` is answered with
+``fixtures/<name>.html``, so the links in the saved pages resolve against
+the server. Latency, errors and throttling can be injected to see how the
+crawler copes with a slow or overloaded site.
+
+Run from the root of the project:
+
+    python -m benchmarks.mock_server [--port 8000] [--latency 0.05] [--error-rate 0.01]
+
+and point the crawl scripts at it with ``GSMARENA_BASE_URL=http://127.0.0.1:8000``.
+"""
+
+import argparse
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from inspect import getsourcefile
+import os
+from os.path import abspath, dirname, join
+import random
+import threading
+import time
+from typing import Dict
+
+# Get the directory path of this file
+current_dir = dirname(abspath(getsourcefile(lambda: 0)))
+
+DEFAULT_FIXTURES_DIR = join(current_dir, "fixtures")
+
+
+def fixture_name(path: str) -> str | None:
+    """
+    Maps the path of a request to the name of the saved page
+
+    :param path: The path of the request, e.g. ``/apple-phones-48.php``
+
+    :return: The file name of the page, e.g. ``apple-phones-48.html``,
+        None if the path isn't a page of the site
+    """
+    name = path.split("?", 1)[0].lstrip("/")
+    for extension in (".php3", ".php"):
+        if name.endswith(extension):
+            name = name[: -len(extension)]
+            break
+    else:
+        return None
+    if not name or "/" in name or name.startswith("."):
+        return None
+    return name + ".html"
+
+
+class MockGsmarena(ThreadingHTTPServer):
+    """
+    Serves the saved pages of a fixtures directory with injectable latency and errors
+
+    Pages are loaded once, on start. Every response carries a Last-Modified
+    header and conditional requests get a 304, like the real site.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        fixtures_dir: str = DEFAULT_FIXTURES_DIR,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: int | None = None,
+    ):
+        """
+        :param address: The host and port to listen on, port 0 picks a free one
+
+        :param fixtures_dir: The directory of the saved pages
+
+        :param latency: The seconds every response is delayed by
+
+        :param jitter: The maximum seconds added at random to the latency
+
+        :param error_rate: The share of requests answered with a 500
+
+        :param throttle_rate: The share of requests answered with a 429
+
+        :param retry_after: The Retry-After seconds of the 429 responses
+
+        :param seed: Seeds the random errors so that runs can be repeated
+        """
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+        self.pages: Dict[str, bytes] = {}
+        for name in os.listdir(fixtures_dir):
+            if name.endswith(".html"):
+                with open(join(fixtures_dir, name), "rb") as file:
+                    self.pages[name] = file.read()
+        self.last_modified = formatdate(time.time(), usegmt=True)
+
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        """The URL to pass to **set_base_url**"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "MockGsmarena":
+        """Serves requests on a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the background thread and closes the socket"""
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockGsmarena":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def draw(self) -> float:
+        """Draws a random number, safe to call from the handler threads"""
+        with self._lock:
+            self.requests += 1
+            return self._random.random()
+
+    def delay(self) -> float:
+        """The seconds the next response is delayed by"""
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, with Nagle on every keep-alive
+    # response would wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+    server: MockGsmarena
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        draw = server.draw()
+        time.sleep(server.delay())
+
+        if draw < server.throttle_rate:
+            self._reply(429, b"Too Many Requests", {"Retry-After": server.retry_after})
+            return
+        if draw < server.throttle_rate + server.error_rate:
+            self._reply(500, b"Internal Server Error")
+            return
+
+        name = fixture_name(self.path)
+        page = server.pages.get(name) if name else None
+        if page is None:
+            self._reply(404, b"Not Found")
+            return
+
+        since = self.headers.get("If-Modified-Since")
+        if since and _not_modified(since, server.last_modified):
+            self._reply(304, b"", {"Last-Modified": server.last_modified})
+            return
+
+        self._reply(
+            200,
+            page,
+            {
+                "Content-Type": "text/html; charset=utf-8",
+                "Last-Modified": server.last_modified,
+            },
+        )
+
+    def _reply(self, status: int, body: bytes, headers: Dict | None = None):
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, str(value))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def _not_modified(since: str, last_modified: str) -> bool:
+    try:
+        return parsedate_to_datetime(since) >= parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    server = MockGsmarena(
+        (args.host, args.port),
+        fixtures_dir=args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+    print(f"Serving {len(server.pages)} pages on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
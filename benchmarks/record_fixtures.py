@@ -0,0 +1,64 @@
+"""Saves pages of gsmarena to the fixtures directory so they can be replayed offline.
+
+Pages are saved under the names the mock server looks them up by, e.g.
+``https://www.gsmarena.com/apple-phones-48.php`` becomes
+``fixtures/apple-phones-48.html``.
+
+Run from the root of the project:
+
+    python -m benchmarks.record_fixtures makers.php3 apple-phones-48.php [--pages-of apple-phones-48.php]
+"""
+
+import argparse
+from os.path import join
+
+from benchmarks.mock_server import DEFAULT_FIXTURES_DIR, fixture_name
+from utils.helper import absolute_link, get_base_url, get_document, get_html
+from utils.scraper import _parse_page_links
+
+
+def record(href: str, fixtures_dir: str) -> str:
+    """
+    Saves a page of the site
+
+    :param href: The link of the page relative to the root of the site
+
+    :param fixtures_dir: The directory to save the page to
+
+    :return: The path of the saved page
+    """
+    name = fixture_name("/" + href)
+    if name is None:
+        raise ValueError(f"{href} isn't a page of the site")
+
+    path = join(fixtures_dir, name)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(get_html(absolute_link(href)))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", help="links relative to the site root")
+    parser.add_argument(
+        "--pages-of",
+        action="append",
+        default=[],
+        metavar="LISTING",
+        help="also save every page of this brand listing",
+    )
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR)
+    args = parser.parse_args(argv)
+
+    pages = list(args.pages)
+    for listing in args.pages_of:
+        pages.append(listing)
+        for link in _parse_page_links(get_document(absolute_link(listing))):
+            pages.append(link.removeprefix(get_base_url()))
+
+    for href in dict.fromkeys(pages):
+        print(f"Saved {record(href, args.fixtures)}")
+
+
+if __name__ == "__main__":
+    main()
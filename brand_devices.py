@@ -1,54 +1,255 @@
-"""Stores the devices of a brand in csv format from gsmarena's brand page."""
+"""Stores the devices of a brand in csv format from gsmarena's brand page.
 
-import csv
-import json
+Every page is checkpointed in a crawl frontier, so if the script is stopped
+running it again resumes where it left off. Pass --restart to start over.
+Listing pages that can't be fetched or extracted are kept with their HTML
+and error in .cache/quarantine and fetched again by the next run.
+
+All brands and devices are also streamed to data/brand_devices.jsonl, one
+record per line, a ``"brand"`` record followed by its ``"device"`` records.
+During a full crawl they go to data/brand_devices.jsonl.partial, brand by
+brand, which replaces the previous file once every brand is done.
+
+The devices of every brand are written to data/brands/<brand id>.csv, or in
+the format given by --format: jsonl, parquet or sqlite. The files are
+replaced atomically, so a run that stops leaves the previous ones whole.
+
+Pass --refresh to only walk the listings of the brands whose number of
+devices changed since data/phone_brands.csv was written, stopping at the
+first device already stored. The new devices are added to the brand's
+file and appended to data/brand_devices.jsonl.
+
+Pass --metrics to save the timings of the fetch, parse, extract and write
+stages, and --profile to profile one of them with cProfile.
+"""
+
+import argparse
+import asyncio
 from inspect import getsourcefile
+import os
 from os.path import abspath, dirname, join
+from typing import List, Sequence
+
+from utils.classes import Brand, Device
+from utils.crawler import DEFAULT_CONCURRENCY, Crawler
+from utils.device_index import device_id
+from utils.frontier import DONE, FAILED, Frontier
+from utils.helper import absolute_link
+from utils.refresh import (
+    brand_devices_path,
+    changed_brands,
+    read_brands,
+    read_devices,
+    write_brands,
+)
+from utils.jsonl import EXTENSIONS, JsonLinesWriter
+from utils.metrics import Progress, cprofile_hook, get_metrics
+from utils.resilience import Quarantine
+from utils.scraper import (
+    crawl_brand_devices_async,
+    get_brands,
+    get_new_brand_devices,
+)
+from utils.writers import WRITERS, open_writer
 
-from utils.scraper import get_brand_devices_generator, get_brands_generator
+DEVICE_FIELDS = Device.field_names()
 
 # Get the directory path of this file
 current_dir = dirname(abspath(getsourcefile(lambda: 0)))
+data_dir = join(current_dir, "data")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: The parser of the command line arguments of the script
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="discard the checkpoint of a previous run",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="only fetch the devices added since the last run",
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(WRITERS),
+        default="csv",
+        help="the format of the file of each brand's devices in data/brands",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["gzip", "zstd"],
+        help="compress data/brand_devices.jsonl",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="the number of listing pages fetched at once",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="save the metrics after every brand, as Prometheus text if PATH ends with .prom",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["parse", "extract", "write"],
+        action="append",
+        default=[],
+        help="profile a stage with cProfile, saved to <stage>.prof",
+    )
+    return parser
+
+
+def write_brand(
+    brand_devices: JsonLinesWriter,
+    brand: Brand,
+    devices: List[Device],
+    new_devices: List[Device],
+    output_format: str = "csv",
+) -> None:
+    """
+    Writes the devices of the brand to its file and the new ones to the JSONL file
+
+    :param brand_devices: The writer of data/brand_devices.jsonl
+
+    :param brand: The brand
+
+    :param devices: Every device of the brand, in the order they are listed
+
+    :param new_devices: The devices to append to data/brand_devices.jsonl
+
+    :param output_format: The format of the brand's file, see utils.writers
+    """
+    with get_metrics().timer("write"):
+        path = brand_devices_path(data_dir, brand, output_format)
+        with open_writer(output_format, path, DEVICE_FIELDS) as writer:
+            writer.write_many(device.to_row() for device in devices)
+        # The file written in another format by a previous run is stale now
+        for other in WRITERS:
+            stale = brand_devices_path(data_dir, brand, other)
+            if other != output_format and os.path.exists(stale):
+                os.remove(stale)
+
+        brand_devices.write({"type": "brand", **brand.to_dict()})
+        for device in new_devices:
+            brand_devices.write(
+                {
+                    "type": "device",
+                    "brand_id": brand.id,
+                    "device_id": device_id(device.gsmarena_link),
+                    **device.to_dict(),
+                }
+            )
+        brand_devices.flush()
 
-brand_devices = {}
 
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    Runs the script
+
+    :param argv: The command line arguments, those of the process if not given
+    """
+    args = build_parser().parse_args(argv)
+
+    metrics = get_metrics()
+    for stage in args.profile:
+        metrics.add_profiler_hook(stage, cprofile_hook(f"{stage}.prof"))
+
+    frontier = Frontier(join(current_dir, ".cache", "brand_devices_frontier.sqlite"))
+    if args.restart:
+        frontier.clear()
+    # Pages left in flight or failed by a previous run are fetched again
+    frontier.recover()
+    frontier.retry_failed()
+    quarantine = Quarantine(join(current_dir, ".cache", "quarantine"))
+
+    brand_devices = JsonLinesWriter(
+        join(data_dir, "brand_devices.jsonl" + EXTENSIONS[args.compression]),
+        compression=args.compression,
+        append=args.refresh,
+        # Followed as the crawl goes, moved in place once it's done
+        partial=True,
+    )
+
+    def brand_done(brand: Brand) -> None:
+        brand_devices.flush()
+        print(f"Devices of {brand.name} extracted successfully.")
+        progress.update()
+        if args.metrics:
+            metrics.write(args.metrics)
+        print("-------------------------------------------------------------")
+
+    async def crawl_brand(brand: Brand) -> List[Device]:
+        async with Crawler(max_concurrency=args.concurrency) as crawler:
+            return await crawl_brand_devices_async(
+                brand, frontier, crawler, quarantine
+            )
 
-print("-------------------------------------------------------------")
-print("Started extracting devices of phone brands from GSM Arena...")
-print("-------------------------------------------------------------")
-for brand in get_brands_generator():
     print("-------------------------------------------------------------")
-    print(f"Extracting devices of {brand.name}...")
-    brand_devices[brand.id] = {
-        "name": brand.name,
-        "gsmarena_link": brand.gsmarena_link,
-        "number_of_devices": brand.number_of_devices,
-        "devices": [],
-    }
-
-    with open(
-        join(current_dir, "data", "brands", f"{brand.name.lower()}_devices.csv"),
-        "w",
-        newline="",
-        encoding="utf-8",
-    ) as file:
-        writer = csv.DictWriter(
-            file, ["title", "extended_title", "img_link", "gsmarena_link"]
-        )
-        writer.writeheader()
-
-        for device in get_brand_devices_generator(brand.gsmarena_link, 5000):
-            writer.writerow(device.__dict__)
-            brand_devices[brand.id]["devices"].append(device.__dict__)
-    print(f"Devices of {brand.name} extracted successfully.")
+    print("Started extracting devices of phone brands from GSM Arena...")
     print("-------------------------------------------------------------")
 
+    if args.refresh:
+        brands_csv = join(data_dir, "phone_brands.csv")
+        brands = get_brands()
+        changed = changed_brands(brands, read_brands(brands_csv))
+        print(f"{len(changed)} of {len(brands)} brands have new devices")
+        progress = Progress(len(changed), "brands", interval=0)
+
+        for brand in changed:
+            print("-------------------------------------------------------------")
+            print(f"Extracting new devices of {brand.name}...")
+            known = read_devices(brand_devices_path(data_dir, brand))
+            new_devices = get_new_brand_devices(
+                brand.gsmarena_link,
+                {device_id(device.gsmarena_link) for device in known},
+            )
+            print(f"{len(new_devices)} new devices")
+            write_brand(
+                brand_devices, brand, new_devices + known, new_devices, args.format
+            )
+            brand_done(brand)
+
+        # The next refresh compares against today's numbers
+        write_brands(brands_csv, brands)
+    else:
+        makers_url = absolute_link("makers.php3")
+        frontier.add(makers_url, "makers")
+        if frontier.state(makers_url) != DONE:
+            frontier.complete(makers_url, [brand.to_dict() for brand in get_brands()])
+        brands = [Brand(**brand) for brand in frontier.result(makers_url)]
+        progress = Progress(len(brands), "brands", interval=0)
+
+        for brand in brands:
+            print("-------------------------------------------------------------")
+            print(f"Extracting devices of {brand.name}...")
+
+            # Listing pages done in a previous run are read back from the frontier
+            devices = asyncio.run(crawl_brand(brand))
+            write_brand(brand_devices, brand, devices, devices, args.format)
+            brand_done(brand)
+
+        failed = sum(counts.get(FAILED, 0) for counts in frontier.counts().values())
+        if failed:
+            # Kept so the next run only fetches the pages that failed
+            print(f"{failed} listing pages failed, run the script again to retry them.")
+        else:
+            # The run is complete, the next one starts from scratch
+            frontier.clear()
+
+    brand_devices.close()
+    frontier.close()
+
+    print("-------------------------------------------------------------")
+    print("Devices of all phone brands extracted successfully.")
+    print("-------------------------------------------------------------")
 
-with open(
-    join(current_dir, "data", "brand_devices.json"), "w", encoding="utf-8"
-) as file:
-    json.dump(brand_devices, file, indent=4)
 
-print("-------------------------------------------------------------")
-print("Devices of all phone brands extracted successfully.")
-print("-------------------------------------------------------------")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""Crawls gsmarena with any number of workers, on one machine or many.
+
+A coordinator splits the crawl into shards and publishes them to a shared
+queue, see utils.shards, then workers lease the shards one at a time:
+
+    python crawl_cluster.py coordinate --shards 32
+    python crawl_cluster.py work        # as many times, on as many machines, as needed
+    python crawl_cluster.py status
+    python crawl_cluster.py merge       # once every shard is done
+
+The brands are split into the shards of the "listings" job by a hash of
+their id, and their listing pages are stored in
+<output>/listings/shard-NNNN.jsonl. Once every listing shard is done, the
+devices are split into the shards of the "specs" job by a hash of their id,
+and their specs are stored in <output>/specs/shard-NNNN.jsonl. A device
+listed by several brands is fetched once, under the first brand listing it.
+
+A worker renews its lease while it works on a shard, so the shard of a
+worker that stops is leased again by another one once the lease expires,
+until it was leased --max-attempts times, it's then failed. The shard files
+are replaced atomically, so a shard done twice is written twice with the
+same records.
+
+The merge writes the same files as phone_brands.py, brand_devices.py and
+device_specs.py. By default the queue is a SQLite file, for workers sharing
+a disk. Pass --queue redis://host:6379/0 to share it between machines, the
+output directory then has to be on storage they all mount.
+"""
+
+import argparse
+from collections.abc import Iterator
+import json
+from inspect import getsourcefile
+import os
+from os.path import abspath, dirname, join
+import shutil
+import socket
+import time
+from typing import Dict, List, Sequence
+
+from utils.classes import Brand, Device, DeviceSpecs
+from utils.device_index import device_id
+from utils.jsonl import JsonLinesWriter, read_jsonl
+from utils.shards import (
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_TTL,
+    DONE,
+    FAILED,
+    LEASED,
+    PENDING,
+    Lease,
+    keep_alive,
+    open_queue,
+    shard_of,
+)
+from utils.writers import WRITERS
+
+LISTINGS = "listings"
+SPECS = "specs"
+
+# Get the directory path of this file
+current_dir = dirname(abspath(getsourcefile(lambda: 0)))
+data_dir = join(current_dir, "data")
+
+
+def shard_path(output: str, job: str, shard: int) -> str:
+    """
+    :return: The path of the records of a shard
+    """
+    return join(output, job, f"shard-{shard:04d}.jsonl")
+
+
+def read_job(output: str) -> Dict:
+    """
+    :return: The number of shards and the brands published by the coordinator
+    """
+    with open(join(output, "job.json"), encoding="utf-8") as file:
+        job = json.load(file)
+    job["brands"] = [Brand(**brand) for brand in job["brands"]]
+    return job
+
+
+def read_listings(output: str, shards: int) -> Dict[str, List[Device]]:
+    """
+    Reads the listing shards done so far
+
+    :return: The devices of every brand, in the order they are listed
+    """
+    devices: Dict[str, List[Device]] = {}
+    for shard in range(shards):
+        path = shard_path(output, LISTINGS, shard)
+        if not os.path.exists(path):
+            continue
+        for record in read_jsonl(path):
+            if record["type"] == "brand":
+                brand_devices = devices[record["id"]] = []
+            else:
+                brand_devices.append(
+                    Device(*(record[name] for name in Device.field_names()))
+                )
+    return devices
+
+
+def _replace(path: str, records: Iterator[Dict]) -> int:
+    """Writes the records of a shard, replacing its file atomically"""
+    os.makedirs(dirname(path), exist_ok=True)
+    with JsonLinesWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.records_written
+
+
+def work_listings(output: str, lease: Lease, job: Dict) -> int:
+    """
+    Fetches the listing pages of the brands of a shard
+
+    :return: The number of devices listed
+    """
+    # Imported here, so the other commands don't need requests and bs4
+    from utils.scraper import get_brand_devices  # pylint: disable=import-outside-toplevel
+
+    def records():
+        for brand in job["brands"]:
+            if shard_of(brand.id, job["shards"]) != lease.shard:
+                continue
+            print(f"Extracting devices of {brand.name}...")
+            yield {"type": "brand", **brand.to_dict()}
+            for device in get_brand_devices(brand.gsmarena_link):
+                yield {
+                    "type": "device",
+                    "brand_id": brand.id,
+                    "device_id": device_id(device.gsmarena_link),
+                    **device.to_dict(),
+                }
+
+    # Every record but the brand records is a device
+    brands = sum(
+        shard_of(brand.id, job["shards"]) == lease.shard for brand in job["brands"]
+    )
+    return _replace(shard_path(output, LISTINGS, lease.shard), records()) - brands
+
+
+def work_specs(output: str, lease: Lease, job: Dict, concurrency: int) -> int:
+    """
+    Fetches the device pages of a shard
+
+    :return: The number of devices whose specs were extracted
+    """
+    # pylint: disable=import-outside-toplevel
+    from utils.pipeline import ParsePipeline
+    from utils.resilience import Quarantine
+
+    listings = read_listings(output, job["shards"])
+    links = []
+    seen = set()
+    for brand in job["brands"]:
+        for device in listings.get(brand.id, []):
+            key = device_id(device.gsmarena_link)
+            if key in seen:
+                continue
+            seen.add(key)
+            if shard_of(key, job["shards"]) == lease.shard:
+                links.append((brand.id, device.gsmarena_link))
+
+    quarantine = Quarantine(join(output, SPECS, "_quarantine"))
+    pipeline = ParsePipeline(SPECS, fetch_workers=concurrency, quarantine=quarantine)
+    records = (
+        {"brand_id": brand_id, "gsmarena_link": link, "specs": specs.to_dict()}
+        for brand_id, link, specs in pipeline.run(links)
+    )
+    return _replace(shard_path(output, SPECS, lease.shard), records)
+
+
+def coordinate(args: argparse.Namespace) -> None:
+    """Publishes the shards of the listings and specs jobs"""
+    from utils.scraper import get_brands  # pylint: disable=import-outside-toplevel
+
+    queue = open_queue(args.queue)
+    if args.restart:
+        queue.clear()
+        shutil.rmtree(args.output, ignore_errors=True)
+
+    job_path = join(args.output, "job.json")
+    if os.path.exists(job_path):
+        print(f"Resuming the crawl of {job_path}, pass --restart to start over.")
+    else:
+        print("Extracting phone brands from GSM Arena...")
+        brands = get_brands()
+        os.makedirs(args.output, exist_ok=True)
+        with open(f"{job_path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "shards": args.shards,
+                    "brands": [brand.to_dict() for brand in brands],
+                },
+                file,
+            )
+        os.replace(f"{job_path}.tmp", job_path)
+
+    shards = read_job(args.output)["shards"]
+    queue.publish(LISTINGS, shards)
+    queue.publish(SPECS, shards)
+    queue.close()
+    print(f"{shards} shards published, start the workers with: crawl_cluster.py work")
+
+
+def work(args: argparse.Namespace) -> None:
+    """Leases shards and works on them until every shard is done"""
+    queue = open_queue(args.queue)
+    job = read_job(args.output)
+    worker = args.name or f"{socket.gethostname()}-{os.getpid()}"
+
+    while True:
+        lease = queue.lease(LISTINGS, worker, args.ttl, args.max_attempts)
+        if lease is None:
+            counts = queue.counts(LISTINGS)
+            if counts.get(PENDING) or counts.get(LEASED):
+                # The devices of the specs shards aren't all known yet
+                time.sleep(args.poll)
+                continue
+            lease = queue.lease(SPECS, worker, args.ttl, args.max_attempts)
+        if lease is None:
+            counts = queue.counts(SPECS)
+            if counts.get(PENDING) or counts.get(LEASED):
+                # Leased by a worker that may stop before it's done
+                time.sleep(args.poll)
+                continue
+            break
+
+        print("-------------------------------------------------------------")
+        print(f"{worker} is working on {lease.job} shard {lease.shard}...")
+        try:
+            with keep_alive(queue, lease, args.ttl) as lost:
+                if lease.job == LISTINGS:
+                    count = work_listings(args.output, lease, job)
+                else:
+                    count = work_specs(args.output, lease, job, args.concurrency)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"{lease.job} shard {lease.shard} failed: {error!r}")
+            queue.fail(lease, repr(error), args.max_attempts)
+            continue
+
+        if lost.is_set() or not queue.complete(lease):
+            print(f"{lease.job} shard {lease.shard} was leased by another worker.")
+        else:
+            print(f"{lease.job} shard {lease.shard} done, {count} devices.")
+
+    queue.close()
+    print(f"{worker} is done, every shard is done or failed.")
+
+
+def status(args: argparse.Namespace) -> None:
+    """Prints the number of shards of each job in each state"""
+    queue = open_queue(args.queue)
+    for job in (LISTINGS, SPECS):
+        counts = queue.counts(job)
+        print(
+            f"{job}: "
+            + ", ".join(
+                f"{counts.get(state, 0)} {state}"
+                for state in (PENDING, LEASED, DONE, FAILED)
+            )
+        )
+    queue.close()
+
+
+def merge(args: argparse.Namespace) -> None:
+    """Merges the shards into the files written by the scripts of a single machine"""
+    # pylint: disable=import-outside-toplevel
+    from brand_devices import write_brand
+    from utils.columnar import SpecsDatasetWriter
+    from utils.device_index import DeviceIndex
+    from utils.refresh import SpecHashes, write_brands
+
+    queue = open_queue(args.queue)
+    unfinished = {job: queue.counts(job) for job in (LISTINGS, SPECS)}
+    queue.close()
+    for job, counts in unfinished.items():
+        if counts.get(PENDING) or counts.get(LEASED):
+            raise SystemExit(
+                f"The {job} shards aren't all done, see crawl_cluster.py status"
+            )
+        if counts.get(FAILED):
+            print(f"{counts[FAILED]} {job} shards failed, their devices are left out.")
+
+    job = read_job(args.output)
+    listings = read_listings(args.output, job["shards"])
+
+    print("Merging the devices of every brand...")
+    write_brands(join(data_dir, "phone_brands.csv"), job["brands"])
+    dataset_dir = join(data_dir, "device_specs")
+    index = DeviceIndex(join(dataset_dir, "_device_index.sqlite"))
+    index.clear()
+    with JsonLinesWriter(join(data_dir, "brand_devices.jsonl")) as brand_devices:
+        for brand in job["brands"]:
+            if brand.id not in listings:
+                continue
+            devices = listings[brand.id]
+            write_brand(brand_devices, brand, devices, devices, args.format)
+            for device in devices:
+                index.add(device.gsmarena_link, brand.id)
+    index.close()
+
+    print("Merging the specs of every device...")
+    hashes = SpecHashes(join(dataset_dir, "_spec_hashes.sqlite"))
+    hashes.clear()
+    with SpecsDatasetWriter(dataset_dir, part="part-0", replace=True) as writer:
+        for shard in range(job["shards"]):
+            path = shard_path(args.output, SPECS, shard)
+            if not os.path.exists(path):
+                continue
+            for record in read_jsonl(path):
+                link = record["gsmarena_link"]
+                specs = DeviceSpecs(**record["specs"])
+                hashes.update(device_id(link), record["brand_id"], link, specs)
+                writer.write(record["brand_id"], link, specs)
+    hashes.close()
+
+    print(
+        f"{len(listings)} brands and the specs of {writer.rows_written}"
+        " devices merged successfully."
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: The parser of the command line arguments of the script
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--queue",
+        default=join(current_dir, ".cache", "cluster_queue.sqlite"),
+        help="the path of the SQLite queue or the redis:// URL of a Redis queue",
+    )
+    parser.add_argument(
+        "--output",
+        default=join(current_dir, ".cache", "cluster"),
+        help="the directory of the shards, shared by every worker",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinate_parser = commands.add_parser(
+        "coordinate", help="publish the shards of a crawl"
+    )
+    coordinate_parser.add_argument(
+        "--shards",
+        type=int,
+        default=64,
+        help="the number of shards of each job, more shards spread the work more evenly",
+    )
+    coordinate_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="discard the queue and the shards of a previous crawl",
+    )
+    coordinate_parser.set_defaults(run=coordinate)
+
+    work_parser = commands.add_parser("work", help="work on shards until all are done")
+    work_parser.add_argument("--name", help="the name of the worker in the queue")
+    work_parser.add_argument(
+        "--ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help="the seconds after which the shard of a worker that stopped is leased again",
+    )
+    work_parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help="the number of attempts after which a shard is failed",
+    )
+    work_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="the number of device pages fetched at once",
+    )
+    work_parser.add_argument(
+        "--poll",
+        type=float,
+        default=5,
+        help="the seconds to wait between two looks for a shard to lease",
+    )
+    work_parser.set_defaults(run=work)
+
+    commands.add_parser("status", help="show the progress of the crawl").set_defaults(
+        run=status
+    )
+    merge_parser = commands.add_parser(
+        "merge", help="merge the shards into the data directory"
+    )
+    merge_parser.add_argument(
+        "--format",
+        choices=list(WRITERS),
+        default="csv",
+        help="the format of the file of each brand's devices in data/brands",
+    )
+    merge_parser.set_defaults(run=merge)
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    Runs the script
+
+    :param argv: The command line arguments, those of the process if not given
+    """
+    args = build_parser().parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
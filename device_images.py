@@ -0,0 +1,86 @@
+"""Downloads the image of every device into a local content-addressed store.
+
+The image links are read from the CSV files written by brand_devices.py and
+the images are stored in data/images, see utils.images. An image shared by
+several devices is downloaded and stored once, and a re-run only sends
+conditional requests, skipping the images that didn't change.
+
+Pass --thumbnails 160,320 to also make thumbnails of those widths in
+data/images/thumbnails/<width>, needs the optional Pillow package.
+
+Look up the local copy of an image with ImageStore.local_path(img_link).
+"""
+
+import argparse
+from collections.abc import Iterator
+from inspect import getsourcefile
+from os.path import abspath, dirname, join
+from typing import Sequence
+
+from utils.images import DEFAULT_WORKERS, ImagePipeline, ImageStore
+from utils.metrics import get_metrics
+from utils.refresh import brand_devices_path, read_brands, read_devices
+
+# Get the directory path of this file
+current_dir = dirname(abspath(getsourcefile(lambda: 0)))
+data_dir = join(current_dir, "data")
+
+
+def image_links(data_dir: str) -> Iterator[str]:
+    """Yields the image link of every device, brand by brand"""
+    for brand in read_brands(join(data_dir, "phone_brands.csv")).values():
+        for device in read_devices(brand_devices_path(data_dir, brand)):
+            yield device.img_link
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: The parser of the command line arguments of the script
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--thumbnails",
+        metavar="WIDTHS",
+        default="",
+        help="comma separated widths of the thumbnails to make, e.g. 160,320",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="save the metrics at the end, as Prometheus text if PATH ends with .prom",
+    )
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    Runs the script
+
+    :param argv: The command line arguments, those of the process if not given
+    """
+    args = build_parser().parse_args(argv)
+
+    widths = [int(width) for width in args.thumbnails.split(",") if width]
+    store = ImageStore(join(data_dir, "images"))
+    pipeline = ImagePipeline(store, workers=args.workers, thumbnail_widths=widths)
+
+    counts = {"new": 0, "unchanged": 0, "failed": 0}
+    metrics = get_metrics()
+    for result in pipeline.run(image_links(data_dir)):
+        counts[result.status] += 1
+        metrics.increment("images_total", label=result.status)
+        if result.status == "failed":
+            print(f"Failed to download {result.url}: {result.error}")
+
+    store.close()
+    if args.metrics:
+        metrics.write(args.metrics)
+    print(
+        f"{counts['new']} new images, {counts['unchanged']} unchanged,"
+        f" {counts['failed']} failed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""Stores the specs of every device listed on gsmarena in a Parquet dataset.
+
+The dataset is written to data/device_specs, partitioned by brand. Device
+pages are fetched on threads and extracted on a process pool, see
+utils.pipeline. Needs the optional pyarrow package.
+
+A device listed under several brands is only fetched once, under the first
+one. Every brand listing it is recorded in data/device_specs/_device_index.sqlite.
+
+Pass --refresh, after running brand_devices.py --refresh, to only fetch the
+devices that aren't in the dataset yet, and --recheck N to also fetch the N
+devices checked the longest time ago. A hash of the specs of every device is
+kept in data/device_specs/_spec_hashes.sqlite, so only the devices that are
+new or were edited are written, to a part file of their own. Read the
+dataset back with utils.columnar.read_latest_specs.
+
+Every page fetched is also kept in the archive in data/archive, see
+utils.archive. Pass --replay, after changing the extractors, to rebuild the
+dataset from the archived pages on every core without sending a request.
+
+Pass --all-specs to also keep every row of the specs list, including the ones
+DeviceSpecs has no field for (sound, tests, charging...), from the same parse
+of the page. The specs of every device are written to
+data/device_specs_all.jsonl, a JSON object of the columns it has, and the
+columns seen so far to data/spec_schema.json, see utils.spec_schema.
+
+Every device page of a full crawl is checkpointed in a crawl frontier, see
+utils.frontier, so if the script is stopped running it again only fetches
+the pages it hadn't done. Pass --restart to start over.
+
+Devices whose page can't be fetched or extracted are skipped and kept with
+their HTML and error in data/device_specs/_quarantine. They aren't in the
+dataset, so the next --refresh tries them again.
+
+Pass --metrics to save the timings of the fetch, extract and write stages.
+"""
+
+import argparse
+from collections.abc import Iterator
+import contextlib
+import glob
+import itertools
+from inspect import getsourcefile
+import os
+from os.path import abspath, dirname, join
+import time
+from typing import Any, List, Sequence, Tuple
+
+from utils.archive import PageArchive, replay
+from utils.classes import Brand, DeviceSpecTable, DeviceSpecs
+from utils.columnar import SpecsDatasetWriter
+from utils.device_index import DeviceIndex, device_id
+from utils.frontier import DONE, Frontier
+from utils.jsonl import JsonLinesWriter
+from utils.fetcher import DEFAULT_ARCHIVE_DIR
+from utils.metrics import Progress, get_metrics
+from utils.pipeline import DEFAULT_FETCH_WORKERS, ParsePipeline
+from utils.refresh import SpecHashes, brand_devices_path, read_brands, read_devices
+from utils.resilience import Quarantine
+from utils.spec_schema import SpecSchema
+from utils.scraper import get_brand_devices_generator, get_brands_generator
+from utils.writers import read_records, temp_path
+
+# Get the directory path of this file
+current_dir = dirname(abspath(getsourcefile(lambda: 0)))
+data_dir = join(current_dir, "data")
+
+
+def device_links(
+    brands: List[Brand], index: DeviceIndex, progress: Progress | None = None
+) -> Iterator[Tuple[str, str]]:
+    """
+    Yields the brand id and the link of every device not seen yet, brand by brand
+
+    :param progress: Counts the devices skipped, already listed by another
+        brand, as done, the brands' numbers of devices including them
+    """
+    for brand in brands:
+        print(f"Queueing devices of {brand.name}...")
+        with index.batch():
+            for device in get_brand_devices_generator(brand.gsmarena_link):
+                if index.add(device.gsmarena_link, brand.id):
+                    yield brand.id, device.gsmarena_link
+                elif progress is not None:
+                    progress.update()
+
+
+def pending_links(
+    links: Iterator[Tuple[str, str]], frontier: Frontier
+) -> Iterator[Tuple[str, str]]:
+    """
+    Checkpoints the device links of a full crawl in the frontier
+
+    :return: A generator of the links not done by a previous crawl
+    """
+    for position, (brand_id, link) in enumerate(links):
+        frontier.add(link, "device", brand_id, position)
+        if frontier.state(link) != DONE:
+            yield brand_id, link
+
+
+def checkpointed(
+    results: Iterator[Tuple[str, str, Any]], frontier: Frontier
+) -> Iterator[Tuple[str, str, Any]]:
+    """
+    Stores the result of every device page in the frontier once it's extracted
+
+    :return: A generator of the results, passed through
+    """
+    for brand_id, link, result in results:
+        specs, table = result if isinstance(result, tuple) else (result, None)
+        frontier.complete(
+            link,
+            {
+                "brand_id": brand_id,
+                "link": link,
+                "specs": specs.to_dict(),
+                "table": table.to_dict() if table is not None else None,
+            },
+        )
+        yield brand_id, link, result
+
+
+def stored_results(
+    frontier: Frontier, all_specs: bool
+) -> Iterator[Tuple[str, str, Any]]:
+    """
+    Reads back the device pages done by a crawl that stopped
+
+    :return: A generator of the brand id, the link and the result of every
+        device page in the frontier, as the pipeline yields them
+    """
+    for stored in frontier.results("device"):
+        specs = DeviceSpecs(**stored["specs"])
+        if all_specs:
+            table = stored["table"]
+            if table is None:
+                # Done by a crawl without --all-specs, so fetched again
+                frontier.fail(stored["link"], "done without the specs table")
+                continue
+            result = specs, DeviceSpecTable(**table)
+        else:
+            result = specs
+        yield stored["brand_id"], stored["link"], result
+
+
+def new_device_links(
+    data_dir: str, index: DeviceIndex, hashes: SpecHashes, recheck: int
+) -> List[Tuple[str, str]]:
+    """
+    Gets the devices to fetch in a refresh, from the CSV files of brand_devices.py
+
+    :return: The brand id and the link of the devices without stored specs,
+        followed by the ``recheck`` devices checked the longest time ago
+    """
+    known = hashes.known_ids()
+    links = []
+    with index.batch():
+        for brand in read_brands(join(data_dir, "phone_brands.csv")).values():
+            for device in read_devices(brand_devices_path(data_dir, brand)):
+                index.add(device.gsmarena_link, brand.id)
+                key = device_id(device.gsmarena_link)
+                if key is not None and key not in known:
+                    known.add(key)
+                    links.append((brand.id, device.gsmarena_link))
+    return links + hashes.stalest(recheck)
+
+
+def new_file(path: str) -> str:
+    """
+    :param path: The path of a file rebuilt by a full crawl
+
+    :return: The path of an empty temporary file next to it, moved over it
+        once the crawl is done
+    """
+    # Along with the files left by crawls that stopped, and their journals
+    directory, name = os.path.split(path)
+    pattern = join(glob.escape(directory), f".{glob.escape(name)}.*.tmp*")
+    for leftover in glob.glob(pattern):
+        os.remove(leftover)
+    return temp_path(path)
+
+
+def replayed_specs(
+    archive_dir: str, index: DeviceIndex, quarantine: Quarantine, kind: str = "specs"
+) -> Iterator[Tuple[str, str, DeviceSpecs]]:
+    """
+    Extracts the specs of every device page in the archive
+
+    :return: A generator that yields the brand id, the link and the specs of
+        every device, under the first brand the device was listed by
+    """
+    for link, specs in replay(archive_dir, kind, quarantine=quarantine):
+        brands = index.brands(device_id(link))
+        yield brands[0] if brands else "unknown", link, specs
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: The parser of the command line arguments of the script
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="discard the device pages done by a full crawl that stopped",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="only fetch the devices that aren't in the dataset yet",
+    )
+    parser.add_argument(
+        "--recheck",
+        type=int,
+        default=0,
+        metavar="N",
+        help="with --refresh, also fetch the N stalest devices to look for edits",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="save the metrics of the run, as Prometheus text if PATH ends with .prom",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_FETCH_WORKERS,
+        help="the number of device pages fetched at once",
+    )
+    parser.add_argument(
+        "--all-specs",
+        action="store_true",
+        help="also store every row of the specs list in data/device_specs_all.jsonl",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="rebuild the dataset from the archived pages instead of fetching them",
+    )
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    Runs the script
+
+    :param argv: The command line arguments, those of the process if not given
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.replay and (args.refresh or not DEFAULT_ARCHIVE_DIR):
+        parser.error("--replay needs the archive and can't be combined with --refresh")
+
+    print("-------------------------------------------------------------")
+    print("Started extracting device specs from GSM Arena...")
+    print("-------------------------------------------------------------")
+
+    metrics = get_metrics()
+    dataset_dir = join(data_dir, "device_specs")
+    # Files starting with an underscore are skipped when reading the dataset
+    index_path = join(dataset_dir, "_device_index.sqlite")
+    hashes_path = join(dataset_dir, "_spec_hashes.sqlite")
+    # A full crawl starts from empty files, moved over the previous ones once
+    # the dataset is written, so a crawl that stops leaves them as they were,
+    # along with the dataset. A replay keeps the brands of the last crawl
+    full = not args.refresh
+    index = DeviceIndex(
+        new_file(index_path) if full and not args.replay else index_path
+    )
+    hashes = SpecHashes(new_file(hashes_path) if full else hashes_path)
+    quarantine = Quarantine(join(dataset_dir, "_quarantine"))
+    frontier = Frontier(join(current_dir, ".cache", "device_specs_frontier.sqlite"))
+    if args.restart:
+        frontier.clear()
+
+    kind = "specs_and_table" if args.all_specs else "specs"
+    pipeline = ParsePipeline(
+        kind, fetch_workers=args.concurrency, quarantine=quarantine
+    )
+    if args.refresh:
+        links = new_device_links(data_dir, index, hashes, args.recheck)
+        results = pipeline.run(links)
+        progress = Progress(len(links), "devices")
+        part = time.strftime("part-%Y%m%d%H%M%S")
+    else:
+        # A full crawl replaces the parts of previous runs and refreshes once done
+        part = "part-0"
+
+        if args.replay:
+            # The brands of the devices are the ones recorded by the last crawl
+            with PageArchive(DEFAULT_ARCHIVE_DIR) as archive:
+                progress = Progress(len(archive.entries("device")), "devices")
+            results = replayed_specs(DEFAULT_ARCHIVE_DIR, index, quarantine, kind)
+        else:
+            # Device pages done by a crawl that stopped are read back instead
+            # of fetched, the listings are fetched again to rebuild the index
+            brands = list(get_brands_generator())
+            progress = Progress(
+                sum(brand.number_of_devices for brand in brands), "devices"
+            )
+            links = pending_links(device_links(brands, index, progress), frontier)
+            results = itertools.chain(
+                stored_results(frontier, args.all_specs),
+                checkpointed(pipeline.run(links), frontier),
+            )
+
+    all_specs_path = join(data_dir, "device_specs_all.jsonl")
+    with hashes.batch(), SpecsDatasetWriter(
+        dataset_dir, part=part, replace=not args.refresh
+    ) as writer, (
+        JsonLinesWriter(all_specs_path, append=args.refresh)
+        if args.all_specs
+        else contextlib.nullcontext()
+    ) as all_specs:
+        for brand_id, link, result in results:
+            specs, table = result if args.all_specs else (result, None)
+            key = device_id(link)
+            if key is None:
+                # Not the link of a device page, e.g. an archived page
+                print(f"Skipping {link}, it isn't a device page")
+                progress.update()
+                continue
+            # Unchanged devices that were checked again aren't written twice
+            if hashes.update(key, brand_id, link, specs):
+                with metrics.timer("write"):
+                    writer.write(brand_id, link, specs)
+                    if table is not None:
+                        all_specs.write(
+                            {
+                                "device_id": key,
+                                "brand_id": brand_id,
+                                "gsmarena_link": link,
+                                **table.to_dict(),
+                            }
+                        )
+            if link in quarantine:
+                quarantine.remove(link)
+            progress.update()
+
+    index.close()
+    hashes.close()
+    for store, path in ((index, index_path), (hashes, hashes_path)):
+        if store.path != path:
+            os.replace(store.path, path)
+    if full and not args.replay:
+        # The crawl is complete, the next one starts from scratch
+        frontier.clear()
+    frontier.close()
+    if args.all_specs:
+        # Counted from the file, where a device refreshed has its latest specs
+        # after its previous ones, the columns kept in the order of past runs
+        schema_path = join(data_dir, "spec_schema.json")
+        schema = SpecSchema.load(schema_path)
+        schema.recount(read_records(all_specs_path))
+        schema.save(schema_path)
+        print(f"{len(schema)} distinct specs, see {schema_path}")
+
+    if args.metrics:
+        metrics.write(args.metrics)
+
+    print("-------------------------------------------------------------")
+    print(f"Specs of {writer.rows_written} devices extracted successfully.")
+    if len(quarantine):
+        print(f"{len(quarantine)} devices failed, see {quarantine.directory}")
+    print("-------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""One command line for every script of the project.
+
+    python gsmarena.py brands                  # data/phone_brands.csv
+    python gsmarena.py devices [--restart]     # data/brands/*.csv, data/brand_devices.jsonl
+    python gsmarena.py specs [--replay]        # data/device_specs
+    python gsmarena.py images                  # data/images
+    python gsmarena.py refresh [--recheck N]   # devices --refresh, then specs --refresh
+    python gsmarena.py query "ram_gb>=8"       # data/query_index
+    python gsmarena.py cluster work            # a worker of a sharded crawl
+    python gsmarena.py bench crawl             # benchmarks/bench_crawl.py
+
+The options after the command are those of its script, e.g.
+``python gsmarena.py devices --help``. The options before it apply to every
+command that sends requests:
+
+    python gsmarena.py --rate 2 --base-url http://localhost:8000 specs --concurrency 4
+
+Nothing is imported until the command is known, so the commands that only
+read local data start without loading requests, bs4 or lxml.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+from typing import Dict, List, Sequence, Tuple
+
+# Command -> (module, help)
+COMMANDS: Dict[str, Tuple[str, str]] = {
+    "brands": ("phone_brands", "extract the phone brands"),
+    "devices": ("brand_devices", "extract the devices of every brand"),
+    "specs": ("device_specs", "extract the specs of every device"),
+    "images": ("device_images", "download the image of every device"),
+    "refresh": ("", "fetch what changed since the last run"),
+    "query": ("query_devices", "query the scraped devices"),
+    "cluster": ("crawl_cluster", "crawl with workers on several machines"),
+    "bench": ("", "run a benchmark"),
+}
+
+BENCHMARKS: Dict[str, str] = {
+    "extractor": "benchmarks.bench_extractor",
+    "records": "benchmarks.bench_records",
+    "crawl": "benchmarks.bench_crawl",
+    "mock-server": "benchmarks.mock_server",
+    "record-fixtures": "benchmarks.record_fixtures",
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: The parser of the options shared by every command
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        epilog="run '%(prog)s COMMAND --help' for the options of a command",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="the maximum number of requests per second",
+    )
+    parser.add_argument(
+        "--base-url",
+        help="crawl a mirror or a local stand-in of gsmarena",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="the directory of the HTTP cache, an empty string turns it off",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        help="the directory of the page archive, an empty string turns it off",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+    for command, (_, help_text) in COMMANDS.items():
+        # The options of the command are parsed by its script
+        commands.add_parser(command, help=help_text, add_help=False)
+    return parser
+
+
+def refresh(argv: Sequence[str]) -> None:
+    """
+    Fetches the brands and devices added since the last run, then their specs
+
+    :param argv: The options of the refresh
+    """
+    parser = argparse.ArgumentParser(
+        description=refresh.__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument(
+        "--recheck",
+        default="0",
+        metavar="N",
+        help="also fetch the specs of the N devices checked the longest time ago",
+    )
+    parser.add_argument("--concurrency", help="the number of pages fetched at once")
+    parser.add_argument("--metrics", metavar="PATH", help="save the metrics of the specs")
+    args = parser.parse_args(argv)
+
+    concurrency = ["--concurrency", args.concurrency] if args.concurrency else []
+    metrics = ["--metrics", args.metrics] if args.metrics else []
+    importlib.import_module("brand_devices").main(["--refresh", *concurrency])
+    importlib.import_module("device_specs").main(
+        ["--refresh", "--recheck", args.recheck, *concurrency, *metrics]
+    )
+
+
+def bench(argv: Sequence[str]) -> None:
+    """
+    Runs one of the benchmarks
+
+    :param argv: The name of the benchmark followed by its options
+    """
+    parser = argparse.ArgumentParser(
+        description=bench.__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    args, rest = parser.parse_known_args(argv)
+    importlib.import_module(BENCHMARKS[args.benchmark]).main(rest)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    Runs a command
+
+    :param argv: The command line arguments, those of the process if not given
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    parser = build_parser()
+    # Everything after the command belongs to it, even options named like ours
+    index = next((i for i, arg in enumerate(argv) if arg in COMMANDS), len(argv))
+    args = parser.parse_args(argv[: index + 1])
+    rest: List[str] = argv[index + 1 :]
+
+    # Read by utils.helper and utils.fetcher when the command imports them
+    settings = {
+        "GSMARENA_RATE": args.rate,
+        "GSMARENA_BASE_URL": args.base_url,
+        "GSMARENA_CACHE_DIR": args.cache_dir,
+        "GSMARENA_ARCHIVE_DIR": args.archive_dir,
+    }
+    for name, value in settings.items():
+        if value is not None:
+            os.environ[name] = str(value)
+
+    # So the usage printed by the scripts reads "gsmarena.py specs ..."
+    sys.argv[0] = f"{os.path.basename(sys.argv[0])} {args.command}"
+
+    if args.command == "refresh":
+        refresh(rest)
+    elif args.command == "bench":
+        bench(rest)
+    else:
+        module = importlib.import_module(COMMANDS[args.command][0])
+        module.main(rest)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
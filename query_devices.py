@@ -0,0 +1,101 @@
+"""Queries the scraped catalog through persistent indexes.
+
+Build the indexes once, from the Parquet dataset of device_specs.py when it
+exists and from data/devices_with_details.csv otherwise (needs pyarrow):
+
+    python query_devices.py --build
+
+Then query them, every condition has to match:
+
+    python query_devices.py "ram_gb>=8" "battery_mah>5000" "release_date>2022-12-31"
+    python query_devices.py "chipset:snapdragon 8" "title:galaxy s"
+"""
+
+import argparse
+from inspect import getsourcefile
+import json
+import os
+from os.path import abspath, dirname, join
+import time
+from typing import Sequence
+
+from utils.query import (
+    NUMERIC_FIELDS,
+    TOKEN_FIELDS,
+    QueryIndex,
+    build_index,
+    load_details_records,
+    load_specs_records,
+    parse_condition,
+)
+
+# Get the directory path of this file
+current_dir = dirname(abspath(getsourcefile(lambda: 0)))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: The parser of the command line arguments of the script
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        epilog=f"numeric fields: {', '.join(NUMERIC_FIELDS)};"
+        f" text fields: title, {', '.join(TOKEN_FIELDS)}",
+    )
+    parser.add_argument("conditions", nargs="*", help='e.g. "ram_gb>=8"')
+    parser.add_argument("--build", action="store_true", help="rebuild the indexes")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    Runs the script
+
+    :param argv: The command line arguments, those of the process if not given
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    index_dir = join(current_dir, "data", "query_index")
+
+    if args.build:
+        dataset_dir = join(current_dir, "data", "device_specs")
+        if os.path.isdir(dataset_dir) and any(
+            name.startswith("brand_id=") for name in os.listdir(dataset_dir)
+        ):
+            records = load_specs_records(dataset_dir)
+        else:
+            records = load_details_records(
+                join(current_dir, "data", "devices_with_details.csv")
+            )
+        print(f"Indexed {build_index(records, index_dir)} devices in {index_dir}")
+
+    if args.conditions or not args.build:
+        try:
+            conditions = [parse_condition(condition) for condition in args.conditions]
+        except ValueError as error:
+            parser.error(str(error))
+
+        start = time.perf_counter()
+        try:
+            with QueryIndex(index_dir) as index:
+                results = index.search(conditions, limit=args.limit)
+        except FileNotFoundError:
+            parser.error(f"No index in {index_dir}, run with --build first")
+        except ValueError as error:
+            # Built by another version
+            parser.error(str(error))
+        elapsed = time.perf_counter() - start
+
+        for record in results:
+            if args.json:
+                print(json.dumps(record, ensure_ascii=False))
+            else:
+                print(record["model_name"], record.get("gsmarena_link") or "")
+        print(f"{len(results)} devices in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""An append-only archive of the raw HTML of every page fetched, and its replay
+
+Pages are appended to ``pages.gz`` as they are fetched, each page in a gzip
+member of its own, so the file is a valid multi-member gzip file and a page
+can be decompressed on its own given where its member starts. Those offsets
+are kept in ``index.sqlite`` along with the link, the encoding and the time
+the page was fetched, like the CDX index of a WARC file. A page fetched again
+without any change isn't appended twice.
+
+Replaying the archive runs the extractors on the archived pages on a
+process pool, without sending any request. Every worker memory-maps the
+archive and decompresses each member straight from the mapping into the
+buffer handed to the parser, so a page is never copied on its way there::
+
+    for link, specs in replay(archive_dir, "specs"):
+        ...
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from collections.abc import Iterator
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Tuple
+import zlib
+
+from utils.cache import url_class
+from utils.metrics import get_metrics
+from utils.resilience import Quarantine
+
+ARCHIVE_FILE = "pages.gz"
+INDEX_FILE = "index.sqlite"
+
+DEFAULT_CHUNK_SIZE = 64
+
+# zlib writes and reads gzip members with this window size
+_GZIP_WBITS = 31
+
+
+class PageArchive:
+    """
+    Appends pages to the archive and looks them up through its offset index
+
+    It's thread safe, the fetcher threads of a crawl append to the same archive.
+    """
+
+    def __init__(self, directory: str, compression_level: int = 6):
+        """
+        :param directory: The directory of the archive, created if it doesn't exist
+
+        :param compression_level: The gzip compression level, from 1 (fastest) to 9
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, ARCHIVE_FILE)
+        self.compression_level = compression_level
+
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+        self._connection = sqlite3.connect(
+            os.path.join(directory, INDEX_FILE), check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                sha1 TEXT NOT NULL,
+                encoding TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pages_url ON pages (url, id);
+            """
+        )
+        self._connection.commit()
+
+    def __enter__(self) -> "PageArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def append(self, url: str, body: bytes, encoding: str | None = None) -> bool:
+        """
+        Appends a page to the archive, unless its latest copy is the same
+
+        :param url: The link to the page
+
+        :param body: The body of the page as it was received
+
+        :param encoding: The encoding of the body
+
+        :return: True if the page was appended
+        """
+        sha1 = hashlib.sha1(body).hexdigest()
+        compressor = zlib.compressobj(self.compression_level, wbits=_GZIP_WBITS)
+        member = compressor.compress(body) + compressor.flush()
+
+        with self._lock:
+            latest = self._connection.execute(
+                "SELECT sha1 FROM pages WHERE url = ? ORDER BY id DESC LIMIT 1",
+                (url,),
+            ).fetchone()
+            if latest is not None and latest[0] == sha1:
+                return False
+
+            offset = self._file.tell()
+            self._file.write(member)
+            # The page is on disk before the index points to it
+            self._file.flush()
+            self._connection.execute(
+                "INSERT INTO pages"
+                " (url, offset, length, size, sha1, encoding, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, offset, len(member), len(body), sha1, encoding, time.time()),
+            )
+            self._connection.commit()
+        get_metrics().increment("archived_pages_total")
+        return True
+
+    def entries(self, kind: str | None = None) -> List[Tuple[str, int, int]]:
+        """
+        Lists the latest copy of every page
+
+        :param kind: Only list the pages of this kind, see :func:`utils.cache.url_class`
+
+        :return: The link, offset and length of every page, in archive order
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT url, offset, length FROM pages"
+                " WHERE id IN (SELECT MAX(id) FROM pages GROUP BY url)"
+                " ORDER BY offset"
+            ).fetchall()
+        if kind is None:
+            return rows
+        return [row for row in rows if url_class(row[0]) == kind]
+
+    def get(self, url: str) -> bytes | None:
+        """
+        Reads the latest copy of a page
+
+        :param url: The link to the page
+
+        :return: The body of the page, None if it isn't archived
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT offset, length FROM pages WHERE url = ?"
+                " ORDER BY id DESC LIMIT 1",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        offset, length = row
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            return zlib.decompress(file.read(length), wbits=_GZIP_WBITS)
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM pages WHERE url = ? LIMIT 1", (url,)
+                ).fetchone()
+                is not None
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(DISTINCT url) FROM pages"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        """Closes the archive and its index"""
+        with self._lock:
+            self._file.close()
+            self._connection.close()
+
+
+# The archive mapped by each worker process, see _open_mapping
+_mapping: memoryview | None = None
+
+
+def _open_mapping(path: str) -> None:
+    # Runs once in every worker process
+    global _mapping  # pylint: disable=global-statement
+
+    with open(path, "rb") as file:
+        # The mapping stays valid after the file is closed
+        _mapping = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _replay_chunk(
+    kind: str, entries: List[Tuple[str, int, int]]
+) -> List[Tuple[str, Any, BaseException | None]]:
+    # Runs in the worker processes, so it has to be importable at module level
+    from utils.pipeline import EXTRACTORS  # pylint: disable=import-outside-toplevel
+
+    extract = EXTRACTORS[kind]
+    results = []
+    for url, offset, length in entries:
+        try:
+            # Slicing the memoryview doesn't copy, zlib reads the mapped pages
+            page = zlib.decompress(_mapping[offset : offset + length], wbits=_GZIP_WBITS)
+            results.append((url, extract(page), None))
+        except Exception as error:  # pylint: disable=broad-except
+            results.append((url, None, error))
+    return results
+
+
+def replay(
+    directory: str,
+    kind: str = "specs",
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    quarantine: Quarantine | None = None,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Runs an extractor on the latest copy of every device page in the archive
+
+    :param directory: The directory of the archive
+
+    :param kind: The extractor to run, one of ``utils.pipeline.EXTRACTORS``
+
+    :param workers: The number of processes extracting pages, defaults to the number of cores
+
+    :param chunk_size: The number of pages sent to a worker at once
+
+    :param quarantine: Keeps the pages that fail to be extracted, which are then
+        skipped instead of raising
+
+    :return: A generator that yields the link and the extracted dataclass of
+        every page as soon as it's extracted
+    """
+    with PageArchive(directory) as archive:
+        entries = archive.entries("device")
+    if not entries:
+        return
+
+    workers = workers or os.cpu_count() or 1
+    chunks = [
+        entries[start : start + chunk_size]
+        for start in range(0, len(entries), chunk_size)
+    ]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_open_mapping,
+        initargs=(os.path.join(directory, ARCHIVE_FILE),),
+    ) as pool:
+        pending = set()
+        chunks_iterator = iter(chunks)
+        while True:
+            # A couple of chunks per worker keeps every core busy without
+            # holding the results of the whole catalog at once
+            for chunk in chunks_iterator:
+                pending.add(pool.submit(_replay_chunk, kind, chunk))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                return
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for url, result, error in future.result():
+                    if error is None:
+                        yield url, result
+                        continue
+                    if quarantine is None:
+                        raise error
+                    with PageArchive(directory) as archive:
+                        page = archive.get(url)
+                    quarantine.put(
+                        url,
+                        page.decode("utf-8", errors="replace") if page else None,
+                        error,
+                        "extract",
+                    )
@@ -0,0 +1,266 @@
+"""A disk-backed HTTP cache that revalidates pages with ETag/Last-Modified"""
+
+from dataclasses import dataclass
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Seconds a cached page is served without asking the server again,
+# once it's older it's revalidated with a conditional request
+DEFAULT_TTL: Dict[str, float] = {
+    "makers": 60 * 60,
+    "brand": 60 * 60,
+    "device": 24 * 60 * 60,
+    "other": 0,
+}
+
+# Seconds within which a read doesn't update the last access of an entry
+# again, the eviction order doesn't need to be finer
+ACCESS_RESOLUTION = 60.0
+# The number of accesses kept in memory before they are written at once
+ACCESS_BATCH_SIZE = 100
+
+_BRAND_PAGE = re.compile(r"-phones-(f-)?\d+(-\d+)*(-p\d+)?\.php$")
+_DEVICE_PAGE = re.compile(r"_[^/]*-\d+\.php$")
+
+
+def url_class(link: str) -> str:
+    """
+    Classifies a gsmarena link by the kind of page it points to
+
+    :param link: The link to the page
+
+    :return: One of ``"makers"``, ``"brand"``, ``"device"`` or ``"other"``
+    """
+    path = link.split("?", 1)[0]
+
+    if path.endswith("/makers.php3"):
+        return "makers"
+    if _BRAND_PAGE.search(path):
+        return "brand"
+    if _DEVICE_PAGE.search(path):
+        return "device"
+    return "other"
+
+
+@dataclass
+class CacheEntry:
+    """A cached response body with the validators it was sent with"""
+
+    url: str
+    body: bytes
+    encoding: str | None
+    etag: str | None
+    last_modified: str | None
+    stored_at: float
+
+    def is_fresh(self, ttl: float) -> bool:
+        """
+        Checks whether the entry can be served without revalidating it
+
+        :param ttl: The time to live of the entry in seconds
+
+        :return: True if the entry is younger than **ttl**
+        """
+        return time.time() - self.stored_at < ttl
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """
+        Builds the headers that ask the server to answer 304 if the page didn't change
+
+        :return: The ``If-None-Match``/``If-Modified-Since`` headers that apply
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """
+    Stores response bodies in a SQLite file, evicting the least recently used ones
+
+    The total size of the stored bodies is kept under ``max_bytes``. Reads
+    don't write to the file each time: the accesses are kept in memory and
+    written in batches, along with the next stored page, and an entry read
+    again within ``ACCESS_RESOLUTION`` seconds isn't marked again.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: Dict[str, float] | None = None,
+    ):
+        """
+        :param directory: The directory the cache file is kept in
+
+        :param max_bytes: The maximum total size of the cached bodies
+
+        :param ttl: Overrides of the time to live in seconds per URL class, see **url_class**
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+
+        self._lock = threading.Lock()
+        # url -> the time of its last access, not written yet
+        self._accessed: Dict[str, float] = {}
+        self._connection = sqlite3.connect(
+            os.path.join(directory, "http_cache.sqlite"), check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                encoding TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._connection.commit()
+
+    def ttl_for(self, link: str) -> float:
+        """
+        Gets the time to live that applies to the page
+
+        :param link: The link to the page
+
+        :return: The time to live in seconds
+        """
+        return self.ttl.get(url_class(link), 0)
+
+    def get(self, link: str) -> CacheEntry | None:
+        """
+        Gets the cached entry of the page and marks it as recently used
+
+        :param link: The link to the page
+
+        :return: The cached entry, None if the page isn't cached
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT body, encoding, etag, last_modified, stored_at, last_access"
+                " FROM entries WHERE url = ?",
+                (link,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            now = time.time()
+            if now - row[5] >= ACCESS_RESOLUTION:
+                self._accessed[link] = now
+                if len(self._accessed) >= ACCESS_BATCH_SIZE:
+                    self._write_accesses()
+                    self._connection.commit()
+
+        return CacheEntry(link, *row[:5])
+
+    def put(
+        self,
+        link: str,
+        body: bytes,
+        encoding: str | None,
+        etag: str | None,
+        last_modified: str | None,
+    ) -> None:
+        """
+        Stores the body of the page, evicting old entries if the cache is full
+
+        :param link: The link to the page
+
+        :param body: The decoded body of the response
+
+        :param encoding: The text encoding of the body
+
+        :param etag: The ETag header of the response
+
+        :param last_modified: The Last-Modified header of the response
+        """
+        if len(body) > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (link, body, len(body), encoding, etag, last_modified, now, now),
+            )
+            # The entries read lately aren't the ones to evict
+            self._write_accesses()
+            self._evict()
+            self._connection.commit()
+
+    def refresh(self, link: str) -> None:
+        """
+        Resets the age of the entry after the server confirmed it didn't change
+
+        :param link: The link to the page
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "UPDATE entries SET stored_at = ?, last_access = ? WHERE url = ?",
+                (now, now, link),
+            )
+            self._connection.commit()
+
+    def size(self) -> int:
+        """
+        :return: The total size of the cached bodies in bytes
+        """
+        with self._lock:
+            (total,) = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return total
+
+    def close(self) -> None:
+        """Writes the accesses kept in memory and closes the cache file"""
+        with self._lock:
+            self._write_accesses()
+            self._connection.commit()
+            self._connection.close()
+
+    def _write_accesses(self) -> None:
+        if self._accessed:
+            self._connection.executemany(
+                "UPDATE entries SET last_access = ? WHERE url = ?",
+                [(accessed, url) for url, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _evict(self) -> None:
+        (total,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+
+        rows = self._connection.execute(
+            "SELECT url, size FROM entries ORDER BY last_access"
+        )
+        evicted = []
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((url,))
+            total -= size
+
+        self._connection.executemany("DELETE FROM entries WHERE url = ?", evicted)
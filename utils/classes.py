@@ -1,9 +1,79 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, fields
+from operator import attrgetter
+import sys
+from typing import Any, ClassVar, Dict, Optional, Sequence, Tuple
 
 
-@dataclass
-class Brand:
+class Record:
+    """
+    Base of the record types, all of them are slotted dataclasses
+
+    Slots keep the values in a fixed array instead of a per-instance
+    ``__dict__``, and the records with many repeated values (``"Android 11"``,
+    ``"Li-Po"``, ``"mAh"``...) intern them, so a catalog of a million records
+    shares one copy of each instead of a million.
+    """
+
+    __slots__ = ()
+
+    _intern: ClassVar[bool] = False
+    _field_names: ClassVar[Tuple[str, ...]]
+    _getter: ClassVar[attrgetter]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # The fields aren't known yet, they are looked up on first use
+        cls._field_names = ()
+
+    def __post_init__(self):
+        if self._intern:
+            for name in self.field_names():
+                value = getattr(self, name)
+                if type(value) is str:
+                    setattr(self, name, sys.intern(value))
+
+    def __reduce__(self):
+        # Rebuilt through __init__, so records sent back by worker processes
+        # are interned again on arrival
+        return self.__class__.from_row, (self.to_row(),)
+
+    @classmethod
+    def field_names(cls) -> Tuple[str, ...]:
+        """
+        :return: The names of the fields, in the order they are declared
+        """
+        if not cls._field_names:
+            cls._field_names = tuple(field.name for field in fields(cls))
+            cls._getter = attrgetter(*cls._field_names)
+        return cls._field_names
+
+    def to_row(self) -> Tuple[Any, ...]:
+        """
+        :return: The values of the fields, in the order of **field_names**
+        """
+        self.field_names()
+        row = self._getter(self)
+        # attrgetter returns the value itself when there's a single field
+        return row if isinstance(row, tuple) else (row,)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: The fields and their values, like ``__dict__`` of a plain dataclass
+        """
+        return dict(zip(self.field_names(), self.to_row()))
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]):
+        """
+        :param row: The values of the fields, in the order of **field_names**
+
+        :return: The record
+        """
+        return cls(*row)
+
+
+@dataclass(slots=True)
+class Brand(Record):
     """Brand information dataclass"""
 
     id: str
@@ -12,8 +82,8 @@ class Brand:
     number_of_devices: int
 
 
-@dataclass
-class Device:
+@dataclass(slots=True)
+class Device(Record):
     """Contains data that is displayed on the brand's devices page at **gsmarena**"""
 
     title: str
@@ -22,10 +92,12 @@ class Device:
     gsmarena_link: str
 
 
-@dataclass
-class DeviceDetails:
+@dataclass(slots=True)
+class DeviceDetails(Record):
     """Contains data that is displayed on header content of the device's page at **gsmarena**"""
 
+    _intern: ClassVar[bool] = True
+
     model_name: str
     img_link: str
     released: str
@@ -45,10 +117,12 @@ class DeviceDetails:
     battery_type: str | None = None
 
 
-@dataclass
-class DeviceSpecs:
+@dataclass(slots=True)
+class DeviceSpecs(Record):
     """Contains the device's specs listed on the device's page at **gsmarena**"""
 
+    _intern: ClassVar[bool] = True
+
     model_name: str
     img_link: str
     comment: Optional[str] = None
@@ -93,3 +167,34 @@ class DeviceSpecs:
     misc_colors: Optional[str] = None
     misc_models: Optional[str] = None
     misc_price: Optional[str] = None
+
+
+@dataclass(slots=True)
+class DeviceSpecTable(Record):
+    """
+    Contains every row of the specs list on the device's page at **gsmarena**
+
+    The specs are keyed by a column named after the section and label of
+    their row, see utils.spec_schema. A value spread over several lines is
+    a tuple of the lines.
+    """
+
+    _intern: ClassVar[bool] = True
+
+    model_name: str
+    img_link: str | None
+    specs: Dict[str, str | Tuple[str, ...]]
+
+    def __post_init__(self):
+        Record.__post_init__(self)
+        # Unpickled as new strings when sent back by a worker process, so the
+        # columns and the values repeated across devices are interned here
+        intern = sys.intern
+        self.specs = {
+            intern(column): (
+                intern(value)
+                if type(value) is str
+                else tuple(intern(line) for line in value)
+            )
+            for column, value in self.specs.items()
+        }
@@ -0,0 +1,194 @@
+"""Writes device specs to a Parquet dataset partitioned by brand
+
+Needs the optional **pyarrow** package: ``pip install pyarrow``
+"""
+
+from dataclasses import fields
+from datetime import datetime, timezone
+import glob
+import os
+from typing import Any, Dict, List
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError as error:
+    raise ImportError(
+        "Writing Parquet datasets needs the pyarrow package: pip install pyarrow"
+    ) from error
+
+from utils.classes import DeviceSpecs
+from utils.device_index import device_id
+from utils.writers import temp_path
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Every spec is a string with few distinct values, dictionary encoding keeps
+# each one once per row group and makes filtering on them fast
+_DICTIONARY_STRING = pa.dictionary(pa.int32(), pa.string())
+
+SPECS_SCHEMA = pa.schema(
+    [
+        pa.field("device_id", pa.int32()),
+        pa.field("gsmarena_link", pa.string()),
+        pa.field("scraped_at", pa.timestamp("s", tz="UTC")),
+    ]
+    + [pa.field(field.name, _DICTIONARY_STRING) for field in fields(DeviceSpecs)]
+)
+
+
+class SpecsDatasetWriter:
+    """
+    Writes **DeviceSpecs** in batches to a Parquet dataset, one partition per brand
+
+    The dataset uses the hive layout, ``<directory>/brand_id=<id>/part-0.parquet``
+    with the id URI-escaped, so it can be read back with
+    ``pyarrow.dataset.dataset(directory, partitioning="hive")`` and filtered on
+    ``brand_id`` without opening the other brands' files. Each batch becomes a
+    row group.
+
+    An incremental refresh writes its rows to a part of its own next to the
+    existing ones, :func:`read_latest_specs` keeps the newest row of each device.
+
+    The parts are written to hidden temporary files, skipped by the readers of
+    the dataset, and moved in place once the writer is closed, so the dataset
+    is never read half-written. Leaving a ``with`` block on an exception
+    discards them.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        part: str = "part-0",
+        replace: bool = False,
+    ):
+        """
+        :param directory: The directory of the dataset
+
+        :param batch_size: The number of rows of a brand buffered before they are written
+
+        :param part: The name of the file written in each partition
+
+        :param replace: Remove every other part of the dataset once the new
+            ones are in place, for a full crawl
+        """
+        self.directory = directory
+        self.batch_size = batch_size
+        self.part = part
+        self.replace = replace
+        self.scraped_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self.rows_written = 0
+
+        self._writers: Dict[str, pq.ParquetWriter] = {}
+        self._batches: Dict[str, Dict[str, List[Any]]] = {}
+
+    def write(self, brand_id: str, gsmarena_link: str, specs: DeviceSpecs) -> None:
+        """
+        Buffers the specs of a device, writing the batch of its brand once it's full
+
+        :param brand_id: The id of the brand, the partition the row goes to
+
+        :param gsmarena_link: The link to the device's page
+
+        :param specs: The specs of the device
+        """
+        batch = self._batches.get(brand_id)
+        if batch is None:
+            batch = self._batches[brand_id] = {name: [] for name in SPECS_SCHEMA.names}
+
+        batch["device_id"].append(device_id(gsmarena_link))
+        batch["gsmarena_link"].append(gsmarena_link)
+        batch["scraped_at"].append(self.scraped_at)
+        for name, value in zip(specs.field_names(), specs.to_row()):
+            batch[name].append(value)
+
+        if len(batch["gsmarena_link"]) >= self.batch_size:
+            self._flush(brand_id)
+
+    def close(self) -> None:
+        """Writes the remaining batches and moves every partition file in place"""
+        for brand_id in list(self._batches):
+            self._flush(brand_id)
+        paths = set()
+        for brand_id, writer in self._writers.items():
+            writer.close()
+            path = self._path(brand_id)
+            os.replace(temp_path(path), path)
+            paths.add(path)
+        self._writers.clear()
+
+        if self.replace:
+            for partition in glob.glob(os.path.join(self.directory, "brand_id=*")):
+                for path in glob.glob(os.path.join(partition, "*.parquet")):
+                    if path not in paths:
+                        os.remove(path)
+                if not os.listdir(partition):
+                    os.rmdir(partition)
+
+    def abort(self) -> None:
+        """Discards the rows written, leaving the dataset as it was"""
+        self._batches.clear()
+        for brand_id, writer in self._writers.items():
+            writer.close()
+            os.remove(temp_path(self._path(brand_id)))
+        self._writers.clear()
+
+    def __enter__(self) -> "SpecsDatasetWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _path(self, brand_id: str) -> str:
+        # Escaped the way the hive partitioning of pyarrow decodes it, so a
+        # brand id can't reach outside the dataset and is read back as it was
+        partition = f"brand_id={quote(brand_id, safe='')}"
+        return os.path.join(self.directory, partition, f"{self.part}.parquet")
+
+    def _flush(self, brand_id: str) -> None:
+        batch = self._batches.pop(brand_id, None)
+        if not batch or not batch["gsmarena_link"]:
+            return
+
+        writer = self._writers.get(brand_id)
+        if writer is None:
+            path = self._path(brand_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = self._writers[brand_id] = pq.ParquetWriter(
+                temp_path(path), SPECS_SCHEMA, compression="zstd"
+            )
+
+        writer.write_table(pa.Table.from_pydict(batch, schema=SPECS_SCHEMA))
+        self.rows_written += len(batch["gsmarena_link"])
+
+
+def read_latest_specs(directory: str) -> pa.Table:
+    """
+    Reads the dataset keeping only the newest row of each device
+
+    :param directory: The directory of the dataset
+
+    :return: The table of the specs, with the ``brand_id`` partition column
+    """
+    table = ds.dataset(directory, partitioning="hive").to_table()
+    latest = table.group_by("device_id").aggregate([("scraped_at", "max")])
+    newest = pc.is_in(
+        pc.binary_join_element_wise(
+            pc.cast(table["device_id"], pa.string()),
+            pc.cast(table["scraped_at"], pa.string()),
+            "@",
+        ),
+        value_set=pc.binary_join_element_wise(
+            pc.cast(latest["device_id"], pa.string()),
+            pc.cast(latest["scraped_at_max"], pa.string()),
+            "@",
+        ),
+    )
+    return table.filter(newest)
@@ -0,0 +1,106 @@
+"""Asynchronous crawl engine that keeps several gsmarena requests in flight"""
+
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+from urllib.parse import urlsplit
+
+from bs4 import BeautifulSoup
+from lxml.html import HtmlElement
+
+from utils.helper import get_document, get_html, get_tree
+
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PER_HOST = 4
+
+T = TypeVar("T")
+
+
+class Crawler:
+    """
+    Runs blocking page fetches on a thread pool while limiting how many are in flight
+
+    Two limits apply to every fetch: a global one shared by all hosts and a
+    per-host one, so that a crawl never opens more than ``max_per_host``
+    connections to gsmarena even when ``max_concurrency`` is higher. The
+    pace of the requests is set by the adaptive rate limiter of the shared
+    fetcher, see :mod:`utils.ratelimit`.
+
+    Use it as an async context manager so the thread pool is shut down::
+
+        async with Crawler(max_concurrency=16) as crawler:
+            document = await crawler.fetch_document(link)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_CONCURRENCY,
+        max_per_host: int = DEFAULT_PER_HOST,
+    ):
+        """
+        :param max_concurrency: The maximum number of requests in flight in total
+
+        :param max_per_host: The maximum number of requests in flight to a single host
+        """
+        if max_concurrency < 1 or max_per_host < 1:
+            raise ValueError("Concurrency limits must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.max_per_host)
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="crawler"
+        )
+
+    async def __aenter__(self) -> "Crawler":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shuts down the thread pool used for the blocking fetches"""
+        self._executor.shutdown(wait=True)
+
+    async def fetch_document(self, link: str) -> BeautifulSoup:
+        """
+        Gets the document of the page once both concurrency limits allow it
+
+        :param link: The link to the page
+
+        :return: The document of the page as a BeautifulSoup object
+        """
+        return await self._run(get_document, link)
+
+    async def fetch_tree(self, link: str) -> HtmlElement:
+        """
+        Gets the lxml tree of the page once both concurrency limits allow it
+
+        :param link: The link to the page
+
+        :return: The root element of the page
+        """
+        return await self._run(get_tree, link)
+
+    async def fetch_html(self, link: str) -> str:
+        """
+        Gets the HTML of the page once both concurrency limits allow it
+
+        :param link: The link to the page
+
+        :return: The HTML of the page
+        """
+        return await self._run(get_html, link)
+
+    async def _run(self, fetch: Callable[[str], T], link: str) -> T:
+        host = urlsplit(link).netloc
+
+        async with self._global, self._hosts[host]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fetch, link)
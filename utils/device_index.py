@@ -0,0 +1,182 @@
+"""An index of the devices seen in a crawl, keyed on their gsmarena ID
+
+The same device can be listed under several brands (e.g. ``benq`` and
+``benq-siemens``) or relisted under another link, but the number at the end
+of its link, ``apple_iphone_16-13317.php``, stays the same. Keying on that ID
+makes sure each device page is fetched once per crawl, and gives every
+output a column to join on.
+"""
+
+from contextlib import contextmanager
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterator, List, Set
+from urllib.parse import urlsplit
+
+from utils.metrics import get_metrics
+
+# Device pages are named brand_model-<id>.php, unlike the brand pages
+# (apple-phones-48.php) which have no underscore
+_DEVICE_ID = re.compile(r"_[^/]*-(\d+)\.php$")
+
+
+def device_id(link: str) -> int | None:
+    """
+    Parses the gsmarena ID of a device from its link
+
+    :param link: The relative or absolute link to the device's page
+
+    :return: The ID of the device, None if the link isn't a device page
+    """
+    match = _DEVICE_ID.search(urlsplit(link).path)
+    return int(match.group(1)) if match else None
+
+
+class DeviceIndex:
+    """
+    A set of device IDs, kept in memory and optionally persisted to SQLite
+
+    The first link and brand a device is seen with are stored with its ID,
+    along with every brand that lists it. Membership is checked against an
+    in-memory set, so the index is cheap enough to consult for every link.
+    """
+
+    def __init__(self, path: str | None = None):
+        """
+        :param path: The path of the SQLite file, None keeps the index in memory only
+        """
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS devices (
+                device_id INTEGER PRIMARY KEY,
+                link TEXT NOT NULL,
+                brand_id TEXT
+            );
+            CREATE TABLE IF NOT EXISTS listings (
+                device_id INTEGER NOT NULL,
+                brand_id TEXT NOT NULL,
+                PRIMARY KEY (device_id, brand_id)
+            );
+            """
+        )
+        self._seen: Set[int] = self._stored_ids()
+        # The depth of the batch() blocks running, add() doesn't commit in one
+        self._batches = 0
+
+    def _stored_ids(self) -> Set[int]:
+        return {
+            row[0] for row in self._connection.execute("SELECT device_id FROM devices")
+        }
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Commits the devices added in the block at once, instead of one by one
+
+        The devices added in the block are forgotten if it raises.
+        """
+        with self._lock:
+            self._batches += 1
+        committed = False
+        try:
+            yield
+            committed = True
+        finally:
+            with self._lock:
+                self._batches -= 1
+                if not self._batches:
+                    if committed:
+                        self._connection.commit()
+                    else:
+                        self._connection.rollback()
+                        self._seen = self._stored_ids()
+
+    def add(self, link: str, brand_id: str | None = None) -> bool:
+        """
+        Records a device listed under a brand
+
+        :param link: The link to the device's page
+
+        :param brand_id: The id of the brand listing it
+
+        :return: True if the device wasn't seen before and should be fetched,
+            False if it was or if the link isn't a device page, which is skipped
+        """
+        key = device_id(link)
+        if key is None:
+            # A listing can link to something else than a device page, e.g. a
+            # review, it's counted rather than stopping the crawl
+            get_metrics().increment("unindexed_links_total")
+            return False
+
+        with self._lock:
+            new = key not in self._seen
+            if new:
+                self._seen.add(key)
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO devices (device_id, link, brand_id)"
+                    " VALUES (?, ?, ?)",
+                    (key, link, brand_id),
+                )
+            if brand_id is not None:
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO listings (device_id, brand_id) VALUES (?, ?)",
+                    (key, brand_id),
+                )
+            if not self._batches:
+                self._connection.commit()
+        return new
+
+    def __contains__(self, link: str) -> bool:
+        return device_id(link) in self._seen
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def link(self, key: int) -> str | None:
+        """
+        :param key: The ID of the device
+
+        :return: The first link the device was seen with, None if it wasn't seen
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT link FROM devices WHERE device_id = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def brands(self, key: int) -> List[str]:
+        """
+        :param key: The ID of the device
+
+        :return: The ids of every brand listing the device
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT brand_id FROM listings WHERE device_id = ? ORDER BY brand_id",
+                (key,),
+            ).fetchall()
+        return [brand_id for (brand_id,) in rows]
+
+    def clear(self) -> None:
+        """Forgets every device, so the next crawl fetches them all again"""
+        with self._lock:
+            self._connection.execute("DELETE FROM devices")
+            self._connection.execute("DELETE FROM listings")
+            self._connection.commit()
+            self._seen.clear()
+
+    def close(self) -> None:
+        """Closes the SQLite file"""
+        with self._lock:
+            self._connection.close()
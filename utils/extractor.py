@@ -5,6 +5,7 @@ import re
 from bs4 import BeautifulSoup
 
 from utils.classes import DeviceDetails, DeviceSpecs
+from utils.resilience import ExtractionError
 
 
 def device_details(document: BeautifulSoup) -> DeviceDetails:
@@ -15,11 +16,17 @@ def device_details(document: BeautifulSoup) -> DeviceDetails:
 
     Returns:
         DeviceDetailsShort: A dataclass containing the header content of the device page
+
+    Raises:
+        ExtractionError: If the page has no model name, i.e. it isn't a device page
     """
     model_name = document.find(
         "h1", attrs={"class": "specs-phone-name-title", "data-spec": "modelname"}
     )
-    img_link = document.find("div", class_="specs-photo-main").find("img")
+    if model_name is None:
+        raise ExtractionError("The page has no model name")
+    photo = document.find("div", class_="specs-photo-main")
+    img_link = photo.find("img") if photo else None
     released = document.find("span", attrs={"data-spec": "released-hl"})
     body = document.find("span", attrs={"data-spec": "body-hl"})
     os = document.find("span", attrs={"data-spec": "os-hl"})
@@ -27,19 +34,23 @@ def device_details(document: BeautifulSoup) -> DeviceDetails:
     display_size = document.find("span", attrs={"data-spec": "displaysize-hl"})
     display_res = document.find("span", attrs={"data-spec": "displayres-hl"})
     camera_pixels = document.find("span", attrs={"data-spec": "camerapixels-hl"})
-    camera_pixel_unit = camera_pixels.find_next_sibling("span")
+    camera_pixel_unit = (
+        camera_pixels.find_next_sibling("span") if camera_pixels else None
+    )
     video_pixels = document.find("span", attrs={"data-spec": "videopixels-hl"})
     ram_size = document.find("span", attrs={"data-spec": "ramsize-hl"})
-    ram_size_unit = ram_size.find_next_sibling("span")
+    ram_size_unit = ram_size.find_next_sibling("span") if ram_size else None
     chipset = document.find("span", attrs={"data-spec": "chipset-hl"})
     battery_size = document.find("span", attrs={"data-spec": "batsize-hl"})
-    battery_size_unit = battery_size.find_next_sibling("span")
+    battery_size_unit = (
+        battery_size.find_next_sibling("span") if battery_size else None
+    )
     battery_type = document.find("span", attrs={"data-spec": "battype-hl"})
 
     return DeviceDetails(
         model_name=model_name.text,
         img_link=img_link.get("src", None) if img_link else None,
-        released=released.text,
+        released=released.text if released else None,
         body=body.text if body else None,
         os=os.text if os else None,
         storage=storage.text if storage else None,
@@ -65,11 +76,19 @@ def device_specs(document: BeautifulSoup) -> DeviceSpecs:
 
     Returns:
         DeviceSpecs: dataclass containing the device specs
+
+    Raises:
+        ExtractionError: If the page has no specs list or no model name
     """
     specs_list = document.find("div", id="specs-list")
+    if specs_list is None:
+        raise ExtractionError("The page has no specs list")
 
     model_name = specs_list.find("h1", attrs={"data-spec": "modelname"})
-    img_link = specs_list.find("div", class_="specs-photo-main").find("img")
+    if model_name is None:
+        raise ExtractionError("The page has no model name")
+    photo = specs_list.find("div", class_="specs-photo-main")
+    img_link = photo.find("img") if photo else None
 
     comment = specs_list.find("p", attrs={"data-spec": "comment"})
 
@@ -0,0 +1,420 @@
+"""A pooled HTTP fetcher shared by every request the scrapers send"""
+
+import atexit
+from dataclasses import dataclass
+import os
+import threading
+import time
+from typing import Callable, Dict, Tuple
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.archive import PageArchive
+from utils.cache import HttpCache
+from utils.metrics import get_metrics
+from utils.ratelimit import (
+    DEFAULT_INITIAL_RATE,
+    THROTTLE_STATUS_CODES,
+    AdaptiveRateLimiter,
+    backoff_delay,
+)
+from utils.resilience import CircuitBreaker
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_TIMEOUT = 10
+DEFAULT_THROTTLE_RETRIES = 5
+DEFAULT_RETRIES = 3
+
+# Failures worth sending the request again for
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+# Set GSMARENA_CACHE_DIR to an empty string to disable the HTTP cache
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.environ.get(
+    "GSMARENA_CACHE_DIR", os.path.join(PROJECT_DIR, ".cache")
+)
+# Set GSMARENA_RATE to cap the number of requests per second
+DEFAULT_RATE = float(os.environ["GSMARENA_RATE"]) if os.environ.get("GSMARENA_RATE") else None
+# Set GSMARENA_ARCHIVE_DIR to an empty string to stop archiving the pages
+DEFAULT_ARCHIVE_DIR = os.environ.get(
+    "GSMARENA_ARCHIVE_DIR", os.path.join(PROJECT_DIR, "data", "archive")
+)
+
+
+def _accept_encoding() -> str:
+    """
+    Builds the Accept-Encoding header from the decoders urllib3 can use
+
+    Brotli is only advertised when a brotli package is installed, otherwise
+    the server could answer with a body that can't be decoded.
+    """
+    encodings = ["gzip", "deflate"]
+    try:
+        import brotli  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
+        except ImportError:
+            return ", ".join(encodings)
+    return ", ".join(encodings + ["br"])
+
+
+@dataclass
+class FetchStats:
+    """Statistics of a single request sent by the **Fetcher**"""
+
+    url: str
+    status_code: int
+    bytes_received: int
+    """Size of the body as sent over the wire, before decompression"""
+    bytes_decoded: int
+    time_to_first_byte: float
+    """Seconds until the response headers were received"""
+    total_time: float
+    connection_reused: bool
+    cache_status: str | None = None
+    """``"miss"`` or ``"revalidated"`` when the fetcher has a cache, None otherwise"""
+
+
+class Fetcher:
+    """
+    Owns a **requests** session and its keep-alive connection pool
+
+    A single fetcher is shared by all the scraper functions through
+    :func:`get_fetcher`, so consecutive pages reuse the same TCP+TLS
+    connections instead of opening a new one for every request.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        on_stats: Callable[[FetchStats], None] | None = None,
+        cache: HttpCache | None = None,
+        rate_limiter: AdaptiveRateLimiter | None = None,
+        throttle_retries: int = DEFAULT_THROTTLE_RETRIES,
+        retries: int = DEFAULT_RETRIES,
+        circuit_breaker: CircuitBreaker | None = None,
+        archive: PageArchive | None = None,
+    ):
+        """
+        :param pool_connections: The number of hosts to keep a connection pool for
+
+        :param pool_maxsize: The maximum number of connections kept open per host
+
+        :param timeout: The timeout of each request in seconds
+
+        :param on_stats: Called with the **FetchStats** of every request
+
+        :param cache: The HTTP cache to serve and revalidate pages from
+
+        :param rate_limiter: Paces every request sent, a new one is used if not given
+
+        :param throttle_retries: How many times a request throttled with 429/503 is resent
+
+        :param retries: How many times a request that failed with a connection error,
+            a timeout or a 5xx status is resent
+
+        :param circuit_breaker: Pauses every request after too many failures in a row,
+            a new one is used if not given
+
+        :param archive: Keeps the raw HTML of every page received, see :mod:`utils.archive`
+        """
+        self.timeout = timeout
+        self.on_stats = on_stats
+        self.cache = cache
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.throttle_retries = throttle_retries
+        self.retries = retries
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.archive = archive
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "User-Agent": USER_AGENT,
+                "Accept-Encoding": _accept_encoding(),
+                "Connection": "keep-alive",
+            }
+        )
+
+        self._lock = threading.Lock()
+        self._seen_connections: weakref.WeakSet = weakref.WeakSet()
+        self._totals = {
+            "requests": 0,
+            "cache_hits": 0,
+            "not_modified": 0,
+            "reused_connections": 0,
+            "bytes_received": 0,
+            "bytes_decoded": 0,
+            "time_to_first_byte": 0.0,
+            "total_time": 0.0,
+        }
+
+    def fetch(
+        self,
+        link: str,
+        headers: Dict[str, str] | None = None,
+        cache_status: str | None = None,
+    ) -> requests.Response:
+        """
+        Sends a GET request through the pooled session and records its statistics
+
+        Every request waits for the circuit breaker and the rate limiter first.
+        When the server answers 429/503 the limiter backs off, honoring
+        Retry-After, and the request is sent again up to ``throttle_retries``
+        times. Connection errors, timeouts and other 5xx answers are retried
+        up to ``retries`` times with a jittered backoff, and count towards
+        opening the circuit breaker.
+
+        :param link: The link to the page
+
+        :param headers: Extra headers sent with this request only
+
+        :param cache_status: Recorded in the **FetchStats** of the request
+
+        :return: The response with its body already read, it may still have
+            an error status once the retries are exhausted
+        """
+        throttled = 0
+        failures = 0
+        while True:
+            self.circuit_breaker.wait()
+            self.rate_limiter.acquire()
+            try:
+                response, stats = self._send(link, headers, cache_status)
+            except TRANSIENT_ERRORS:
+                self.circuit_breaker.record_failure()
+                failures += 1
+                if failures > self.retries:
+                    raise
+                get_metrics().increment("retries_total", label="error")
+                time.sleep(backoff_delay(failures))
+                continue
+
+            self.rate_limiter.record(
+                stats.status_code,
+                stats.time_to_first_byte,
+                response.headers.get("Retry-After"),
+            )
+
+            if response.status_code in THROTTLE_STATUS_CODES:
+                # The rate limiter already paused every request
+                if throttled >= self.throttle_retries:
+                    return response
+                throttled += 1
+                continue
+
+            if response.status_code >= 500:
+                self.circuit_breaker.record_failure()
+                if failures >= self.retries:
+                    return response
+                failures += 1
+                get_metrics().increment(
+                    "retries_total", label=str(response.status_code)
+                )
+                continue
+
+            self.circuit_breaker.record_success()
+            return response
+
+    def _send(
+        self, link: str, headers: Dict[str, str] | None, cache_status: str | None
+    ) -> Tuple[requests.Response, FetchStats]:
+        start = time.perf_counter()
+        response = self.session.get(
+            link, headers=headers, timeout=self.timeout, stream=True
+        )
+        time_to_first_byte = time.perf_counter() - start
+
+        connection = response.raw.connection
+        with self._lock:
+            reused = connection is not None and connection in self._seen_connections
+            if connection is not None:
+                self._seen_connections.add(connection)
+
+        # Reading the body releases the connection back to the pool
+        content = response.content
+        stats = FetchStats(
+            url=link,
+            status_code=response.status_code,
+            bytes_received=response.raw.tell(),
+            bytes_decoded=len(content),
+            time_to_first_byte=time_to_first_byte,
+            total_time=time.perf_counter() - start,
+            connection_reused=reused,
+            cache_status=cache_status,
+        )
+        self._record(stats)
+
+        return response, stats
+
+    def get_text(self, link: str) -> str:
+        """
+        Gets the decoded body of the page, from the cache when it's still valid
+
+        A cached page younger than its time to live is served without a
+        request. An older one is revalidated with a conditional request and
+        served from the cache if the server answers 304 Not Modified.
+
+        :param link: The link to the page
+
+        :return: The body of the page as text
+
+        :raises requests.HTTPError: If the server answered with an error status
+        """
+        if self.cache is None:
+            response = self.fetch(link)
+            response.raise_for_status()
+            self._archive(link, response)
+            return response.text
+
+        entry = self.cache.get(link)
+        if entry is not None and entry.is_fresh(self.cache.ttl_for(link)):
+            with self._lock:
+                self._totals["cache_hits"] += 1
+            get_metrics().increment("cache_hits_total")
+            return entry.body.decode(entry.encoding or "utf-8", errors="replace")
+
+        if entry is not None:
+            response = self.fetch(
+                link, entry.conditional_headers(), cache_status="revalidated"
+            )
+        else:
+            response = self.fetch(link, cache_status="miss")
+
+        if response.status_code == 304 and entry is not None:
+            self.cache.refresh(link)
+            with self._lock:
+                self._totals["not_modified"] += 1
+            get_metrics().increment("not_modified_total")
+            return entry.body.decode(entry.encoding or "utf-8", errors="replace")
+
+        response.raise_for_status()
+        self._archive(link, response)
+        if response.status_code == 200:
+            self.cache.put(
+                link,
+                response.content,
+                response.encoding or response.apparent_encoding,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+        return response.text
+
+    def _archive(self, link: str, response: requests.Response) -> None:
+        if self.archive is not None and response.status_code == 200:
+            self.archive.append(
+                link,
+                response.content,
+                response.encoding or response.apparent_encoding,
+            )
+
+    def totals(self) -> Dict[str, float]:
+        """
+        Sums up the statistics of every request sent so far
+
+        :return: A dictionary of the totals, including the ratio of reused connections
+        """
+        with self._lock:
+            totals = dict(self._totals)
+        requests_sent = totals["requests"] or 1
+        totals["reuse_ratio"] = totals["reused_connections"] / requests_sent
+        totals["mean_time_to_first_byte"] = totals["time_to_first_byte"] / requests_sent
+        return totals
+
+    def close(self) -> None:
+        """Closes every pooled connection, along with the cache and the archive"""
+        self.session.close()
+        # The cache writes the access times it batched when it's closed
+        if self.cache is not None:
+            self.cache.close()
+        if self.archive is not None:
+            self.archive.close()
+
+    def _record(self, stats: FetchStats) -> None:
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["reused_connections"] += stats.connection_reused
+            self._totals["bytes_received"] += stats.bytes_received
+            self._totals["bytes_decoded"] += stats.bytes_decoded
+            self._totals["time_to_first_byte"] += stats.time_to_first_byte
+            self._totals["total_time"] += stats.total_time
+        get_metrics().record_fetch(stats)
+
+        if self.on_stats is not None:
+            self.on_stats(stats)
+
+
+_fetcher: Fetcher | None = None
+_fetcher_lock = threading.Lock()
+
+
+def default_fetcher(
+    rate: float | None = DEFAULT_RATE, pool_maxsize: int = DEFAULT_POOL_MAXSIZE
+) -> Fetcher:
+    """
+    Creates a fetcher with the HTTP cache and the archive of the project
+
+    :param rate: The maximum number of requests per second, the rate limiter's
+        default if not given
+
+    :param pool_maxsize: The maximum number of connections kept open per host
+
+    :return: The new **Fetcher**
+    """
+    rate_limiter = None
+    if rate is not None:
+        rate_limiter = AdaptiveRateLimiter(
+            initial_rate=min(rate, DEFAULT_INITIAL_RATE), max_rate=rate
+        )
+    return Fetcher(
+        pool_maxsize=pool_maxsize,
+        cache=HttpCache(DEFAULT_CACHE_DIR) if DEFAULT_CACHE_DIR else None,
+        rate_limiter=rate_limiter,
+        archive=PageArchive(DEFAULT_ARCHIVE_DIR) if DEFAULT_ARCHIVE_DIR else None,
+    )
+
+
+def get_fetcher() -> Fetcher:
+    """
+    Gets the fetcher shared by the scraper functions, creating it on first use
+
+    :return: The shared **Fetcher**
+    """
+    global _fetcher  # pylint: disable=global-statement
+
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = default_fetcher()
+            # Scripts never close it themselves
+            atexit.register(_fetcher.close)
+        return _fetcher
+
+
+def set_fetcher(fetcher: Fetcher) -> None:
+    """
+    Replaces the fetcher shared by the scraper functions
+
+    :param fetcher: The **Fetcher** to use from now on
+    """
+    global _fetcher  # pylint: disable=global-statement
+
+    with _fetcher_lock:
+        _fetcher = fetcher
@@ -0,0 +1,245 @@
+"""A persistent crawl frontier so that an interrupted crawl can resume where it stopped"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List
+
+PENDING = "pending"
+IN_FLIGHT = "in-flight"
+DONE = "done"
+FAILED = "failed"
+
+
+class Frontier:
+    """
+    A SQLite-backed queue of the URLs of a crawl and the state of each one
+
+    Every URL has a kind (``"makers"``, ``"listing"`` or ``"device"``), an
+    optional parent (e.g. the brand id of a listing page) and a position used
+    to keep the results in page order. The result of a URL is stored with it
+    when it's done, so a resumed crawl doesn't need to fetch it again.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The path of the SQLite file, created if it doesn't exist
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                parent TEXT,
+                position INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS urls_state"
+            " ON urls (kind, parent, state, position)"
+        )
+        self._connection.commit()
+
+    def add(
+        self, url: str, kind: str, parent: str | None = None, position: int = 0
+    ) -> bool:
+        """
+        Queues the URL unless it's already in the frontier
+
+        :param url: The URL to crawl
+
+        :param kind: The kind of page the URL points to
+
+        :param parent: The id of the parent, e.g. the brand of a listing page
+
+        :param position: The position of the page among the pages of its parent
+
+        :return: True if the URL was added
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO urls"
+                " (url, kind, parent, position, state, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (url, kind, parent, position, PENDING, time.time()),
+            )
+            self._connection.commit()
+        return cursor.rowcount > 0
+
+    def claim(
+        self, kind: str, parent: str | None = None, limit: int = 1
+    ) -> List[str]:
+        """
+        Marks pending URLs as in flight and returns them
+
+        :param kind: The kind of pages to claim
+
+        :param parent: Only claim the pages of this parent
+
+        :param limit: The maximum number of URLs to claim
+
+        :return: The claimed URLs in page order
+        """
+        query = "SELECT url FROM urls WHERE kind = ? AND state = ?"
+        params: List[Any] = [kind, PENDING]
+        if parent is not None:
+            query += " AND parent = ?"
+            params.append(parent)
+        query += " ORDER BY position LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            urls = [url for (url,) in self._connection.execute(query, params)]
+            self._connection.executemany(
+                "UPDATE urls SET state = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE url = ?",
+                [(IN_FLIGHT, time.time(), url) for url in urls],
+            )
+            self._connection.commit()
+        return urls
+
+    def complete(self, url: str, result: Any = None) -> None:
+        """
+        Marks the URL as done and stores its result
+
+        :param url: The URL that was crawled
+
+        :param result: A JSON serializable result of the page
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE urls SET state = ?, result = ?, error = NULL, updated_at = ?"
+                " WHERE url = ?",
+                (DONE, json.dumps(result), time.time(), url),
+            )
+            self._connection.commit()
+
+    def fail(self, url: str, error: str) -> None:
+        """
+        Marks the URL as failed
+
+        :param url: The URL that couldn't be crawled
+
+        :param error: A description of the error
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE urls SET state = ?, error = ?, updated_at = ? WHERE url = ?",
+                (FAILED, error, time.time(), url),
+            )
+            self._connection.commit()
+
+    def retry_failed(self, kind: str | None = None) -> int:
+        """
+        Puts the failed URLs back in the queue
+
+        :param kind: Only retry the pages of this kind
+
+        :return: The number of URLs queued again
+        """
+        return self._reset(FAILED, kind)
+
+    def recover(self) -> int:
+        """
+        Puts the URLs left in flight by a crashed run back in the queue
+
+        :return: The number of URLs queued again
+        """
+        return self._reset(IN_FLIGHT, None)
+
+    def state(self, url: str) -> str | None:
+        """
+        :param url: The URL to look up
+
+        :return: The state of the URL, None if it isn't in the frontier
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def result(self, url: str) -> Any:
+        """
+        :param url: The URL to look up
+
+        :return: The stored result of the URL, None if it isn't done
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result FROM urls WHERE url = ? AND state = ?", (url, DONE)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def results(self, kind: str, parent: str | None = None) -> List[Any]:
+        """
+        Gets the stored results of the done pages in page order
+
+        :param kind: The kind of pages
+
+        :param parent: Only get the results of the pages of this parent
+
+        :return: The results of the pages
+        """
+        query = "SELECT result FROM urls WHERE kind = ? AND state = ?"
+        params: List[Any] = [kind, DONE]
+        if parent is not None:
+            query += " AND parent = ?"
+            params.append(parent)
+        query += " ORDER BY position"
+
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+        return [json.loads(result) for (result,) in rows]
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """
+        :return: The number of URLs of each kind in each state
+        """
+        counts: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT kind, state, COUNT(*) FROM urls GROUP BY kind, state"
+            ).fetchall()
+        for kind, state, count in rows:
+            counts.setdefault(kind, {})[state] = count
+        return counts
+
+    def clear(self) -> None:
+        """Forgets every URL, so the next crawl starts from scratch"""
+        with self._lock:
+            self._connection.execute("DELETE FROM urls")
+            self._connection.commit()
+
+    def close(self) -> None:
+        """Closes the SQLite file"""
+        with self._lock:
+            self._connection.close()
+
+    def _reset(self, state: str, kind: str | None) -> int:
+        query = "UPDATE urls SET state = ?, updated_at = ? WHERE state = ?"
+        params: List[Any] = [PENDING, time.time(), state]
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+
+        with self._lock:
+            cursor = self._connection.execute(query, params)
+            self._connection.commit()
+        return cursor.rowcount
@@ -1,27 +1,125 @@
 """Helper functions for the project"""
 
+import os
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
 from bs4 import BeautifulSoup, Tag
-import requests
+from lxml.html import HtmlElement
+
+from utils.fetcher import get_fetcher
+from utils.lxml_extractor import parse_html
+from utils.memory_cache import get_memory_cache
+from utils.metrics import get_metrics
+
+# Set GSMARENA_BASE_URL to crawl a mirror or a local stand-in of the site
+_base_url = (
+    os.environ.get("GSMARENA_BASE_URL", "https://www.gsmarena.com").rstrip("/") + "/"
+)
+
+# The memory a parsed page takes per character of its HTML, measured on the
+# saved pages of benchmarks/fixtures, charged to the memory cache
+DOCUMENT_SIZE_FACTOR = 35
+TREE_SIZE_FACTOR = 16
+
+
+def get_base_url() -> str:
+    """
+    Gets the URL the links of the site are relative to
+
+    :return: The base URL, ending with a slash
+    """
+    return _base_url
+
+
+def set_base_url(base_url: str) -> None:
+    """
+    Changes the URL the links of the site are relative to, e.g. to crawl a local server
+
+    :param base_url: The new base URL
+    """
+    global _base_url  # pylint: disable=global-statement
+
+    _base_url = base_url.rstrip("/") + "/"
+
+
+def absolute_link(href: str) -> str:
+    """
+    Makes a link of the site absolute
+
+    :param href: The link relative to the root of the site, e.g. ``makers.php3``
+
+    :return: The absolute link
+    """
+    return _base_url + href
+
+
+def canonical_link(link: str) -> str:
+    """
+    Normalizes a link of the site, so the same page always has the same link
+
+    Relative links are resolved against the base URL, the scheme and host
+    are lowercased and the fragment is dropped, e.g. ``apple_iphone_16-13317.php#top``
+    becomes ``https://www.gsmarena.com/apple_iphone_16-13317.php``.
+
+    :param link: A relative or absolute link
+
+    :return: The canonical absolute link
+    """
+    scheme, netloc, path, query, _ = urlsplit(urljoin(_base_url, link.strip()))
+    return urlunsplit((scheme.lower(), netloc.lower(), path, query, ""))
+
+
+def get_html(link: str) -> str:
+    """
+    Gets the HTML of the page through the shared pooled fetcher
+
+    :param link: The link to the page
+
+    :return: The HTML of the page
+    """
+
+    return get_fetcher().get_text(link)
 
 
 def get_document(link: str) -> BeautifulSoup:
     """
-    Gets the document of the page
+    Gets the document of the page through the shared pooled fetcher
+
+    The document is kept in the shared memory cache, see utils.memory_cache,
+    so it must not be modified.
 
     :param link: The link to the page
 
     :return: The document of the page as a BeautifulSoup object
     """
 
-    response = requests.get(
-        url=link,
-        headers={
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
-        },
-        timeout=10,
-    )
+    def load():
+        page = get_html(link)
+        with get_metrics().timer("parse"):
+            return BeautifulSoup(page, "lxml"), len(page) * DOCUMENT_SIZE_FACTOR
+
+    return get_memory_cache().get(("document", link), load)
+
+
+def get_tree(link: str) -> HtmlElement:
+    """
+    Gets the lxml tree of the page through the shared pooled fetcher
+
+    The tree is kept in the shared memory cache, see utils.memory_cache, so
+    the extractors of utils.lxml_extractor can all run on a single parse of
+    the page. It must not be modified.
+
+    :param link: The link to the page
+
+    :return: The root element of the page
+    """
+
+    def load():
+        page = get_html(link)
+        with get_metrics().timer("parse"):
+            return parse_html(page), len(page) * TREE_SIZE_FACTOR
 
-    return BeautifulSoup(response.text, "lxml")
+    return get_memory_cache().get(("tree", link), load)
 
 
 def next_page_link(document: BeautifulSoup | Tag) -> str | None:
@@ -39,4 +137,4 @@ def next_page_link(document: BeautifulSoup | Tag) -> str | None:
 
     if next_page is None:
         return None
-    return "https://www.gsmarena.com/" + next_page.get("href", None)
+    return canonical_link(next_page.get("href", None))
@@ -0,0 +1,396 @@
+"""Downloads the device images into a content-addressed store and makes thumbnails
+
+Every image is stored once under the SHA-256 of its bytes,
+``<directory>/objects/ab/abcdef....jpg``, however many devices link to it.
+A manifest maps each link to its hash along with the ETag and Last-Modified
+of the response, so a re-run revalidates the images with conditional
+requests and skips the ones that didn't change.
+
+Thumbnails need the optional **Pillow** package: ``pip install Pillow``
+"""
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+from utils.fetcher import Fetcher
+from utils.ratelimit import AdaptiveRateLimiter
+
+DEFAULT_WORKERS = 8
+# Images are served by a CDN, which takes a much faster pace than the site
+DEFAULT_IMAGE_RATE = 20.0
+
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+
+def _pillow():
+    try:
+        from PIL import Image  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise ImportError(
+            "Thumbnails need the Pillow package: pip install Pillow"
+        ) from error
+    return Image
+
+
+def make_thumbnail(source: str, destination: str, width: int) -> str:
+    """
+    Resizes an image to a width, keeping its aspect ratio
+
+    Runs in the worker processes, so it has to be importable at module level.
+
+    :param source: The path of the image
+
+    :param destination: The path of the thumbnail, written as JPEG
+
+    :param width: The width of the thumbnail in pixels
+
+    :return: The path of the thumbnail
+    """
+    image_module = _pillow()
+    with image_module.open(source) as image:
+        image.thumbnail((width, width * 10))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # Named after the process, in case another one writes the same thumbnail
+        temporary = f"{destination}.{os.getpid()}.tmp"
+        image.save(temporary, "JPEG", quality=85, optimize=True)
+    os.replace(temporary, destination)
+    return destination
+
+
+@dataclass
+class ImageResult:
+    """The outcome of storing one image"""
+
+    url: str
+    sha256: str | None
+    path: str | None
+    status: str
+    """``"new"``, ``"unchanged"`` (304 or same bytes) or ``"failed"``"""
+    error: str | None = None
+
+
+class ImageStore:
+    """
+    A content-addressed store of images with a manifest of where each came from
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory of the store, created if it doesn't exist
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(directory, "manifest.sqlite"), check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS images (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                extension TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.commit()
+
+    def object_path(self, sha256: str, extension: str) -> str:
+        """
+        :param sha256: The hash of the image
+
+        :param extension: The extension of the image, e.g. ``.jpg``
+
+        :return: The path the image is stored at
+        """
+        return os.path.join(
+            self.directory, "objects", sha256[:2], sha256 + extension
+        )
+
+    def thumbnail_path(self, sha256: str, width: int) -> str:
+        """
+        :param sha256: The hash of the image
+
+        :param width: The width of the thumbnail
+
+        :return: The path the thumbnail is stored at
+        """
+        return os.path.join(
+            self.directory, "thumbnails", str(width), sha256[:2], sha256 + ".jpg"
+        )
+
+    def lookup(self, url: str) -> Dict[str, str] | None:
+        """
+        :param url: The link of the image
+
+        :return: The sha256, extension, etag and last_modified stored for the link
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sha256, extension, etag, last_modified FROM images"
+                " WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("sha256", "extension", "etag", "last_modified"), row))
+
+    def local_path(self, url: str) -> str | None:
+        """
+        :param url: The link of the image
+
+        :return: The path of the stored image, None if it wasn't downloaded
+        """
+        entry = self.lookup(url)
+        if entry is None:
+            return None
+        return self.object_path(entry["sha256"], entry["extension"])
+
+    def put(
+        self,
+        url: str,
+        content: bytes,
+        content_type: str | None,
+        etag: str | None,
+        last_modified: str | None,
+    ) -> ImageResult:
+        """
+        Stores the bytes of an image, unless the same bytes are already stored
+
+        :return: The hash and path of the image
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        extension = _extension(url, content_type)
+        path = self.object_path(sha256, extension)
+
+        new = not os.path.exists(path)
+        if new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name so a crash never leaves half an image
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(content)
+            os.replace(temporary, path)
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO images"
+                " (url, sha256, extension, etag, last_modified, size, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, sha256, extension, etag, last_modified, len(content), time.time()),
+            )
+            self._connection.commit()
+        return ImageResult(url, sha256, path, "new" if new else "unchanged")
+
+    def touch(self, url: str) -> None:
+        """
+        Records that an image was revalidated
+
+        :param url: The link of the image
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE images SET fetched_at = ? WHERE url = ?", (time.time(), url)
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        """Closes the manifest"""
+        with self._lock:
+            self._connection.close()
+
+
+def _extension(url: str, content_type: str | None) -> str:
+    if content_type:
+        extension = _EXTENSIONS.get(content_type.split(";")[0].strip().lower())
+        if extension:
+            return extension
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    return extension if extension in _EXTENSIONS.values() else ".jpg"
+
+
+class ImagePipeline:
+    """
+    Downloads images on a bounded thread pool and makes thumbnails on a process pool
+
+    At most ``workers * 2`` downloads are queued at a time, so the links can
+    come from a generator over the whole catalog.
+    """
+
+    def __init__(
+        self,
+        store: ImageStore,
+        workers: int = DEFAULT_WORKERS,
+        thumbnail_widths: Sequence[int] = (),
+        thumbnail_workers: int | None = None,
+        fetcher: Fetcher | None = None,
+    ):
+        """
+        :param store: The store to put the images in
+
+        :param workers: The number of threads downloading images
+
+        :param thumbnail_widths: The widths of the thumbnails to make, none by default
+
+        :param thumbnail_workers: The number of processes making thumbnails,
+            defaults to the number of cores
+
+        :param fetcher: Sends the requests, a fetcher with its own rate limiter by default
+        """
+        if thumbnail_widths:
+            # Fail before downloading anything rather than in the workers
+            _pillow()
+
+        self.store = store
+        self.workers = workers
+        self.thumbnail_widths = tuple(thumbnail_widths)
+        self.thumbnail_workers = thumbnail_workers or os.cpu_count() or 1
+        self.fetcher = fetcher or Fetcher(
+            pool_maxsize=workers,
+            rate_limiter=AdaptiveRateLimiter(
+                initial_rate=DEFAULT_IMAGE_RATE,
+                max_rate=DEFAULT_IMAGE_RATE * 2,
+                burst=workers,
+            ),
+        )
+
+    def download(self, url: str) -> ImageResult:
+        """
+        Downloads an image, revalidating the stored one if there is one
+
+        :param url: The link of the image
+
+        :return: The outcome, failures are returned rather than raised
+        """
+        try:
+            entry = self.store.lookup(url)
+            headers = {}
+            if entry is not None and os.path.exists(
+                self.store.object_path(entry["sha256"], entry["extension"])
+            ):
+                if entry["etag"]:
+                    headers["If-None-Match"] = entry["etag"]
+                if entry["last_modified"]:
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+            response = self.fetcher.fetch(url, headers or None)
+            if response.status_code == 304 and entry is not None:
+                self.store.touch(url)
+                return ImageResult(
+                    url,
+                    entry["sha256"],
+                    self.store.object_path(entry["sha256"], entry["extension"]),
+                    "unchanged",
+                )
+            response.raise_for_status()
+
+            return self.store.put(
+                url,
+                response.content,
+                response.headers.get("Content-Type"),
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            return ImageResult(url, None, None, "failed", repr(error))
+
+    def run(self, urls: Iterable[str]) -> Iterator[ImageResult]:
+        """
+        Downloads every image once and makes the missing thumbnails
+
+        :param urls: The links of the images, duplicates are only downloaded once
+
+        :return: A generator that yields the outcome of each image as it's stored
+        """
+        seen: Set[str] = set()
+        pending: Set[Future] = set()
+        thumbnails: Set[Future] = set()
+        # (sha256, width) of the thumbnails already submitted, links to the
+        # same image only make its thumbnails once
+        submitted: Set[Tuple[str, int]] = set()
+
+        thumbnail_pool = (
+            ProcessPoolExecutor(max_workers=self.thumbnail_workers)
+            if self.thumbnail_widths
+            else None
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for url in urls:
+                    if not url or url in seen:
+                        continue
+                    seen.add(url)
+                    pending.add(pool.submit(self.download, url))
+
+                    if len(pending) >= self.workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield self._finish(
+                                future.result(), thumbnail_pool, thumbnails, submitted
+                            )
+
+                for future in pending:
+                    yield self._finish(
+                        future.result(), thumbnail_pool, thumbnails, submitted
+                    )
+
+            for future in thumbnails:
+                future.result()
+        finally:
+            if thumbnail_pool is not None:
+                thumbnail_pool.shutdown()
+
+    def _finish(
+        self,
+        result: ImageResult,
+        thumbnail_pool: ProcessPoolExecutor | None,
+        thumbnails: Set[Future],
+        submitted: Set[Tuple[str, int]],
+    ) -> ImageResult:
+        if thumbnail_pool is None or result.sha256 is None:
+            return result
+        for width in self.thumbnail_widths:
+            if (result.sha256, width) in submitted:
+                continue
+            submitted.add((result.sha256, width))
+            destination = self.store.thumbnail_path(result.sha256, width)
+            # Thumbnails are named after the image, so existing ones are current
+            if not os.path.exists(destination):
+                thumbnails.add(
+                    thumbnail_pool.submit(make_thumbnail, result.path, destination, width)
+                )
+
+        # Only keeps the thumbnails in progress, raising the errors of the
+        # finished ones, and waits for some once the pool is well behind
+        done = {future for future in thumbnails if future.done()}
+        if len(thumbnails) - len(done) >= self.thumbnail_workers * 4:
+            done |= wait(thumbnails - done, return_when=FIRST_COMPLETED).done
+        thumbnails -= done
+        for future in done:
+            future.result()
+        return result
@@ -0,0 +1,161 @@
+"""Streaming JSON Lines writer and lazy reader, optionally gzip or zstd compressed"""
+
+from collections.abc import Iterator
+import gzip
+import io
+import json
+import os
+from typing import IO, Any, Dict
+
+from utils.writers import temp_path
+
+DEFAULT_BATCH_SIZE = 1000
+
+EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _zstandard():
+    try:
+        import zstandard  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise ImportError(
+            "zstd compression needs the zstandard package: pip install zstandard"
+        ) from error
+    return zstandard
+
+
+def _open_binary(path: str, mode: str, compression: str | None) -> IO[bytes]:
+    if compression is None:
+        return open(path, mode + "b")
+    if compression == "gzip":
+        return gzip.open(path, mode + "b")
+    if compression == "zstd":
+        return _zstandard().open(path, mode + "b")
+    raise ValueError(f"Unknown compression {compression!r}, use gzip or zstd")
+
+
+class JsonLinesWriter:
+    """
+    Appends records to a JSON Lines file as they come, one JSON object per line
+
+    Records are encoded right away and written in batches of ``batch_size``,
+    so memory use stays flat no matter how many records are written. Unless
+    appending, the records go to a temporary file moved over ``path`` on
+    close, so a run that crashes leaves the previous file as it was. With
+    ``partial`` the temporary file is ``<path>.partial``, so the records of a
+    long run can be followed as they are written, and it's kept if the run
+    stops. Use it as a context manager so the last batch is flushed::
+
+        with JsonLinesWriter("devices.jsonl.gz", compression="gzip") as writer:
+            for device in devices:
+                writer.write(device.to_dict())
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compression: str | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        append: bool = False,
+        partial: bool = False,
+    ):
+        """
+        :param path: The path of the file
+
+        :param compression: ``"gzip"``, ``"zstd"`` or None for plain text
+
+        :param batch_size: The number of records buffered before they are written
+
+        :param append: Add to the end of an existing file instead of replacing it
+
+        :param partial: Write to ``<path>.partial`` instead of a hidden temporary
+            file, kept if the writer is aborted
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.records_written = 0
+
+        # Records appended to a file are visible as they are flushed
+        self._temp = None
+        if not append:
+            self._temp = f"{path}.partial" if partial else temp_path(path)
+        self._partial = partial
+        self._file = _open_binary(
+            self._temp or path, "a" if append else "w", compression
+        )
+        self._batch: list[str] = []
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """
+        Buffers the record, writing the batch once it's full
+
+        :param record: A JSON serializable dictionary
+        """
+        self._batch.append(json.dumps(record, ensure_ascii=False))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered records to the file"""
+        if self._batch:
+            self._file.write(("\n".join(self._batch) + "\n").encode("utf-8"))
+            self.records_written += len(self._batch)
+            self._batch.clear()
+        self._file.flush()
+
+    def close(self) -> None:
+        """Flushes the buffered records and closes the file, moving it in place"""
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        if self._temp:
+            os.replace(self._temp, self.path)
+
+    def abort(self) -> None:
+        """
+        Closes the file, discarding the records unless appending, the
+        records flushed to a ``partial`` file are kept there
+        """
+        if self._file.closed:
+            return
+        self._batch.clear()
+        self._file.close()
+        if self._temp and not self._partial:
+            os.remove(self._temp)
+
+    def __enter__(self) -> "JsonLinesWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily reads the records of a JSON Lines file, detecting its compression
+
+    :param path: The path of the file
+
+    :return: A generator that yields one dictionary per line
+    """
+    with open(path, "rb") as file:
+        magic = file.read(4)
+
+    if magic.startswith(_GZIP_MAGIC):
+        compression = "gzip"
+    elif magic.startswith(_ZSTD_MAGIC):
+        compression = "zstd"
+    else:
+        compression = None
+
+    with _open_binary(path, "r", compression) as file:
+        for line in io.TextIOWrapper(file, encoding="utf-8"):
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,323 @@
+"""Single-pass extraction of device data straight from the page's HTML with **lxml**
+
+The functions in :mod:`utils.extractor` build a **BeautifulSoup** tree and then
+walk it once for every field. The functions here parse the page with lxml
+and visit every element of the relevant subtree exactly once, picking the
+``data-spec`` nodes listed in a declarative table. Their output is identical
+to the **BeautifulSoup** versions.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+from lxml import etree, html as lxml_html
+
+from utils.classes import DeviceDetails, DeviceSpecs, DeviceSpecTable
+from utils.resilience import ExtractionError
+from utils.spec_schema import column_name
+
+
+# (tag, data-spec) -> field of DeviceDetails, searched in the whole document
+DEVICE_DETAILS_FIELDS: Dict[Tuple[str, str], str] = {
+    ("h1", "modelname"): "model_name",
+    ("span", "released-hl"): "released",
+    ("span", "body-hl"): "body",
+    ("span", "os-hl"): "os",
+    ("span", "storage-hl"): "storage",
+    ("span", "displaysize-hl"): "display_size",
+    ("span", "displayres-hl"): "display_res",
+    ("span", "camerapixels-hl"): "camera_pixels",
+    ("span", "videopixels-hl"): "video_pixels",
+    ("span", "ramsize-hl"): "ram_size",
+    ("span", "chipset-hl"): "chipset",
+    ("span", "batsize-hl"): "battery_size",
+    ("span", "battype-hl"): "battery_type",
+}
+
+# field of DeviceDetails -> field holding the text of the <span> following it
+DEVICE_DETAILS_UNITS: Dict[str, str] = {
+    "camera_pixels": "camera_pixel_unit",
+    "ram_size": "ram_size_unit",
+    "battery_size": "battery_size_unit",
+}
+
+# (tag, data-spec) -> field of DeviceSpecs, searched inside div#specs-list
+DEVICE_SPECS_FIELDS: Dict[Tuple[str, str], str] = {
+    ("h1", "modelname"): "model_name",
+    ("p", "comment"): "comment",
+    ("a", "nettech"): "network_technology",
+    ("td", "speed"): "network_speed",
+    ("td", "year"): "launch_announced",
+    ("td", "status"): "launch_status",
+    ("td", "dimensions"): "body_dimensions",
+    ("td", "weight"): "body_weight",
+    ("td", "build"): "body_build",
+    ("td", "sim"): "body_sim",
+    ("td", "bodyother"): "body_other",
+    ("td", "displaytype"): "display_type",
+    ("td", "displaysize"): "display_size",
+    ("td", "displayresolution"): "display_resolution",
+    ("td", "displayprotection"): "display_protection",
+    ("td", "displayother"): "display_other",
+    ("td", "os"): "platform_os",
+    ("td", "chipset"): "platform_chipset",
+    ("td", "cpu"): "platform_cpu",
+    ("td", "gpu"): "platform_gpu",
+    ("td", "memoryslot"): "memory_card_slot",
+    ("td", "internalmemory"): "memory_internal",
+    ("td", "memoryother"): "memory_other",
+    ("td", "cam1modules"): "main_camera_specs",
+    ("td", "cam1features"): "main_camera_features",
+    ("td", "cam1video"): "main_camera_video",
+    ("td", "cam2modules"): "selfie_camera_specs",
+    ("td", "cam2features"): "selfie_camera_features",
+    ("td", "cam2video"): "selfie_camera_video",
+    ("td", "wlan"): "comms_wlan",
+    ("td", "bluetooth"): "comms_bluetooth",
+    ("td", "gps"): "comms_gps",
+    ("td", "nfc"): "comms_nfc",
+    ("td", "radio"): "comms_radio",
+    ("td", "usb"): "comms_usb",
+    ("td", "sensors"): "features_sensors",
+    ("td", "featuresother"): "features_other",
+    ("td", "batdescription1"): "battery_type",
+    ("td", "colors"): "misc_colors",
+    ("td", "models"): "misc_models",
+    ("td", "price"): "misc_price",
+}
+
+# href of the glossary link -> field of DeviceSpecs holding the camera type
+DEVICE_SPECS_CAMERA_TYPES: Dict[str, str] = {
+    "glossary.php3?term=camera": "main_camera_type",
+    "glossary.php3?term=secondary-camera": "selfie_camera_type",
+}
+
+_CAMERA_TYPE = re.compile(r"Single|Dual|Triple|Quad")
+
+
+def parse_html(page: str | bytes) -> lxml_html.HtmlElement:
+    """
+    Parses the page once so that both extractors can share the tree
+
+    :param page: The HTML of the page
+
+    :return: The root element of the page
+    """
+    return lxml_html.document_fromstring(page)
+
+
+def _text(element: etree.ElementBase | None) -> str | None:
+    """Concatenated text of the element, the same as **BeautifulSoup**'s ``.text``"""
+    if element is None:
+        return None
+    return "".join(element.itertext())
+
+
+def _has_class(element: etree.ElementBase, name: str) -> bool:
+    return name in element.get("class", "").split()
+
+
+def _single_string(element: etree.ElementBase) -> str | None:
+    """The only string inside the element, like **BeautifulSoup**'s ``.string``"""
+    if len(element) == 0:
+        return element.text
+    if len(element) == 1 and not element.text and not element[0].tail:
+        return _single_string(element[0])
+    return None
+
+
+def _image_src(container: etree.ElementBase | None) -> str | None:
+    if container is None:
+        return None
+    img = next(container.iter("img"), None)
+    if img is None:
+        return None
+    return img.get("src", None)
+
+
+def _lines(element: etree.ElementBase) -> List[str]:
+    """The text of the element split on its ``<br>``, without the blank lines"""
+    lines = []
+    line = [element.text or ""]
+    for child in element:
+        if child.tag == "br":
+            lines.append("".join(line))
+            line = []
+        elif isinstance(child.tag, str):
+            line.append(_text(child))
+        line.append(child.tail or "")
+    lines.append("".join(line))
+    return [text for text in (line.strip() for line in lines) if text]
+
+
+def device_details_from_html(page: str | bytes | etree.ElementBase) -> DeviceDetails:
+    """
+    Extract the device details from the header content of the device page
+
+    Args:
+        page (str | bytes | HtmlElement): The HTML of the device page or its parsed tree
+
+    Returns:
+        DeviceDetails: A dataclass containing the header content of the device page
+
+    Raises:
+        ExtractionError: If the page has no model name, i.e. it isn't a device page
+    """
+    root = parse_html(page) if isinstance(page, (str, bytes)) else page
+
+    nodes: Dict[str, etree.ElementBase] = {}
+    photo = None
+    for element in root.iter(etree.Element):
+        tag = element.tag
+        if tag == "div" and photo is None and _has_class(element, "specs-photo-main"):
+            photo = element
+
+        data_spec = element.get("data-spec")
+        if data_spec is None:
+            continue
+        field = DEVICE_DETAILS_FIELDS.get((tag, data_spec))
+        if field is None or field in nodes:
+            continue
+        if field == "model_name" and not _has_class(element, "specs-phone-name-title"):
+            continue
+        nodes[field] = element
+
+    values = {field: _text(node) for field, node in nodes.items()}
+    for field, unit_field in DEVICE_DETAILS_UNITS.items():
+        node = nodes.get(field)
+        unit = next(node.itersiblings("span"), None) if node is not None else None
+        values[unit_field] = _text(unit)
+
+    model_name = values.pop("model_name", None)
+    if model_name is None:
+        raise ExtractionError("The page has no model name")
+    released = values.pop("released", None)
+    return DeviceDetails(
+        model_name=model_name,
+        img_link=_image_src(photo),
+        released=released,
+        **values,
+    )
+
+
+def device_specs_from_html(page: str | bytes | etree.ElementBase) -> DeviceSpecs:
+    """
+    Extract the device specs from the specs list of the device page
+
+    Args:
+        page (str | bytes | HtmlElement): The HTML of the device page or its parsed tree
+
+    Returns:
+        DeviceSpecs: dataclass containing the device specs
+
+    Raises:
+        ExtractionError: If the page has no specs list or no model name
+    """
+    root = parse_html(page) if isinstance(page, (str, bytes)) else page
+    specs_list = next(
+        (div for div in root.iter("div") if div.get("id") == "specs-list"), None
+    )
+    if specs_list is None:
+        raise ExtractionError("The page has no specs list")
+
+    nodes: Dict[str, etree.ElementBase] = {}
+    photo = None
+    for element in specs_list.iter(etree.Element):
+        tag = element.tag
+        if tag == "div" and photo is None and _has_class(element, "specs-photo-main"):
+            photo = element
+        elif tag == "a" and element.get("href") in DEVICE_SPECS_CAMERA_TYPES:
+            field = DEVICE_SPECS_CAMERA_TYPES[element.get("href")]
+            string = _single_string(element)
+            if field not in nodes and string and _CAMERA_TYPE.search(string):
+                nodes[field] = element
+
+        data_spec = element.get("data-spec")
+        if data_spec is None:
+            continue
+        field = DEVICE_SPECS_FIELDS.get((tag, data_spec))
+        if field is not None and field not in nodes:
+            nodes[field] = element
+
+    values = {field: _text(node) for field, node in nodes.items()}
+    model_name = values.pop("model_name", None)
+    if model_name is None:
+        raise ExtractionError("The page has no model name")
+    return DeviceSpecs(model_name=model_name, img_link=_image_src(photo), **values)
+
+
+def device_spec_table_from_html(
+    page: str | bytes | etree.ElementBase,
+) -> DeviceSpecTable:
+    """
+    Extract every row of the specs list of the device page, in a single pass
+
+    Each row is keyed by the column of its section and label, see
+    utils.spec_schema. A row without a label continues the one above it, and
+    the camera type in the label of the first camera row, e.g. "Triple",
+    goes to a column of its own, ``main_camera_type``, its modules to
+    ``main_camera_modules``.
+
+    Args:
+        page (str | bytes | HtmlElement): The HTML of the device page or its parsed tree
+
+    Returns:
+        DeviceSpecTable: dataclass containing every spec of the device
+
+    Raises:
+        ExtractionError: If the page has no specs list or no model name
+    """
+    root = parse_html(page) if isinstance(page, (str, bytes)) else page
+    specs_list = next(
+        (div for div in root.iter("div") if div.get("id") == "specs-list"), None
+    )
+    if specs_list is None:
+        raise ExtractionError("The page has no specs list")
+
+    specs: Dict[str, List[str]] = {}
+    model_name = None
+    photo = None
+    section = ""
+    column = None
+    # lxml filters the tags, the cells and their contents aren't visited twice
+    for element in specs_list.iter("div", "h1", "p", "tr"):
+        tag = element.tag
+        if tag == "div":
+            if photo is None and _has_class(element, "specs-photo-main"):
+                photo = element
+        elif tag == "h1" and element.get("data-spec") == "modelname":
+            model_name = model_name or _text(element)
+        elif tag == "p" and element.get("data-spec") == "comment":
+            specs.setdefault("comment", []).extend(_lines(element))
+        elif tag == "tr":
+            label = None
+            for cell in element:
+                if cell.tag == "th":
+                    section = _text(cell).strip()
+                    column = None
+                elif cell.tag != "td":
+                    continue
+                elif _has_class(cell, "ttl"):
+                    label = _text(cell).strip()
+                    link = next(cell.iter("a"), None)
+                    href = link.get("href") if link is not None else None
+                    if href in DEVICE_SPECS_CAMERA_TYPES and _CAMERA_TYPE.search(label):
+                        specs[column_name(section, "Type")] = [label]
+                        label = "Modules"
+                elif _has_class(cell, "nfo"):
+                    if label:
+                        column = column_name(section, label)
+                    if column is not None:
+                        specs.setdefault(column, []).extend(_lines(cell))
+
+    if model_name is None:
+        raise ExtractionError("The page has no model name")
+    return DeviceSpecTable(
+        model_name=model_name,
+        img_link=_image_src(photo),
+        specs={
+            column: lines[0] if len(lines) == 1 else tuple(lines)
+            for column, lines in specs.items()
+            if lines
+        },
+    )
@@ -0,0 +1,183 @@
+"""An in-memory LRU cache of parsed pages, shared by the threads of the process
+
+:mod:`utils.cache` saves the downloads of a page, but every caller still
+reads it back and parses it again. Here the parsed document itself is kept,
+so asking for the brands twice, or for both the details and the specs of a
+device, fetches and parses the page once.
+
+Concurrent callers asking for a page that isn't cached yet share a single
+load instead of each starting their own: the first one loads it and the
+others wait for its result, or its error, which isn't cached.
+
+The cache is bounded by the memory the parsed pages take, as estimated by
+the callers from the size of their HTML: a BeautifulSoup document takes
+about 35 times the HTML, an lxml tree about 16 times. Set
+GSMARENA_MEMORY_CACHE_MB to change the bound, 0 turns the cache off.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+import warnings
+
+from utils.metrics import get_metrics
+
+DEFAULT_MAX_MB = 64
+
+
+def _max_bytes_from_environment() -> int:
+    """
+    :return: The bound set by GSMARENA_MEMORY_CACHE_MB, the default one if
+        it isn't a number
+    """
+    value = os.environ.get("GSMARENA_MEMORY_CACHE_MB")
+    if not value:
+        return DEFAULT_MAX_MB * 1024 * 1024
+    try:
+        return max(0, int(float(value) * 1024 * 1024))
+    except ValueError:
+        warnings.warn(
+            f"GSMARENA_MEMORY_CACHE_MB={value!r} isn't a number,"
+            f" using {DEFAULT_MAX_MB} MB"
+        )
+        return DEFAULT_MAX_MB * 1024 * 1024
+
+
+DEFAULT_MAX_BYTES = _max_bytes_from_environment()
+# Seconds a page is served from memory, so a long run doesn't miss changes
+DEFAULT_TTL = 10 * 60
+
+
+class MemoryCache:
+    """
+    Keeps the most recently used values in memory, up to ``max_bytes`` in total
+
+    Values are loaded by the callable given to :meth:`get`, which returns the
+    value along with its size. The cached values are shared by every caller,
+    so they must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL):
+        """
+        :param max_bytes: The maximum total size of the values kept, 0 turns the
+            cache off, every caller then loads its own value
+
+        :param ttl: The number of seconds a value is kept, however often it's used
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+
+        self._lock = threading.Lock()
+        # key -> (value, size, expires), the least recently used first
+        self._entries: OrderedDict[Hashable, Tuple[Any, int, float]] = OrderedDict()
+        # key -> the result of the load in progress
+        self._loading: Dict[Hashable, Future] = {}
+
+    def get(self, key: Hashable, load: Callable[[], Tuple[Any, int]]) -> Any:
+        """
+        Gets a value, loading it once however many threads ask for it at the same time
+
+        :param key: The key of the value, e.g. ``("document", link)``
+
+        :param load: Loads the value when it isn't cached, returns the value and its size
+
+        :return: The value
+        """
+        if self.max_bytes <= 0:
+            return load()[0]
+
+        metrics = get_metrics()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > time.monotonic():
+                self._entries.move_to_end(key)
+                metrics.increment("memory_cache_total", label="hit")
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+
+            future = self._loading.get(key)
+            loader = future is None
+            if loader:
+                future = self._loading[key] = Future()
+
+        if not loader:
+            metrics.increment("memory_cache_total", label="coalesced")
+            return future.result()
+
+        metrics.increment("memory_cache_total", label="miss")
+        try:
+            value, size = load()
+        except BaseException as error:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(error)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            if size <= self.max_bytes:
+                self._entries[key] = (value, size, time.monotonic() + self.ttl)
+                self.size += size
+                while self.size > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Forgets a value, the next :meth:`get` loads it again
+
+        :param key: The key of the value
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Forgets every value"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+
+_memory_cache: MemoryCache | None = None
+_memory_cache_lock = threading.Lock()
+
+
+def get_memory_cache() -> MemoryCache:
+    """
+    Gets the cache shared by the scraper functions, creating it on first use
+
+    :return: The shared **MemoryCache**
+    """
+    global _memory_cache  # pylint: disable=global-statement
+
+    with _memory_cache_lock:
+        if _memory_cache is None:
+            _memory_cache = MemoryCache()
+        return _memory_cache
+
+
+def set_memory_cache(memory_cache: MemoryCache) -> None:
+    """
+    Replaces the cache shared by the scraper functions
+
+    :param memory_cache: The **MemoryCache** to use from now on
+    """
+    global _memory_cache  # pylint: disable=global-statement
+
+    with _memory_cache_lock:
+        _memory_cache = memory_cache
@@ -0,0 +1,406 @@
+"""Counters, histograms and stage timers for the hot paths of a crawl
+
+Every stage of a crawl (``fetch``, ``parse``, ``extract``, ``write``) is
+timed into a histogram of the shared :class:`Metrics`, along with the size
+and latency of every response. The metrics can be saved as JSON or in the
+Prometheus text format, and a profiler can be hooked to any stage::
+
+    metrics = get_metrics()
+    metrics.add_profiler_hook("parse", cprofile_hook("parse.prof"))
+    ...
+    metrics.write("metrics.prom")
+"""
+
+import atexit
+from bisect import bisect_left
+import contextlib
+import cProfile
+import json
+import threading
+import time
+from typing import Callable, ContextManager, Dict, Iterator, List, Sequence
+
+# Upper bounds of the buckets, an implicit +Inf bucket follows the last one
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+BYTES_BUCKETS = (
+    1024, 4096, 16384, 32768, 65536, 131072, 262144, 524288, 1048576, 4194304
+)
+
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+ProfilerHook = Callable[[str], ContextManager]
+"""Called with the name of a stage, returns a context manager wrapping the stage"""
+
+
+class Histogram:
+    """Counts observations in fixed buckets, like a Prometheus histogram"""
+
+    def __init__(self, buckets: Sequence[float] = SECONDS_BUCKETS):
+        """
+        :param buckets: The sorted upper bounds of the buckets
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        :param value: The value to count
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile from the buckets
+
+        :param q: The quantile, between 0 and 1
+
+        :return: The upper bound of the bucket the quantile falls in,
+            the largest value seen for the last bucket
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, float]:
+        """
+        :return: The count, sum, mean, max, p50 and p99 of the observations
+        """
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """
+    A thread-safe registry of counters and histograms
+
+    Names follow the Prometheus conventions, e.g. ``responses_total`` and
+    ``stage_seconds``. A label, like the stage of a timer, is kept as part of
+    the key so every stage gets its own histogram.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._histograms: Dict[str, Dict[str, Histogram]] = {}
+        self._hooks: Dict[str, List[ProfilerHook]] = {}
+
+    def increment(self, name: str, value: float = 1, label: str = "") -> None:
+        """
+        Adds to a counter
+
+        :param name: The name of the counter
+
+        :param value: The amount to add
+
+        :param label: Keeps a separate count per label, e.g. per status code
+        """
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[label] = counters.get(label, 0) + value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        label: str = "",
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+    ) -> None:
+        """
+        Counts a value in a histogram
+
+        :param name: The name of the histogram
+
+        :param value: The value, e.g. a duration in seconds
+
+        :param label: Keeps a separate histogram per label, e.g. per stage
+
+        :param buckets: The buckets of the histogram when it's created
+        """
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            histogram = histograms.get(label)
+            if histogram is None:
+                histogram = histograms[label] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """
+        Times the enclosed block into the ``stage_seconds`` histogram
+
+        The profiler hooks added for the stage wrap the block too.
+
+        :param stage: The name of the stage, e.g. ``"parse"``
+        """
+        with self._lock:
+            hooks = list(self._hooks.get(stage, ()))
+
+        with contextlib.ExitStack() as stack:
+            for hook in hooks:
+                stack.enter_context(hook(stage))
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe("stage_seconds", time.perf_counter() - start, stage)
+
+    def add_profiler_hook(self, stage: str, hook: ProfilerHook) -> None:
+        """
+        Runs every timed block of a stage inside the context manager of the hook
+
+        :param stage: The name of the stage to profile
+
+        :param hook: Called with the stage name, e.g. :func:`cprofile_hook`
+        """
+        with self._lock:
+            self._hooks.setdefault(stage, []).append(hook)
+
+    def record_fetch(self, stats) -> None:
+        """
+        Records the **FetchStats** of a request, see utils.fetcher
+
+        :param stats: The statistics of the request
+        """
+        self.increment("responses_total", label=str(stats.status_code))
+        self.increment("response_bytes_total", stats.bytes_received)
+        self.observe("response_bytes", stats.bytes_received, buckets=BYTES_BUCKETS)
+        self.observe("time_to_first_byte_seconds", stats.time_to_first_byte)
+        self.observe("stage_seconds", stats.total_time, "fetch")
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict]]:
+        """
+        :return: The counters and a summary of every histogram, keyed by name and label
+        """
+        with self._lock:
+            return {
+                "uptime_seconds": time.time() - self.started_at,
+                "counters": {
+                    name: dict(counters) for name, counters in self._counters.items()
+                },
+                "histograms": {
+                    name: {label: h.to_dict() for label, h in histograms.items()}
+                    for name, histograms in self._histograms.items()
+                },
+            }
+
+    def to_json(self) -> str:
+        """
+        :return: The snapshot as JSON
+        """
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = "gsmarena_") -> str:
+        """
+        Formats the metrics in the Prometheus text exposition format
+
+        :param prefix: Prepended to the name of every metric
+
+        :return: The metrics, ready to be scraped from a file by node_exporter
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, counters in sorted(self._counters.items()):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for label, value in sorted(counters.items()):
+                    lines.append(f"{prefix}{name}{_labels(name, label)} {value:.15g}")
+
+            for name, histograms in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for label, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(
+                        histogram.buckets + (float("inf"),), histogram.counts
+                    ):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:.15g}"
+                        lines.append(
+                            f"{prefix}{name}_bucket{_labels(name, label, le)}"
+                            f" {cumulative}"
+                        )
+                    labels = _labels(name, label)
+                    lines.append(f"{prefix}{name}_sum{labels} {histogram.sum:.15g}")
+                    lines.append(f"{prefix}{name}_count{labels} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Saves the metrics, in the Prometheus format if the path ends with
+        ``.prom`` and as JSON otherwise
+
+        :param path: The path of the file
+        """
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+
+def _labels(name: str, label: str, le: str | None = None) -> str:
+    pairs = []
+    if label:
+        key = "status" if name == "responses_total" else "stage"
+        pairs.append(f'{key}="{label}"')
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def cprofile_hook(path: str) -> ProfilerHook:
+    """
+    Profiles a stage with cProfile, adding up every timed block
+
+    The stats are saved to the path once, when the process exits, open them
+    with ``python -m pstats <path>`` or snakeviz.
+
+    :param path: The path of the stats file
+    """
+    profiler = cProfile.Profile()
+    lock = threading.Lock()
+    profiled = False
+
+    @contextlib.contextmanager
+    def hook(stage: str) -> Iterator[None]:  # pylint: disable=unused-argument
+        nonlocal profiled
+
+        # cProfile can only profile one block at a time, blocks running on
+        # other threads meanwhile are left out
+        if not lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            profiled = True
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+        finally:
+            lock.release()
+
+    def dump() -> None:
+        # Waits for a block in progress, unless it's stuck on a daemon thread
+        locked = lock.acquire(timeout=1)
+        try:
+            if profiled:
+                profiler.dump_stats(path)
+        finally:
+            if locked:
+                lock.release()
+
+    atexit.register(dump)
+    return hook
+
+
+class Progress:
+    """
+    Counts the items done out of a total and prints the rate and ETA now and then
+
+    The snapshot is printed at most every ``interval`` seconds, so it can be
+    updated from a hot loop.
+    """
+
+    def __init__(
+        self,
+        total: int,
+        name: str = "items",
+        interval: float = DEFAULT_PROGRESS_INTERVAL,
+        report: Callable[[str], None] = print,
+    ):
+        """
+        :param total: The number of items to do
+
+        :param name: What the items are, e.g. ``"brands"``
+
+        :param interval: The minimum seconds between two snapshots
+
+        :param report: Called with every snapshot
+        """
+        self.total = total
+        self.name = name
+        self.interval = interval
+        self.report = report
+        self.done = 0
+
+        self._started = time.perf_counter()
+        self._last_report = self._started
+        self._lock = threading.Lock()
+
+    def update(self, count: int = 1) -> None:
+        """
+        :param count: The number of items just done
+        """
+        with self._lock:
+            self.done += count
+            now = time.perf_counter()
+            if now - self._last_report < self.interval and self.done < self.total:
+                return
+            self._last_report = now
+        self.report(self.snapshot())
+
+    def eta(self) -> float | None:
+        """
+        :return: The estimated seconds left at the current rate, None before the first item
+        """
+        elapsed = time.perf_counter() - self._started
+        if not self.done or not elapsed:
+            return None
+        return max(self.total - self.done, 0) / (self.done / elapsed)
+
+    def snapshot(self) -> str:
+        """
+        :return: A line with the items done, the rate and the ETA
+        """
+        elapsed = time.perf_counter() - self._started
+        rate = self.done / elapsed if elapsed else 0.0
+        eta = self.eta()
+        eta_text = (
+            "--:--:--" if eta is None else time.strftime("%H:%M:%S", time.gmtime(eta))
+        )
+        percent = 100 * self.done / self.total if self.total else 100.0
+        return (
+            f"{self.done}/{self.total} {self.name} ({percent:.1f}%),"
+            f" {rate:.2f} {self.name}/s, ETA {eta_text}"
+        )
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """
+    Gets the metrics shared by the fetcher, the scraper functions and the scripts
+
+    :return: The shared **Metrics**
+    """
+    return _metrics
+
+
+def set_metrics(metrics: Metrics) -> None:
+    """
+    Replaces the shared metrics, e.g. to start counting from zero
+
+    :param metrics: The **Metrics** to use from now on
+    """
+    global _metrics  # pylint: disable=global-statement
+
+    _metrics = metrics
@@ -0,0 +1,255 @@
+"""Turns the raw spec strings into typed numeric and date columns
+
+Every function works on whole **pyarrow** columns at once: a regex is run
+over the column by Arrow's compute kernels and the matches are cast in one
+go, instead of parsing each dataclass with a regex of its own. Values that
+don't match (e.g. "Cancelled" release dates or a battery given in Wh) become
+nulls.
+
+Needs the optional **pyarrow** package: ``pip install pyarrow``
+"""
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError as error:
+    raise ImportError(
+        "Normalizing specs needs the pyarrow package: pip install pyarrow"
+    ) from error
+
+_NUMBER = r"(?P<value>\d+(?:\.\d+)?)"
+_MONTHS = [
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+    "August",
+    "September",
+    "October",
+    "November",
+    "December",
+]
+
+
+def _strings(column: pa.ChunkedArray | pa.Array) -> pa.ChunkedArray | pa.Array:
+    """Decodes a dictionary encoded column, the regex kernels take plain strings"""
+    if pa.types.is_dictionary(column.type):
+        return column.cast(pa.string())
+    return column
+
+
+def extract_number(
+    column: pa.ChunkedArray | pa.Array, pattern: str
+) -> pa.ChunkedArray | pa.Array:
+    """
+    Extracts a number from every value of the column
+
+    :param column: A string column
+
+    :param pattern: A regex with a ``value`` group matching the number
+
+    :return: A float64 column, null where the pattern doesn't match
+    """
+    matches = pc.extract_regex(_strings(column), pattern)
+    return pc.cast(pc.struct_field(matches, "value"), pa.float64())
+
+
+def parse_grams(column: pa.ChunkedArray | pa.Array) -> pa.ChunkedArray | pa.Array:
+    """
+    :param column: Weights like "172 g (6.07 oz)" or "172g, 10mm thickness"
+
+    :return: The weights in grams
+    """
+    return extract_number(column, _NUMBER + r"\s*g\b")
+
+
+def parse_inches(column: pa.ChunkedArray | pa.Array) -> pa.ChunkedArray | pa.Array:
+    """
+    :param column: Display sizes like "6.9 inches, 115.6 cm2" or '5.5"'
+
+    :return: The display sizes in inches
+    """
+    return extract_number(column, _NUMBER + r'\s*(?:inches|")')
+
+
+def parse_mah(column: pa.ChunkedArray | pa.Array) -> pa.ChunkedArray | pa.Array:
+    """
+    :param column: Battery descriptions like "Li-Ion 4685 mAh, non-removable"
+
+    :return: The battery capacities in mAh
+    """
+    return extract_number(column, _NUMBER + r"\s*mAh")
+
+
+def parse_ram_gb(column: pa.ChunkedArray | pa.Array) -> pa.ChunkedArray | pa.Array:
+    """
+    Extracts the RAM written right before "RAM"
+
+    That's the first configuration of "256GB 8GB RAM, 512GB 8GB RAM" and the
+    largest one of "3/4 GB RAM".
+
+    :param column: Memory descriptions like the ones above
+
+    :return: The amount of RAM in GB
+    """
+    matches = pc.extract_regex(
+        _strings(column), _NUMBER + r"\s*(?P<unit>[KMGT]B)\s*RAM"
+    )
+    value = pc.cast(pc.struct_field(matches, "value"), pa.float64())
+    unit = pc.struct_field(matches, "unit")
+    scale = pc.case_when(
+        pc.make_struct(
+            pc.equal(unit, "KB"), pc.equal(unit, "MB"), pc.equal(unit, "TB")
+        ),
+        1 / 1024**2,
+        1 / 1024,
+        1024.0,
+        1.0,
+    )
+    return pc.multiply(value, scale)
+
+
+def parse_resolution(
+    column: pa.ChunkedArray | pa.Array,
+) -> tuple[pa.ChunkedArray | pa.Array, ...]:
+    """
+    :param column: Resolutions like "1320 x 2868 pixels, 19.5:9 ratio"
+
+    :return: The width, the height and the number of pixels
+    """
+    matches = pc.extract_regex(
+        _strings(column), r"(?P<width>\d+)\s*x\s*(?P<height>\d+)\s*pixels"
+    )
+    width = pc.cast(pc.struct_field(matches, "width"), pa.int32())
+    height = pc.cast(pc.struct_field(matches, "height"), pa.int32())
+    return width, height, pc.multiply(pc.cast(width, pa.int64()), height)
+
+
+def parse_release_date(
+    column: pa.ChunkedArray | pa.Array,
+) -> pa.ChunkedArray | pa.Array:
+    """
+    Parses release dates, using the first day of the period when it's not exact
+
+    "Released 2022, May 31" becomes 2022-05-31, "2022, February" 2022-02-01,
+    "Released 2021, Q2" 2021-04-01 and "2019" 2019-01-01.
+
+    :param column: Release or announcement dates as listed on gsmarena
+
+    :return: A date32 column
+    """
+    matches = pc.extract_regex(
+        _strings(column),
+        r"(?P<year>(?:19|20)\d\d)"
+        r"(?:,\s*(?:(?P<month>[A-Z][a-z]+)|Q(?P<quarter>[1-4]))(?:\s+(?P<day>\d{1,2}))?)?",
+    )
+    year = pc.struct_field(matches, "year")
+
+    month_index = pc.add(
+        pc.index_in(pc.struct_field(matches, "month"), value_set=pa.array(_MONTHS)), 1
+    )
+    quarter = pc.cast(
+        pc.if_else(
+            pc.equal(pc.struct_field(matches, "quarter"), ""),
+            None,
+            pc.struct_field(matches, "quarter"),
+        ),
+        pa.int32(),
+    )
+    quarter_month = pc.add(pc.multiply(pc.subtract(quarter, 1), 3), 1)
+    month = pc.coalesce(month_index, quarter_month, 1)
+
+    day = pc.struct_field(matches, "day")
+    day = pc.if_else(pc.equal(day, ""), "1", day)
+
+    text = pc.binary_join_element_wise(
+        year,
+        pc.utf8_lpad(pc.cast(month, pa.string()), 2, "0"),
+        pc.utf8_lpad(day, 2, "0"),
+        "-",
+    )
+    timestamps = pc.strptime(text, format="%Y-%m-%d", unit="s", error_is_null=True)
+    return pc.cast(timestamps, pa.date32())
+
+
+def normalize_specs(table: pa.Table) -> pa.Table:
+    """
+    Adds typed columns to a table of **DeviceSpecs**
+
+    :param table: A table with the columns of **DeviceSpecs**, e.g. data/device_specs
+
+    :return: The table with weight_g, display_size_in, display_width, display_height,
+        display_pixels, battery_mah, ram_gb and release_date columns added
+    """
+    width, height, pixels = parse_resolution(table["display_resolution"])
+    released = pc.coalesce(
+        parse_release_date(table["launch_status"]),
+        parse_release_date(table["launch_announced"]),
+    )
+    columns = {
+        "weight_g": parse_grams(table["body_weight"]),
+        "display_size_in": parse_inches(table["display_size"]),
+        "display_width": width,
+        "display_height": height,
+        "display_pixels": pixels,
+        "battery_mah": parse_mah(table["battery_type"]),
+        "ram_gb": parse_ram_gb(table["memory_internal"]),
+        "release_date": released,
+    }
+    for name, column in columns.items():
+        table = table.append_column(name, column)
+    return table
+
+
+def normalize_details(table: pa.Table) -> pa.Table:
+    """
+    Adds typed columns to a table of **DeviceDetails**
+
+    :param table: A table with the columns of **DeviceDetails**
+
+    :return: The table with weight_g, display_size_in, display_width, display_height,
+        display_pixels, battery_mah, ram_gb and release_date columns added
+    """
+    width, height, pixels = parse_resolution(table["display_res"])
+    battery = pc.binary_join_element_wise(
+        _strings(table["battery_size"]), _strings(table["battery_size_unit"]), " "
+    )
+    ram = pc.binary_join_element_wise(
+        _strings(table["ram_size"]), _strings(table["ram_size_unit"]), " "
+    )
+    columns = {
+        "weight_g": parse_grams(table["body"]),
+        "display_size_in": parse_inches(table["display_size"]),
+        "display_width": width,
+        "display_height": height,
+        "display_pixels": pixels,
+        "battery_mah": parse_mah(battery),
+        "ram_gb": parse_ram_gb(ram),
+        "release_date": parse_release_date(table["released"]),
+    }
+    for name, column in columns.items():
+        table = table.append_column(name, column)
+    return table
+
+
+def read_csv_strings(path: str) -> pa.Table:
+    """
+    Reads one of the CSV files in the data folder keeping every column as a string
+
+    :param path: The path of the CSV file
+
+    :return: The table, empty cells are nulls
+    """
+    with open(path, encoding="utf-8") as file:
+        names = file.readline().rstrip("\r\n").split(",")
+    return pa_csv.read_csv(
+        path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in names},
+            strings_can_be_null=True,
+        ),
+    )
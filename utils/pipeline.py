@@ -0,0 +1,255 @@
+"""A pipeline that fetches device pages on threads and extracts them on a process pool
+
+Fetching is I/O-bound and extracting is CPU-bound, so running both inline
+on the same thread leaves the network idle while a page is being parsed.
+Here fetcher threads put the raw HTML of the pages on a bounded queue and a
+process pool runs the extractors on it, so parsing scales with the cores
+and a slow parse never holds back the fetchers.
+
+Given a quarantine, pages that fail to be fetched or extracted are put in it
+and skipped, so one malformed page doesn't end the run.
+"""
+
+from collections import defaultdict
+from collections.abc import Hashable, Iterable, Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    BrokenExecutor,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from utils.helper import get_html
+from utils.lxml_extractor import (
+    device_details_from_html,
+    device_spec_table_from_html,
+    device_specs_from_html,
+    parse_html,
+)
+from utils.metrics import get_metrics
+from utils.resilience import Quarantine
+
+
+def device_specs_and_table_from_html(page: str | bytes) -> Tuple[Any, Any]:
+    """
+    Parses the page once for both the specs and the specs table
+
+    :param page: The HTML of the device page
+
+    :return: The **DeviceSpecs** and the **DeviceSpecTable** of the device
+    """
+    root = parse_html(page)
+    return device_specs_from_html(root), device_spec_table_from_html(root)
+
+
+EXTRACTORS: Dict[str, Callable[[str], Any]] = {
+    "specs": device_specs_from_html,
+    "details": device_details_from_html,
+    "table": device_spec_table_from_html,
+    "specs_and_table": device_specs_and_table_from_html,
+}
+
+DEFAULT_FETCH_WORKERS = 8
+DEFAULT_MAX_QUEUED = 64
+
+# The workers are started while the fetcher threads run, forking then could
+# copy a lock held by one of them and deadlock the worker
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+_DONE = object()
+_SKIPPED = object()
+
+
+def _extract(kind: str, page: str) -> Tuple[Any, float]:
+    # Runs in the worker processes, so it has to be importable at module level.
+    # The metrics of a worker process aren't shared, so the time it took is
+    # sent back along with the result and recorded by the parent
+    start = time.perf_counter()
+    result = EXTRACTORS[kind](page)
+    return result, time.perf_counter() - start
+
+
+class ParsePipeline:
+    """
+    Fetches pages on a thread pool and extracts them on a process pool
+
+    The queue between the two stages holds at most ``max_queued`` pages, so
+    when parsing falls behind the fetchers wait instead of piling up pages
+    in memory.
+    """
+
+    def __init__(
+        self,
+        kind: str = "specs",
+        fetch_workers: int = DEFAULT_FETCH_WORKERS,
+        parse_workers: int | None = None,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        fetch: Callable[[str], str] = get_html,
+        quarantine: Quarantine | None = None,
+    ):
+        """
+        :param kind: The extractor to run on each page, one of **EXTRACTORS**
+
+        :param fetch_workers: The number of threads fetching pages
+
+        :param parse_workers: The number of processes extracting pages, defaults to the number of cores
+
+        :param max_queued: The maximum number of fetched pages waiting to be extracted
+
+        :param fetch: Gets the HTML of a page, the shared pooled fetcher by default
+
+        :param quarantine: Keeps the pages that failed, which are then skipped
+            instead of raising
+        """
+        if kind not in EXTRACTORS:
+            raise ValueError(
+                f"Unknown extractor {kind!r}, use one of {list(EXTRACTORS)}"
+            )
+
+        self.kind = kind
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.fetch = fetch
+        self.quarantine = quarantine
+
+    def run(
+        self, items: Iterable[Tuple[Hashable, str]]
+    ) -> Iterator[Tuple[Hashable, str, Any]]:
+        """
+        Extracts every page, yielding the results of each key in the order they were given
+
+        Results of different keys are yielded as soon as they are ready, so a
+        slow page only delays the pages that come after it with the same key,
+        e.g. the same brand.
+
+        :param items: Pairs of a key, like the brand id, and the link to the page
+
+        :return: A generator that yields the key, the link and the extracted dataclass
+        """
+        pages: queue.Queue = queue.Queue(maxsize=self.max_queued)
+        stop = threading.Event()
+
+        sequences: Dict[Hashable, int] = defaultdict(int)
+        sequences_lock = threading.Lock()
+        items_iterator = iter(items)
+
+        def next_item():
+            with sequences_lock:
+                item = next(items_iterator, None)
+                if item is None:
+                    return None
+                key, link = item
+                sequence = sequences[key]
+                sequences[key] += 1
+                return key, sequence, link
+
+        def fetcher():
+            try:
+                while not stop.is_set():
+                    item = next_item()
+                    if item is None:
+                        break
+                    key, sequence, link = item
+                    try:
+                        page = self.fetch(link)
+                    except Exception as error:  # pylint: disable=broad-except
+                        pages.put((key, sequence, link, error))
+                        continue
+                    pages.put((key, sequence, link, page))
+            finally:
+                pages.put(_DONE)
+
+        threads = [
+            threading.Thread(target=fetcher, name=f"pipeline-fetch-{i}", daemon=True)
+            for i in range(self.fetch_workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.parse_workers, mp_context=_MP_CONTEXT
+            ) as pool:
+                yield from self._collect(pages, pool, len(threads))
+        finally:
+            stop.set()
+            # Unblock the fetchers waiting on a full queue so they can exit
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def _collect(
+        self, pages: queue.Queue, pool: ProcessPoolExecutor, fetchers: int
+    ) -> Iterator[Tuple[Hashable, str, Any]]:
+        futures: Dict[Future, Tuple[Hashable, int, str, str]] = {}
+        ready: Dict[Hashable, Dict[int, Any]] = defaultdict(dict)
+        next_sequence: Dict[Hashable, int] = defaultdict(int)
+
+        while fetchers > 0 or futures:
+            # Only take more pages while the process pool isn't saturated, the
+            # queue then fills up and the fetchers wait for it to drain
+            while fetchers > 0 and len(futures) < self.parse_workers * 2:
+                try:
+                    item = pages.get(timeout=0.05 if futures else None)
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    fetchers -= 1
+                    continue
+
+                key, sequence, link, page = item
+                if isinstance(page, Exception):
+                    if self.quarantine is None:
+                        raise page
+                    self.quarantine.put(link, None, page, "fetch")
+                    ready[key][sequence] = _SKIPPED
+                    continue
+                future = pool.submit(_extract, self.kind, page)
+                # The page is kept until it's extracted, to quarantine it on failure
+                futures[future] = (key, sequence, link, page)
+
+            if not futures:
+                yield from self._ready(ready, next_sequence)
+                continue
+
+            done, _ = wait(futures, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, sequence, link, page = futures.pop(future)
+                try:
+                    result, elapsed = future.result()
+                except BrokenExecutor:
+                    raise
+                except Exception as error:  # pylint: disable=broad-except
+                    if self.quarantine is None:
+                        raise
+                    self.quarantine.put(link, page, error, "extract")
+                    ready[key][sequence] = _SKIPPED
+                    continue
+                get_metrics().observe("stage_seconds", elapsed, "extract")
+                ready[key][sequence] = (link, result)
+
+            yield from self._ready(ready, next_sequence)
+
+    @staticmethod
+    def _ready(
+        ready: Dict[Hashable, Dict[int, Any]], next_sequence: Dict[Hashable, int]
+    ) -> Iterator[Tuple[Hashable, str, Any]]:
+        # Yields the results that are next in line for their key
+        for key, results in ready.items():
+            while next_sequence[key] in results:
+                result = results.pop(next_sequence[key])
+                next_sequence[key] += 1
+                if result is not _SKIPPED:
+                    yield (key, *result)
@@ -0,0 +1,492 @@
+"""Persistent indexes over the scraped catalog, to query it without scanning every device
+
+:func:`build_index` writes, for a list of device records:
+
+* a sorted index per numeric field (``ram_gb``, ``battery_mah``,
+  ``release_date``...): the values in order and the row of each one, as raw
+  arrays that are memory-mapped and binary searched
+* an inverted index per text field (``chipset``, ``os``, ``network``): the
+  sorted tokens and the rows holding each one
+* the sorted words of every title, for prefix search
+* the record of every row, returned by the searches
+
+The strings are packed in a single blob per list along with the offset of
+each one, memory-mapped too, so opening the index reads nothing and a query
+only decodes the strings it binary searches and the records it returns.
+
+A query is a list of conditions like ``ram_gb>=8``, ``chipset:snapdragon``
+or ``title:galaxy s2``. Each condition is answered from its index and the
+sets of rows are intersected, smallest first::
+
+    index = QueryIndex("data/query_index")
+    index.search(["ram_gb>=8", "battery_mah>5000", "release_date>2022-12-31"])
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date
+import json
+import mmap
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Set, Tuple
+
+from utils.writers import temp_path
+
+INDEX_VERSION = 2
+
+NUMERIC_FIELDS = (
+    "weight_g",
+    "display_size_in",
+    "display_width",
+    "display_height",
+    "display_pixels",
+    "battery_mah",
+    "ram_gb",
+    "release_date",
+)
+
+# The text fields that are tokenized, with the columns they are read from
+# in the specs dataset and in devices_with_details.csv
+TOKEN_FIELDS = {
+    "chipset": ("platform_chipset", "chipset"),
+    "os": ("platform_os", "os"),
+    "network": ("network_technology",),
+}
+
+# The fields of each record returned by a search
+RECORD_FIELDS = ("device_id", "brand_id", "model_name", "img_link", "gsmarena_link")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_CONDITION = re.compile(r"^\s*(\w+)\s*(>=|<=|>|<|=|:)\s*(.+?)\s*$")
+_EPOCH = date(1970, 1, 1)
+
+
+def tokenize(text: str | None) -> List[str]:
+    """
+    :param text: A spec like "Qualcomm SM8650-AB Snapdragon 8 Gen 3 (4 nm)"
+
+    :return: The lowercased words and numbers, e.g. ["qualcomm", "sm8650", ...]
+    """
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def _number(field: str, value: Any) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, date):
+        return float((value - _EPOCH).days)
+    if field == "release_date" and isinstance(value, str):
+        return float((date.fromisoformat(value) - _EPOCH).days)
+    return float(value)
+
+
+def build_index(records: Iterable[Dict[str, Any]], directory: str) -> int:
+    """
+    Writes the indexes of the records to a directory
+
+    :param records: Normalized device records, see :func:`load_specs_records`
+
+    :param directory: The directory of the index, replaced if it exists
+
+    :return: The number of records indexed
+    """
+    numeric: Dict[str, List[Tuple[float, int]]] = {f: [] for f in NUMERIC_FIELDS}
+    postings: Dict[str, Dict[str, List[int]]] = {f: {} for f in TOKEN_FIELDS}
+    titles: List[Tuple[str, int]] = []
+    rows: List[Dict[str, Any]] = []
+
+    for row, record in enumerate(records):
+        rows.append({field: record.get(field) for field in RECORD_FIELDS})
+
+        for field in NUMERIC_FIELDS:
+            value = _number(field, record.get(field))
+            if value is not None:
+                numeric[field].append((value, row))
+
+        for field, columns in TOKEN_FIELDS.items():
+            text = " ".join(str(record[c]) for c in columns if record.get(c))
+            for token in set(tokenize(text)):
+                postings[field].setdefault(token, []).append(row)
+
+        # Every word starts a key, so "s24" finds "Galaxy S24 Ultra"
+        words = tokenize(record.get("model_name"))
+        for start in range(len(words)):
+            titles.append((" ".join(words[start:]), row))
+
+    os.makedirs(directory, exist_ok=True)
+
+    for field, pairs in numeric.items():
+        pairs.sort()
+        _write_array(directory, f"{field}.values", "d", [value for value, _ in pairs])
+        _write_array(directory, f"{field}.rows", "i", [row for _, row in pairs])
+
+    for field, field_postings in postings.items():
+        tokens = sorted(field_postings)
+        # The rows of the i-th token are postings[starts[i]:starts[i + 1]]
+        starts: List[int] = [0]
+        flat: List[int] = []
+        for token in tokens:
+            flat += field_postings[token]
+            starts.append(len(flat))
+        _write_strings(directory, f"{field}.tokens", tokens)
+        _write_array(directory, f"{field}.starts", "q", starts)
+        _write_array(directory, f"{field}.postings", "i", flat)
+
+    titles.sort()
+    _write_strings(directory, "titles", [key for key, _ in titles])
+    _write_array(directory, "titles.rows", "i", [row for _, row in titles])
+    _write_strings(
+        directory,
+        "records",
+        [json.dumps(row, ensure_ascii=False, separators=(",", ":")) for row in rows],
+    )
+    _write_json(directory, "meta.json", {"version": INDEX_VERSION, "rows": len(rows)})
+    return len(rows)
+
+
+def _write_bytes(directory: str, name: str, data: bytes) -> None:
+    path = os.path.join(directory, name)
+    with open(temp_path(path), "wb") as file:
+        file.write(data)
+    os.replace(temp_path(path), path)
+
+
+def _write_array(directory: str, name: str, typecode: str, values: List) -> None:
+    _write_bytes(directory, name, array(typecode, values).tobytes())
+
+
+def _write_strings(directory: str, name: str, strings: List[str]) -> None:
+    """Writes the UTF-8 bytes of the strings end to end and the offset of each one"""
+    blob = bytearray()
+    offsets = [0]
+    for string in strings:
+        blob += string.encode("utf-8")
+        offsets.append(len(blob))
+    _write_bytes(directory, f"{name}.strings", bytes(blob))
+    _write_array(directory, f"{name}.offsets", "q", offsets)
+
+
+def _write_json(directory: str, name: str, value: Any) -> None:
+    path = os.path.join(directory, name)
+    with open(temp_path(path), "w", encoding="utf-8") as file:
+        json.dump(value, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temp_path(path), path)
+
+
+def _read_json(directory: str, name: str) -> Any:
+    with open(os.path.join(directory, name), encoding="utf-8") as file:
+        return json.load(file)
+
+
+class PackedStrings(Sequence):
+    """
+    A read-only list of the strings written by :func:`_write_strings`
+
+    A string is only decoded when it's indexed, so the list can be binary
+    searched without reading it whole.
+    """
+
+    def __init__(
+        self,
+        blob: Sequence[int],
+        offsets: Sequence[int],
+        loads: Callable[[str], Any] | None = None,
+    ):
+        """
+        :param blob: The bytes of the strings, e.g. a memory-mapped file
+
+        :param offsets: The offset of every string in the blob and the size of the blob
+
+        :param loads: Turns each string into the item returned, e.g. ``json.loads``
+        """
+        self._blob = blob
+        self._offsets = offsets
+        self._loads = loads
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        text = str(self._blob[self._offsets[index] : self._offsets[index + 1]], "utf-8")
+        return text if self._loads is None else self._loads(text)
+
+
+@dataclass
+class Condition:
+    """A parsed query condition, e.g. ``ram_gb>=8``"""
+
+    field: str
+    operator: str
+    value: str
+
+
+def parse_condition(text: str) -> Condition:
+    """
+    :param text: A condition like ``ram_gb>=8``, ``release_date>2022-12-31``,
+        ``chipset:snapdragon`` or ``title:galaxy s``
+
+    :return: The parsed condition
+    """
+    match = _CONDITION.match(text)
+    if match is None:
+        raise ValueError(f"Can't parse the condition {text!r}")
+    field, operator, value = match.groups()
+    if operator == ":":
+        if field != "title" and field not in TOKEN_FIELDS:
+            raise ValueError(
+                f"Unknown text field {field!r}, use title or one of {list(TOKEN_FIELDS)}"
+            )
+    elif field not in NUMERIC_FIELDS:
+        raise ValueError(
+            f"Unknown numeric field {field!r}, use one of {list(NUMERIC_FIELDS)}"
+        )
+    else:
+        try:
+            _number(field, value)
+        except ValueError:
+            expected = "a number"
+            if field == "release_date":
+                expected = "a date like 2022-12-31"
+            raise ValueError(f"{field} is compared to {value!r}, use {expected}") from None
+    return Condition(field, operator, value)
+
+
+class QueryIndex:
+    """
+    Answers queries from the index files written by :func:`build_index`
+
+    The files are memory-mapped when first used, so opening the index only
+    reads its version and a query only pages in the parts of the files it
+    binary searches, along with the records it returns.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory of the index
+        """
+        self.directory = directory
+        meta = _read_json(directory, "meta.json")
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(
+                f"{directory} was built by another version, rebuild it with --build"
+            )
+
+        self._maps: Dict[str, Tuple[mmap.mmap | None, Sequence]] = {}
+        # The record of every row, as a dictionary of RECORD_FIELDS
+        self.rows: Sequence[Dict[str, Any]] = self._strings("records", json.loads)
+
+    def _array(self, name: str, typecode: str) -> Sequence:
+        cached = self._maps.get(name)
+        if cached is not None:
+            return cached[1]
+
+        with open(os.path.join(self.directory, name), "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                mapped, view = None, array(typecode)
+            else:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(mapped).cast(typecode)
+        self._maps[name] = (mapped, view)
+        return view
+
+    def _strings(
+        self, name: str, loads: Callable[[str], Any] | None = None
+    ) -> PackedStrings:
+        return PackedStrings(
+            self._array(f"{name}.strings", "B"),
+            self._array(f"{name}.offsets", "q"),
+            loads,
+        )
+
+    def range(
+        self,
+        field: str,
+        low: float | None = None,
+        high: float | None = None,
+        include_low: bool = True,
+        include_high: bool = True,
+    ) -> Set[int]:
+        """
+        Finds the rows whose value of a numeric field is within bounds
+
+        :param field: One of ``NUMERIC_FIELDS``
+
+        :param low: The lower bound, None for no bound
+
+        :param high: The upper bound, None for no bound
+
+        :param include_low: Whether rows equal to the lower bound match
+
+        :param include_high: Whether rows equal to the upper bound match
+
+        :return: The matching rows
+        """
+        values = self._array(f"{field}.values", "d")
+        rows = self._array(f"{field}.rows", "i")
+
+        start = 0
+        if low is not None:
+            start = (bisect_left if include_low else bisect_right)(values, low)
+        end = len(values)
+        if high is not None:
+            end = (bisect_right if include_high else bisect_left)(values, high)
+        return set(rows[start:end]) if start < end else set()
+
+    def tokens(self, field: str, text: str) -> Set[int]:
+        """
+        Finds the rows whose text field has every token of the text
+
+        :param field: One of ``TOKEN_FIELDS``
+
+        :param text: The text to look for, e.g. "snapdragon 8"
+
+        :return: The matching rows
+        """
+        tokens = self._strings(f"{field}.tokens")
+        starts = self._array(f"{field}.starts", "q")
+        postings = self._array(f"{field}.postings", "i")
+        result: Set[int] | None = None
+        for token in tokenize(text):
+            i = bisect_left(tokens, token)
+            if i < len(tokens) and tokens[i] == token:
+                rows = set(postings[starts[i] : starts[i + 1]])
+            else:
+                rows = set()
+            result = rows if result is None else result & rows
+            if not result:
+                break
+        return result or set()
+
+    def prefix(self, text: str) -> Set[int]:
+        """
+        Finds the rows with a title containing words starting with the text
+
+        :param text: The beginning of the words, e.g. "galaxy s2"
+
+        :return: The matching rows
+        """
+        key = " ".join(tokenize(text))
+        if not key:
+            return set()
+        titles = self._strings("titles")
+        start = bisect_left(titles, key)
+        end = bisect_left(titles, key + "\uffff", start)
+        return set(self._array("titles.rows", "i")[start:end])
+
+    def match(self, condition: Condition) -> Set[int]:
+        """
+        :param condition: A parsed condition
+
+        :return: The rows matching the condition
+        """
+        if condition.operator == ":":
+            if condition.field == "title":
+                return self.prefix(condition.value)
+            return self.tokens(condition.field, condition.value)
+
+        value = _number(condition.field, condition.value)
+        if condition.operator == "=":
+            return self.range(condition.field, value, value)
+        if condition.operator in (">", ">="):
+            return self.range(
+                condition.field, low=value, include_low=condition.operator == ">="
+            )
+        return self.range(
+            condition.field, high=value, include_high=condition.operator == "<="
+        )
+
+    def search(
+        self, conditions: Iterable[str | Condition], limit: int | None = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Finds the devices matching every condition
+
+        :param conditions: Conditions like ``ram_gb>=8`` or parsed **Condition** objects
+
+        :param limit: The maximum number of devices returned
+
+        :return: The records of the matching devices, in the order they were indexed
+        """
+        sets = [
+            self.match(
+                parse_condition(condition) if isinstance(condition, str) else condition
+            )
+            for condition in conditions
+        ]
+        if not sets:
+            rows: Iterable[int] = range(len(self.rows))
+        else:
+            sets.sort(key=len)
+            result = sets[0]
+            for other in sets[1:]:
+                result = result & other
+                if not result:
+                    break
+            rows = sorted(result)
+        return [self.rows[row] for row in list(rows)[:limit]]
+
+    def close(self) -> None:
+        """Unmaps the index files"""
+        for mapped, view in self._maps.values():
+            if isinstance(view, memoryview):
+                view.release()
+            if mapped is not None:
+                mapped.close()
+        self._maps.clear()
+
+    def __enter__(self) -> "QueryIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def load_specs_records(dataset_dir: str) -> List[Dict[str, Any]]:
+    """
+    Loads the records to index from the Parquet dataset of device_specs.py
+
+    Needs the optional **pyarrow** package.
+
+    :param dataset_dir: The directory of the dataset
+
+    :return: The normalized records, with the typed columns of utils.normalize
+    """
+    # pylint: disable=import-outside-toplevel
+    from utils.columnar import read_latest_specs
+    from utils.normalize import normalize_specs
+
+    columns = list(RECORD_FIELDS)
+    columns += [column for names in TOKEN_FIELDS.values() for column in names]
+    table = normalize_specs(read_latest_specs(dataset_dir))
+    names = [
+        name
+        for name in table.column_names
+        if name in columns or name in NUMERIC_FIELDS
+    ]
+    return table.select(names).to_pylist()
+
+
+def load_details_records(csv_path: str) -> List[Dict[str, Any]]:
+    """
+    Loads the records to index from devices_with_details.csv
+
+    Needs the optional **pyarrow** package.
+
+    :param csv_path: The path of the CSV file
+
+    :return: The normalized records, with the typed columns of utils.normalize
+    """
+    # pylint: disable=import-outside-toplevel
+    from utils.normalize import normalize_details, read_csv_strings
+
+    table = normalize_details(read_csv_strings(csv_path))
+    names = ["model_name", "img_link", "chipset", "os", *NUMERIC_FIELDS]
+    return table.select(names).to_pylist()
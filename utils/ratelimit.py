@@ -0,0 +1,181 @@
+"""An adaptive rate limiter shared by every request sent to gsmarena
+
+The rate is controlled with AIMD (additive increase, multiplicative decrease):
+while responses come back fast and successful the rate slowly grows, and as
+soon as the server answers 429/503 or gets noticeably slower it is cut down.
+Requests are spaced out with a token bucket running at the current rate.
+"""
+
+import random
+import threading
+import time
+
+DEFAULT_INITIAL_RATE = 1.0
+DEFAULT_MIN_RATE = 0.1
+DEFAULT_MAX_RATE = 10.0
+
+# Status codes telling us to slow down
+THROTTLE_STATUS_CODES = frozenset({429, 503})
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parses the Retry-After header
+
+    :param value: The value of the header, either seconds or an HTTP date
+
+    :return: The number of seconds to wait, None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    from email.utils import parsedate_to_datetime  # pylint: disable=import-outside-toplevel
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Jittered exponential backoff ("full jitter")
+
+    :param attempt: The number of consecutive failures so far, starting at 1
+
+    :param base: The delay of the first attempt in seconds
+
+    :param cap: The maximum delay in seconds
+
+    :return: A random delay between 0 and ``min(cap, base * 2 ** (attempt - 1))``
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose rate is adjusted from the latency and status of the responses
+
+    It's thread safe, every thread calls :meth:`acquire` before sending a
+    request and :meth:`record` with the outcome.
+    """
+
+    def __init__(
+        self,
+        initial_rate: float = DEFAULT_INITIAL_RATE,
+        min_rate: float = DEFAULT_MIN_RATE,
+        max_rate: float = DEFAULT_MAX_RATE,
+        burst: float = 1.0,
+        increase: float = 0.25,
+        decrease: float = 0.5,
+        slow_factor: float = 2.0,
+    ):
+        """
+        :param initial_rate: The rate to start with, in requests per second
+
+        :param min_rate: The rate is never cut below this
+
+        :param max_rate: The rate never grows above this
+
+        :param burst: The number of requests that can be sent back to back
+
+        :param increase: Added to the rate after every healthy response
+
+        :param decrease: The rate is multiplied by this when the server struggles
+
+        :param slow_factor: A response this many times slower than usual counts as struggling
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(initial_rate, min_rate), max_rate)
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_factor = slow_factor
+
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._failures = 0
+        self._latency: float | None = None
+        self._decreased_at = 0.0
+
+    def acquire(self) -> float:
+        """
+        Waits until a request may be sent
+
+        :return: The number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                delay = self._paused_until - now
+                if delay <= 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                if delay <= 0:
+                    delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+    def record(
+        self, status_code: int, latency: float, retry_after: str | None = None
+    ) -> None:
+        """
+        Adjusts the rate from the outcome of a request
+
+        :param status_code: The status code of the response
+
+        :param latency: The time to first byte of the response in seconds
+
+        :param retry_after: The Retry-After header of the response
+        """
+        with self._lock:
+            if status_code in THROTTLE_STATUS_CODES or status_code >= 500:
+                self._failures += 1
+                self._slow_down()
+
+                pause = parse_retry_after(retry_after)
+                if pause is None:
+                    pause = backoff_delay(self._failures)
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                return
+
+            self._failures = 0
+            usual = self._latency
+            if usual is not None and latency > usual * self.slow_factor:
+                self._slow_down()
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+            # Exponentially weighted moving average of the latency
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency = 0.8 * self._latency + 0.2 * latency
+
+    def _slow_down(self) -> None:
+        # Responses of requests sent before the last decrease all report the same
+        # trouble, only cut the rate once per round trip
+        now = time.monotonic()
+        if now - self._decreased_at < (self._latency or 0.0):
+            return
+        self._decreased_at = now
+
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        # Drop the saved up tokens so the lower rate applies right away
+        self._tokens = min(self._tokens, 0.0)
+
+    def _refill(self, now: float) -> None:
+        refill = (now - self._updated) * self.rate
+        self._tokens = min(self.burst, self._tokens + refill)
+        self._updated = now
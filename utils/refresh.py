@@ -0,0 +1,269 @@
+"""Helpers for refreshing the data folder incrementally instead of crawling it all again
+
+A refresh compares the fresh makers page with ``data/phone_brands.csv`` and
+only walks the listings of the brands whose number of devices changed, see
+:func:`utils.scraper.get_new_brand_devices`. Spec pages are only fetched for
+device IDs that weren't seen before, and a hash of the specs of every page
+tells whether a device that is checked again was edited.
+"""
+
+from contextlib import contextmanager
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from utils.classes import Brand, Device, DeviceSpecs
+from utils.writers import WRITERS, CsvRecordWriter, read_records, slugify
+
+# The column order of phone_brands.csv
+BRAND_FIELDS = ["id", "name", "number_of_devices", "gsmarena_link"]
+
+
+def read_brands(path: str) -> Dict[str, Brand]:
+    """
+    Reads the brands stored by phone_brands.py
+
+    :param path: The path of phone_brands.csv
+
+    :return: The brands keyed by id, empty if the file doesn't exist yet
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="", encoding="utf-8") as file:
+        return {
+            row["id"]: Brand(
+                id=row["id"],
+                name=row["name"],
+                number_of_devices=int(row["number_of_devices"]),
+                gsmarena_link=row["gsmarena_link"],
+            )
+            for row in csv.DictReader(file)
+        }
+
+
+def write_brands(path: str, brands: Iterable[Brand]) -> None:
+    """
+    Stores the brands, read back by :func:`read_brands`
+
+    :param path: The path of phone_brands.csv
+
+    :param brands: The brands on the makers page
+    """
+    with CsvRecordWriter(path, BRAND_FIELDS) as writer:
+        writer.write_many(
+            [getattr(brand, name) for name in BRAND_FIELDS] for brand in brands
+        )
+
+
+def changed_brands(fresh: Iterable[Brand], stored: Dict[str, Brand]) -> List[Brand]:
+    """
+    Picks the brands whose listing has to be walked again
+
+    :param fresh: The brands on the makers page now
+
+    :param stored: The brands stored by the last run, keyed by id
+
+    :return: The brands that are new or list a different number of devices
+    """
+    return [
+        brand
+        for brand in fresh
+        if brand.id not in stored
+        or stored[brand.id].number_of_devices != brand.number_of_devices
+    ]
+
+
+def brand_devices_path(
+    data_dir: str, brand: Brand, output_format: str | None = None
+) -> str:
+    """
+    :param data_dir: The data folder
+
+    :param brand: The brand
+
+    :param output_format: The format of the file, see utils.writers. If not
+        given, the format of the file written by the last run, CSV if none
+
+    :return: The path of the file of the brand's devices written by brand_devices.py
+    """
+    base = os.path.join(data_dir, "brands", slugify(brand.id))
+    if output_format is None:
+        output_format = next(
+            (
+                name
+                for name, writer in WRITERS.items()
+                if os.path.exists(base + writer.extension)
+            ),
+            "csv",
+        )
+    return base + WRITERS[output_format].extension
+
+
+def read_devices(path: str) -> List[Device]:
+    """
+    Reads the devices of a brand stored by brand_devices.py
+
+    :param path: The path of the brand's file, in any format of utils.writers
+
+    :return: The devices in the order they are listed, empty if the file doesn't exist
+    """
+    if not os.path.exists(path):
+        return []
+    return [Device(**record) for record in read_records(path)]
+
+
+def specs_hash(specs: DeviceSpecs) -> str:
+    """
+    Hashes the extracted specs of a device
+
+    The specs are hashed rather than the page, since the page also carries
+    ads, comment counts and popularity figures that change every day.
+
+    :param specs: The specs of the device
+
+    :return: The SHA-256 hex digest of the specs
+    """
+    payload = json.dumps(specs.to_dict(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SpecHashes:
+    """
+    A SQLite table of the hash of the specs of every device, and when they were checked
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The path of the SQLite file, created if it doesn't exist
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS spec_hashes (
+                device_id INTEGER PRIMARY KEY,
+                brand_id TEXT NOT NULL,
+                link TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                changed_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS spec_hashes_checked ON spec_hashes (checked_at)"
+        )
+        self._connection.commit()
+        # The depth of the batch() blocks running, update() doesn't commit in one
+        self._batches = 0
+
+    def __contains__(self, device_id: int) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM spec_hashes WHERE device_id = ?", (device_id,)
+            ).fetchone()
+        return row is not None
+
+    def known_ids(self) -> Set[int]:
+        """
+        :return: The IDs of every device whose specs were stored
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT device_id FROM spec_hashes")
+            return {device_id for (device_id,) in rows}
+
+    def update(
+        self, device_id: int, brand_id: str, link: str, specs: DeviceSpecs
+    ) -> bool:
+        """
+        Records the specs of a device that were just fetched
+
+        :param device_id: The ID of the device
+
+        :param brand_id: The id of the brand the device is stored under
+
+        :param link: The link to the device's page
+
+        :param specs: The specs of the device
+
+        :return: True if the device is new or its specs changed
+        """
+        digest = specs_hash(specs)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT hash FROM spec_hashes WHERE device_id = ?", (device_id,)
+            ).fetchone()
+            changed = row is None or row[0] != digest
+            self._connection.execute(
+                "INSERT INTO spec_hashes"
+                " (device_id, brand_id, link, hash, checked_at, changed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (device_id) DO UPDATE SET"
+                " hash = excluded.hash, checked_at = excluded.checked_at,"
+                " changed_at = CASE WHEN hash = excluded.hash"
+                " THEN changed_at ELSE excluded.changed_at END",
+                (device_id, brand_id, link, digest, now, now),
+            )
+            if not self._batches:
+                self._connection.commit()
+        return changed
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Commits the hashes updated in the block at once, instead of one by one
+
+        The hashes updated in the block are rolled back if it raises, like
+        the specs written along with them.
+        """
+        with self._lock:
+            self._batches += 1
+        committed = False
+        try:
+            yield
+            committed = True
+        finally:
+            with self._lock:
+                self._batches -= 1
+                if not self._batches:
+                    if committed:
+                        self._connection.commit()
+                    else:
+                        self._connection.rollback()
+
+    def stalest(self, limit: int) -> List[Tuple[str, str]]:
+        """
+        Gets the devices checked the longest time ago, to look for edits
+
+        :param limit: The maximum number of devices
+
+        :return: The brand id and the link of each device, the stalest first
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT brand_id, link FROM spec_hashes ORDER BY checked_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [(brand_id, link) for brand_id, link in rows]
+
+    def clear(self) -> None:
+        """Forgets every hash, e.g. before a full crawl"""
+        with self._lock:
+            self._connection.execute("DELETE FROM spec_hashes")
+            self._connection.commit()
+
+    def close(self) -> None:
+        """Closes the SQLite file"""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,225 @@
+"""Keeps a long crawl going through failed requests and malformed pages
+
+Transient failures (connection errors, timeouts, 5xx answers) are retried
+by the fetcher with a jittered backoff. When the failures don't stop, a
+**CircuitBreaker** pauses every request for a while instead of burning
+through the rest of the crawl, then lets a single request probe whether
+the site is back.
+
+Pages that can't be extracted are put in a **Quarantine** along with their
+raw HTML and the error, and the crawl moves on to the next page.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Any, Dict, Iterator
+
+from utils.metrics import get_metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+DEFAULT_FAILURE_THRESHOLD = 10
+DEFAULT_COOLDOWN = 30.0
+DEFAULT_MAX_COOLDOWN = 600.0
+
+
+class ExtractionError(ValueError):
+    """Raised when a page doesn't have the markup an extractor expects"""
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests after too many consecutive failures
+
+    It's thread safe, every thread calls :meth:`wait` before sending a
+    request and :meth:`record_success` or :meth:`record_failure` with the
+    outcome. After ``failure_threshold`` failures in a row the circuit opens
+    and :meth:`wait` blocks for ``cooldown`` seconds. Then one request is let
+    through: if it succeeds the circuit closes, otherwise it opens again for
+    twice as long, up to ``max_cooldown``.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+        max_cooldown: float = DEFAULT_MAX_COOLDOWN,
+    ):
+        """
+        :param failure_threshold: The number of failures in a row that opens the circuit
+
+        :param cooldown: The number of seconds the circuit stays open the first time
+
+        :param max_cooldown: The cooldown never grows above this
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.state = CLOSED
+        self._condition = threading.Condition()
+        self._failures = 0
+        self._current_cooldown = cooldown
+        self._opened_until = 0.0
+        self._probe_until = 0.0
+
+    def wait(self) -> float:
+        """
+        Waits until a request may be sent
+
+        :return: The number of seconds spent waiting
+        """
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.state == CLOSED:
+                    return now - start
+
+                if self.state == OPEN:
+                    delay = self._opened_until - now
+                else:
+                    # Another request is probing, a probe that never reports
+                    # back doesn't keep the circuit half open forever
+                    delay = self._probe_until - now
+
+                if delay <= 0:
+                    self.state = HALF_OPEN
+                    self._probe_until = now + self._current_cooldown
+                    return now - start
+                self._condition.wait(delay)
+
+    def record_success(self) -> None:
+        """Closes the circuit"""
+        with self._condition:
+            self._failures = 0
+            if self.state != CLOSED:
+                print("Requests are succeeding again, resuming the crawl.")
+                self.state = CLOSED
+                self._current_cooldown = self.cooldown
+                self._condition.notify_all()
+
+    def record_failure(self) -> None:
+        """Counts a failure, opening the circuit once there are too many in a row"""
+        with self._condition:
+            self._failures += 1
+            if self.state == OPEN:
+                return
+            if self.state == HALF_OPEN:
+                self._current_cooldown = min(
+                    self.max_cooldown, self._current_cooldown * 2
+                )
+            elif self._failures < self.failure_threshold:
+                return
+
+            self.state = OPEN
+            self._opened_until = time.monotonic() + self._current_cooldown
+            get_metrics().increment("circuit_open_total")
+            print(
+                f"{self._failures} requests failed in a row,"
+                f" pausing the crawl for {self._current_cooldown:.0f} s."
+            )
+
+
+class Quarantine:
+    """
+    A directory of the pages that failed, each with its raw HTML and the error
+
+    Every page is saved as ``<key>.html`` with a ``<key>.json`` file holding
+    the link, the stage that failed, the error and its traceback, where the
+    key is a hash of the link. A page failing again replaces its entry.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory of the quarantine, created if it doesn't exist
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def _path(self, link: str, extension: str) -> str:
+        key = hashlib.sha1(link.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, key + extension)
+
+    def put(
+        self, link: str, page: str | None, error: BaseException, stage: str
+    ) -> None:
+        """
+        Saves a page that failed
+
+        :param link: The link to the page
+
+        :param page: The HTML of the page, None if it couldn't be fetched
+
+        :param error: The error raised
+
+        :param stage: The stage that failed, e.g. ``"fetch"`` or ``"extract"``
+        """
+        entry = {
+            "link": link,
+            "stage": stage,
+            "error": repr(error),
+            "traceback": "".join(traceback.format_exception(error)),
+            "quarantined_at": time.time(),
+        }
+        if page is not None:
+            _write_atomic(self._path(link, ".html"), page)
+        _write_atomic(
+            self._path(link, ".json"), json.dumps(entry, ensure_ascii=False, indent=2)
+        )
+        get_metrics().increment("quarantined_total", label=stage)
+
+    def __contains__(self, link: str) -> bool:
+        return os.path.exists(self._path(link, ".json"))
+
+    def __len__(self) -> int:
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """
+        :return: A generator that yields the link, stage, error, traceback
+            and quarantined_at of every page
+        """
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                with open(
+                    os.path.join(self.directory, name), encoding="utf-8"
+                ) as file:
+                    yield json.load(file)
+
+    def page(self, link: str) -> str | None:
+        """
+        :param link: The link to the page
+
+        :return: The saved HTML of the page, None if there's none
+        """
+        try:
+            with open(self._path(link, ".html"), encoding="utf-8") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def remove(self, link: str) -> None:
+        """
+        Releases a page from the quarantine, e.g. once it was extracted
+
+        :param link: The link to the page
+        """
+        for extension in (".html", ".json"):
+            try:
+                os.remove(self._path(link, extension))
+            except FileNotFoundError:
+                pass
+
+
+def _write_atomic(path: str, text: str) -> None:
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temporary, path)
@@ -1,171 +1,528 @@
-"""Functions that scrape the data from the gsmarena website"""
+"""Functions that scrape the data from the gsmarena website
 
-from collections.abc import Iterator
-import random
-import time
-from typing import List
+The ``*_async`` functions run on a :class:`utils.crawler.Crawler`, which keeps
+several requests in flight. The plain functions are thin wrappers that run
+them to completion, so existing scripts get the concurrency for free. They
+start an event loop of their own, so they can't be called from a running
+one, e.g. in Jupyter or in a coroutine, await the ``*_async`` ones there.
 
-from bs4 import Tag
+The ``*_generator`` functions don't use an event loop: they fetch one page
+at a time, only when the devices of the previous page have been consumed.
+"""
+
+import asyncio
+from collections.abc import Coroutine, Iterator
+import re
+from typing import Any, Collection, List, Tuple, TypeVar
+
+from bs4 import BeautifulSoup, Tag
 
 from utils.classes import Device, DeviceDetails, DeviceSpecs, Brand
-from utils.helper import get_document, next_page_link
-from utils.extractor import device_details, device_specs
+from utils.crawler import Crawler
+from utils.device_index import device_id
+from utils.frontier import Frontier
+from utils.helper import absolute_link, canonical_link, get_document, next_page_link
+from utils.lxml_extractor import device_details_from_html, device_specs_from_html
+from utils.metrics import get_metrics
+from utils.resilience import ExtractionError, Quarantine
 
 
-def get_brand_devices(link: str, rand_delay_max: int = 0) -> List[Device]:
+T = TypeVar("T")
+
+
+def _run(coroutine: Coroutine[Any, Any, T]) -> T:
     """
-    Extracts brand devices from the page
+    Runs a coroutine to completion in a new event loop
 
-    :param link: The link to the phone's page
+    :param coroutine: The coroutine of one of the ``*_async`` functions
 
-    :param rand_delay_max: The maximum value of the random delay in ms before sending the requests
+    :return: The result of the coroutine
 
-    :return: A dictionary containing the phone data
+    :raises RuntimeError: If an event loop is already running in the thread
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    coroutine.close()
+    raise RuntimeError(
+        f"An event loop is already running, e.g. in Jupyter or in a coroutine,"
+        f" use await {coroutine.__name__}(...) instead"
+    )
+
+
+def _parse_brand_devices(document: BeautifulSoup) -> List[Device]:
     """
+    Extracts the devices listed on a single page of a brand
+
+    :param document: The document of the brand's page
+
+    :return: A list of **Device** dataclass objects
+
+    :raises ExtractionError: If the page has no list of devices
+    """
+    section_body = document.find(
+        "div", attrs={"class": "section-body", "id": "review-body"}
+    )
+    if section_body is None:
+        raise ExtractionError("The page has no list of devices")
+
     devices: List[Device] = []
-    link: str | None
+    for a in section_body.find_all("a"):
+        img: Tag | None = a.find("img")
+        name: Tag | None = a.find("strong")
+        # Every device is a link with its name in bold, anything else isn't a device
+        if name is None or not a.get("href"):
+            continue
+
+        devices.append(
+            Device(
+                title=name.text,
+                extended_title=img.get("title") if img else None,
+                img_link=img.get("src") if img else None,
+                gsmarena_link=canonical_link(a.get("href")),
+            )
+        )
 
-    while link is not None:
-        if int(rand_delay_max) > 0:
-            time.sleep(random.randint(1, rand_delay_max) / 1000)
+    return devices
 
-        document = get_document(link)
 
-        section_body = document.find(
-            "div", attrs={"class": "section-body", "id": "review-body"}
+def _parse_page_links(document: BeautifulSoup) -> List[str]:
+    """
+    Extracts the links of the other pages listed in the page navigation of a brand
+
+    :param document: The document of the brand's first page
+
+    :return: The links to the other pages in the order they are listed
+    """
+    nav_pages = document.find("div", class_="nav-pages")
+
+    if nav_pages is None:
+        return []
+    return [
+        canonical_link(a.get("href"))
+        for a in nav_pages.find_all("a")
+        if a.get("href")
+    ]
+
+
+def _page_number(link: str) -> int:
+    """
+    Gets the number of the page from the link of a brand's page
+
+    :param link: The link to the brand's page, e.g. ``samsung-phones-f-9-0-p2.php``
+
+    :return: The page number, 1 for the first page
+    """
+    match = re.search(r"-p(\d+)\.php$", link)
+    return int(match.group(1)) if match else 1
+
+
+def _parse_brands(document: BeautifulSoup) -> List[Brand]:
+    """
+    Extracts the brands from the makers page
+
+    :param document: The document of the makers page
+
+    :return: A list of brands
+
+    :raises ExtractionError: If the page has no table of brands
+    """
+    st_text = document.find("div", class_="st-text")
+    table = st_text.find("table") if st_text else None
+    if table is None:
+        raise ExtractionError("The page has no table of brands")
+
+    brands: List[Brand] = []
+
+    td: Tag
+    for td in table.find_all("td"):
+        td_a = td.find("a")
+        td_span = td.find("span")
+        if td_a is None or td_span is None or not td_a.get("href"):
+            continue
+        brand = Brand(
+            id=td_a.get("href").split(".")[0],
+            name=next(td_a.stripped_strings),
+            number_of_devices=int(td_span.text.split(" ")[0]),
+            gsmarena_link=canonical_link(td_a.get("href")),
         )
+        brands.append(brand)
 
-        for a in section_body.find_all("a"):
-            img: Tag = a.find("img")
-            name: Tag = a.find("strong")
+    return brands
 
-            devices.append(
-                Device(
-                    title=name.text,
-                    extended_title=img.get("title"),
-                    img_link=img.get("src"),
-                    gsmarena_link=a.get("href"),
-                )
-            )
 
-        link = next_page_link(document)
+async def get_brand_devices_async(
+    link: str,
+    rand_delay_max: int = 0,
+    crawler: Crawler | None = None,
+) -> List[Device]:
+    """
+    Extracts brand devices from gsmarena, fetching the listing pages concurrently
+
+    The first page is fetched on its own, then every page listed in its page
+    navigation is fetched at once. Any page not listed there is still reached
+    by following the "Next page" button of the last page.
+
+    :param link: The link to the brand's page on gsmarena
+
+    :param rand_delay_max: Kept for compatibility, the requests are paced by the adaptive
+        rate limiter of the shared fetcher instead
 
+    :param crawler: The crawler to fetch the pages with, a new one is used if not given
+
+    :return: A list of **Device** dataclass objects in the order they are listed,
+        with canonical links
+    """
+    if crawler is None:
+        async with Crawler() as crawler:
+            return await get_brand_devices_async(link, crawler=crawler)
+
+    document = await crawler.fetch_document(link)
+    documents = [document]
+
+    seen = {link}
+    page_links = [page for page in _parse_page_links(document) if page not in seen]
+    seen.update(page_links)
+    documents += await asyncio.gather(
+        *(crawler.fetch_document(page) for page in page_links)
+    )
+
+    next_link = next_page_link(documents[-1])
+    while next_link is not None and next_link not in seen:
+        seen.add(next_link)
+        document = await crawler.fetch_document(next_link)
+        documents.append(document)
+        next_link = next_page_link(document)
+
+    devices: List[Device] = []
+    with get_metrics().timer("extract"):
+        for document in documents:
+            devices += _parse_brand_devices(document)
     return devices
 
 
-def get_brand_devices_generator(link: str, rand_delay_max: int = 0) -> Iterator[Device]:
+async def get_new_brand_devices_async(
+    link: str, known_ids: Collection[int], crawler: Crawler | None = None
+) -> List[Device]:
     """
-    Extracts brand devices from gsmarena,
+    Extracts the devices listed before the first device already known
+
+    Brands list their newest devices first, so once a known device shows up
+    the rest of the listing is known too. The pages are fetched one by one,
+    following the "Next page" button, and pagination stops at the page
+    holding the first known device.
 
     :param link: The link to the brand's page on gsmarena
 
-    :param rand_delay_max: The maximum value of the random delay in ms before sending the requests
+    :param known_ids: The IDs of the devices of the brand already stored
 
-    :return: A generator that yields **Device** dataclass objects
+    :param crawler: The crawler to fetch the pages with, a new one is used if not given
+
+    :return: A list of the new **Device** dataclass objects in the order they are listed
     """
-    link: str | None
+    if crawler is None:
+        async with Crawler() as crawler:
+            return await get_new_brand_devices_async(link, known_ids, crawler)
 
-    while link is not None:
-        if int(rand_delay_max) > 0:
-            time.sleep(random.randint(1, rand_delay_max) / 1000)
+    devices: List[Device] = []
+    seen = set()
+    next_link: str | None = link
+    while next_link is not None and next_link not in seen:
+        seen.add(next_link)
+        document = await crawler.fetch_document(next_link)
+
+        with get_metrics().timer("extract"):
+            page_devices = _parse_brand_devices(document)
+        for device in page_devices:
+            if device_id(device.gsmarena_link) in known_ids:
+                return devices
+            devices.append(device)
+
+        next_link = next_page_link(document)
+    return devices
 
-        document = get_document(link)
 
-        section_body = document.find(
-            "div", attrs={"class": "section-body", "id": "review-body"}
-        )
+async def _fetched_html(crawler: Crawler, link: str) -> str | None:
+    # The HTML as it was fetched, from the HTTP cache, rather than the
+    # document serialized again, so a quarantined page can be replayed as is
+    try:
+        return await crawler.fetch_html(link)
+    except Exception:  # pylint: disable=broad-except
+        return None
 
-        for a in section_body.find_all("a"):
-            img: Tag = a.find("img")
-            name: Tag = a.find("strong")
 
-            yield Device(
-                title=name.text,
-                extended_title=img.get("title"),
-                img_link=img.get("src"),
-                gsmarena_link="https://www.gsmarena.com/" + a.get("href"),
+async def crawl_brand_devices_async(
+    brand: Brand,
+    frontier: Frontier,
+    crawler: Crawler | None = None,
+    quarantine: Quarantine | None = None,
+) -> List[Device]:
+    """
+    Extracts brand devices from gsmarena, checkpointing every listing page in the frontier
+
+    Listing pages already done in the frontier aren't fetched again, their
+    devices are read back from it. Pages that fail to be fetched or extracted
+    are marked as failed, the next run can queue them again with
+    :meth:`Frontier.retry_failed`. Without a quarantine a **RuntimeError** is
+    raised once the other pages are done.
+
+    :param brand: The brand to extract the devices of
+
+    :param frontier: The frontier of the crawl
+
+    :param crawler: The crawler to fetch the pages with, a new one is used if not given
+
+    :param quarantine: Keeps the failed pages, the devices of the other pages are
+        then returned instead of raising
+
+    :return: A list of **Device** dataclass objects in the order they are listed
+    """
+    if crawler is None:
+        async with Crawler() as crawler:
+            return await crawl_brand_devices_async(
+                brand, frontier, crawler, quarantine
             )
 
-        link = next_page_link(document)
+    frontier.add(brand.gsmarena_link, "listing", parent=brand.id, position=1)
+
+    failed = 0
+    while links := frontier.claim(
+        "listing", parent=brand.id, limit=crawler.max_concurrency
+    ):
+        documents = await asyncio.gather(
+            *(crawler.fetch_document(link) for link in links), return_exceptions=True
+        )
+        for link, document in zip(links, documents):
+            if isinstance(document, Exception):
+                frontier.fail(link, repr(document))
+                if quarantine is not None:
+                    quarantine.put(link, None, document, "fetch")
+                failed += 1
+                continue
+
+            try:
+                with get_metrics().timer("extract"):
+                    devices = _parse_brand_devices(document)
+            except Exception as error:  # pylint: disable=broad-except
+                frontier.fail(link, repr(error))
+                if quarantine is not None:
+                    quarantine.put(
+                        link, await _fetched_html(crawler, link), error, "extract"
+                    )
+                failed += 1
+                continue
+
+            pages = _parse_page_links(document)
+            next_link = next_page_link(document)
+            if next_link is not None:
+                pages.append(next_link)
+            for page in pages:
+                frontier.add(
+                    page, "listing", parent=brand.id, position=_page_number(page)
+                )
+            frontier.complete(link, [device.to_dict() for device in devices])
+            if quarantine is not None and link in quarantine:
+                quarantine.remove(link)
+
+    if failed and quarantine is None:
+        raise RuntimeError(f"{failed} listing page(s) of {brand.name} failed")
+    if failed:
+        print(
+            f"{failed} listing page(s) of {brand.name} failed,"
+            f" see {quarantine.directory}"
+        )
+
+    return [
+        Device(**device)
+        for page in frontier.results("listing", parent=brand.id)
+        for device in page
+    ]
 
 
-def get_device_details(link: str) -> DeviceDetails:
+async def get_device_details_async(
+    link: str, crawler: Crawler | None = None
+) -> DeviceDetails:
     """
     Extracts the device details from the page
 
     :param link: The link to the device's page
 
-    :return: A dictionary containing the device data
-    """
+    :param crawler: The crawler to fetch the page with, a new one is used if not given
 
-    document = get_document(link)
+    :return: A dataclass containing the device details
+    """
+    if crawler is None:
+        async with Crawler() as crawler:
+            return await get_device_details_async(link, crawler)
 
-    # Extracting the data
-    return device_details(document)
+    tree = await crawler.fetch_tree(link)
+    with get_metrics().timer("extract"):
+        return device_details_from_html(tree)
 
 
-def get_device_specs(link: str) -> DeviceSpecs:
+async def get_device_specs_async(
+    link: str, crawler: Crawler | None = None
+) -> DeviceSpecs:
     """
     Extracts the device specs from the page
 
     :param link: The link to the device's page
 
-    :return: A dictionary containing the device specs
+    :param crawler: The crawler to fetch the page with, a new one is used if not given
+
+    :return: A dataclass containing the device specs
+    """
+    if crawler is None:
+        async with Crawler() as crawler:
+            return await get_device_specs_async(link, crawler)
+
+    tree = await crawler.fetch_tree(link)
+    with get_metrics().timer("extract"):
+        return device_specs_from_html(tree)
+
+
+async def get_device_async(
+    link: str, crawler: Crawler | None = None
+) -> Tuple[DeviceDetails, DeviceSpecs]:
     """
+    Extracts both the device details and the device specs from a single parse of the page
 
-    document = get_document(link)
+    :param link: The link to the device's page
 
-    # Extracting the data
-    return device_specs(document)
+    :param crawler: The crawler to fetch the page with, a new one is used if not given
 
+    :return: The dataclasses containing the device details and the device specs
+    """
+    if crawler is None:
+        async with Crawler() as crawler:
+            return await get_device_async(link, crawler)
 
-def get_brands() -> List[Brand]:
+    tree = await crawler.fetch_tree(link)
+    with get_metrics().timer("extract"):
+        return device_details_from_html(tree), device_specs_from_html(tree)
+
+
+async def get_brands_async(crawler: Crawler | None = None) -> List[Brand]:
     """
     Extracts the brands from the page
 
+    :param crawler: The crawler to fetch the page with, a new one is used if not given
+
     :return: A list of brands
     """
+    if crawler is None:
+        async with Crawler() as crawler:
+            return await get_brands_async(crawler)
 
-    document = get_document("https://www.gsmarena.com/makers.php3")
+    document = await crawler.fetch_document(absolute_link("makers.php3"))
+    with get_metrics().timer("extract"):
+        return _parse_brands(document)
 
-    table = document.find("div", class_="st-text").find("table")
 
-    brands: List[Brand] = []
+def get_brand_devices(link: str, rand_delay_max: int = 0) -> List[Device]:
+    """
+    Extracts brand devices from the page
 
-    td: Tag
-    for td in table.find_all("td"):
-        td_a = td.find("a")
-        td_span = td.find("span")
-        brand = Brand(
-            id=td_a.get("href").split(".")[0],
-            name=next(td_a.stripped_strings),
-            number_of_devices=int(td_span.text.split(" ")[0]),
-            gsmarena_link="https://www.gsmarena.com/" + td_a.get("href"),
-        )
-        brands.append(brand)
+    :param link: The link to the phone's page
 
-    return brands
+    :param rand_delay_max: Kept for compatibility, the requests are paced by the adaptive
+        rate limiter of the shared fetcher instead
+
+    :return: A dictionary containing the phone data
+    """
+    return _run(get_brand_devices_async(link, rand_delay_max))
 
 
-def get_brands_generator() -> Iterator[Brand]:
+def get_new_brand_devices(link: str, known_ids: Collection[int]) -> List[Device]:
+    """
+    Extracts the devices listed before the first device already known
+
+    :param link: The link to the brand's page on gsmarena
+
+    :param known_ids: The IDs of the devices of the brand already stored
+
+    :return: A list of the new **Device** dataclass objects
+    """
+    return _run(get_new_brand_devices_async(link, known_ids))
+
+
+def get_brand_devices_generator(link: str, rand_delay_max: int = 0) -> Iterator[Device]:
+    """
+    Extracts brand devices from gsmarena, page by page
+
+    The pages are fetched one by one, following the "Next page" button, each
+    one once the devices of the previous one were consumed. Use
+    :func:`get_brand_devices` to fetch them concurrently.
+
+    :param link: The link to the brand's page on gsmarena
+
+    :param rand_delay_max: Kept for compatibility, the requests are paced by the adaptive
+        rate limiter of the shared fetcher instead
+
+    :return: A generator that yields **Device** dataclass objects
+    """
+    seen = set()
+    next_link: str | None = link
+    while next_link is not None and next_link not in seen:
+        seen.add(next_link)
+        document = get_document(next_link)
+        with get_metrics().timer("extract"):
+            devices = _parse_brand_devices(document)
+        yield from devices
+        next_link = next_page_link(document)
+
+
+def get_device_details(link: str) -> DeviceDetails:
+    """
+    Extracts the device details from the page
+
+    :param link: The link to the device's page
+
+    :return: A dictionary containing the device data
+    """
+    return _run(get_device_details_async(link))
+
+
+def get_device_specs(link: str) -> DeviceSpecs:
+    """
+    Extracts the device specs from the page
+
+    :param link: The link to the device's page
+
+    :return: A dictionary containing the device specs
+    """
+    return _run(get_device_specs_async(link))
+
+
+def get_device(link: str) -> Tuple[DeviceDetails, DeviceSpecs]:
+    """
+    Extracts both the device details and the device specs from a single parse of the page
+
+    :param link: The link to the device's page
+
+    :return: The dataclasses containing the device details and the device specs
+    """
+    return _run(get_device_async(link))
+
+
+def get_brands() -> List[Brand]:
     """
     Extracts the brands from the page
 
-    :return: A generator that yields **Brand** dataclass objects
+    :return: A list of brands
     """
+    return _run(get_brands_async())
 
-    document = get_document("https://www.gsmarena.com/makers.php3")
 
-    table = document.find("div", class_="st-text").find("table")
+def get_brands_generator() -> Iterator[Brand]:
+    """
+    Extracts the brands from the page
 
-    td: Tag
-    for td in table.find_all("td"):
-        td_a = td.find("a")
-        td_span = td.find("span")
-        brand = Brand(
-            id=td_a.get("href").split(".")[0],
-            name=next(td_a.stripped_strings),
-            number_of_devices=int(td_span.text.split(" ")[0]),
-            gsmarena_link="https://www.gsmarena.com/" + td_a.get("href"),
-        )
-        yield brand
+    :return: A generator that yields **Brand** dataclass objects, the page
+        is only fetched once the first one is asked for
+    """
+    document = get_document(absolute_link("makers.php3"))
+    with get_metrics().timer("extract"):
+        brands = _parse_brands(document)
+    yield from brands
@@ -0,0 +1,499 @@
+"""A shared queue of crawl shards leased by workers on any number of machines
+
+The crawl is split into a fixed number of shards by hashing the brand ids
+(listing pages) and the device ids (spec pages), see :func:`shard_of`. A
+coordinator publishes the shards of a job, and every worker leases one shard
+at a time for ``ttl`` seconds and renews the lease while it works on it.
+The shards of a worker that dies are leased again once their lease expires,
+up to ``max_attempts`` times, so a shard that kills every worker taking it
+ends up failed instead of going round the workers forever.
+
+The queue lives in a SQLite file, for workers sharing a disk, or in Redis,
+which needs the optional **redis** package: ``pip install redis``. Use
+:func:`open_queue` with ``sqlite:///path/to/queue.sqlite`` or
+``redis://host:6379/0``.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_ATTEMPTS = 5
+
+# The error of a shard failed because its last lease expired
+LEASE_EXPIRED = "the lease expired, the worker stopped"
+
+
+def shard_of(key: str | int, shards: int) -> int:
+    """
+    Maps a key to its shard, the same on every machine and every run
+
+    Python's ``hash`` is salted per process, so a stable hash is used instead.
+
+    :param key: A brand id or a device id
+
+    :param shards: The number of shards
+
+    :return: The shard of the key, from 0 to ``shards - 1``
+    """
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+@dataclass
+class Lease:
+    """A shard leased by a worker"""
+
+    job: str
+    shard: int
+    worker: str
+    attempt: int
+
+
+class SqliteShardQueue:
+    """
+    A queue of shards in a SQLite file, shared by the workers of a single disk
+
+    Leases are taken in an immediate transaction, so two processes never
+    lease the same shard.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The path of the SQLite file, created if it doesn't exist
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        # Transactions are started explicitly, see _transaction
+        self._connection = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS shards (
+                job TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job, shard)
+            )
+            """
+        )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def publish(self, job: str, shards: int) -> None:
+        """
+        Queues the shards of a job, the shards already queued are left as they are
+
+        :param job: The name of the job, e.g. ``"listings"``
+
+        :param shards: The number of shards of the job
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO shards (job, shard, state, updated_at)"
+                " VALUES (?, ?, ?, ?)",
+                [(job, shard, PENDING, now) for shard in range(shards)],
+            )
+
+    def lease(
+        self,
+        job: str,
+        worker: str,
+        ttl: float = DEFAULT_TTL,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> Lease | None:
+        """
+        Leases a pending shard, or a shard whose lease expired
+
+        :param job: The name of the job
+
+        :param worker: The name of the worker
+
+        :param ttl: The number of seconds the lease lasts unless it's renewed
+
+        :param max_attempts: The number of attempts after which a shard whose
+            lease expired is failed instead of leased again
+
+        :return: The lease, None if every shard is done, leased or failed
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE shards SET state = ?, error = ?, updated_at = ?"
+                " WHERE job = ? AND state = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, LEASE_EXPIRED, now, job, LEASED, now, max_attempts),
+            )
+            row = connection.execute(
+                "SELECT shard, attempts FROM shards WHERE job = ?"
+                " AND (state = ? OR (state = ? AND lease_expires < ?))"
+                " ORDER BY shard LIMIT 1",
+                (job, PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            shard, attempts = row
+            connection.execute(
+                "UPDATE shards SET state = ?, worker = ?, lease_expires = ?,"
+                " attempts = attempts + 1, updated_at = ? WHERE job = ? AND shard = ?",
+                (LEASED, worker, now + ttl, now, job, shard),
+            )
+        return Lease(job, shard, worker, attempts + 1)
+
+    def renew(self, lease: Lease, ttl: float = DEFAULT_TTL) -> bool:
+        """
+        Extends a lease
+
+        :param lease: The lease
+
+        :param ttl: The number of seconds the lease lasts from now on
+
+        :return: False if the shard was leased to another worker in the meantime
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE shards SET lease_expires = ?, updated_at = ?"
+                " WHERE job = ? AND shard = ? AND state = ? AND worker = ?",
+                (now + ttl, now, lease.job, lease.shard, LEASED, lease.worker),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, lease: Lease) -> bool:
+        """
+        Marks a leased shard as done
+
+        :param lease: The lease
+
+        :return: False if the shard was leased to another worker in the meantime
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE shards SET state = ?, error = NULL, updated_at = ?"
+                " WHERE job = ? AND shard = ? AND state = ? AND worker = ?",
+                (DONE, time.time(), lease.job, lease.shard, LEASED, lease.worker),
+            )
+        return cursor.rowcount == 1
+
+    def fail(
+        self, lease: Lease, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    ) -> None:
+        """
+        Puts a leased shard back in the queue, or marks it as failed after too many attempts
+
+        :param lease: The lease
+
+        :param error: A description of the error
+
+        :param max_attempts: The number of attempts after which the shard is failed
+        """
+        state = FAILED if lease.attempt >= max_attempts else PENDING
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE shards SET state = ?, error = ?, updated_at = ?"
+                " WHERE job = ? AND shard = ? AND state = ? AND worker = ?",
+                (
+                    state,
+                    error,
+                    time.time(),
+                    lease.job,
+                    lease.shard,
+                    LEASED,
+                    lease.worker,
+                ),
+            )
+
+    def counts(self, job: str) -> Dict[str, int]:
+        """
+        :param job: The name of the job
+
+        :return: The number of shards of the job in each state
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, COUNT(*) FROM shards WHERE job = ? GROUP BY state",
+                (job,),
+            ).fetchall()
+        return dict(rows)
+
+    def clear(self) -> None:
+        """Removes every job"""
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM shards")
+
+    def close(self) -> None:
+        """Closes the database"""
+        with self._lock:
+            self._connection.close()
+
+
+# Moves the expired leases back to the pending list, or to the failed set
+# after max_attempts, then leases the first pending shard, atomically
+_REDIS_LEASE = """
+local now = tonumber(ARGV[1])
+local max_attempts = tonumber(ARGV[4])
+for _, shard in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], shard)
+    redis.call('HDEL', KEYS[3], shard)
+    if tonumber(redis.call('HGET', KEYS[4], shard) or '0') >= max_attempts then
+        redis.call('SADD', KEYS[6], shard)
+        redis.call('HSET', KEYS[7], shard, ARGV[5])
+    else
+        redis.call('RPUSH', KEYS[1], shard)
+    end
+end
+local shard = redis.call('LPOP', KEYS[1])
+if not shard then
+    return false
+end
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), shard)
+redis.call('HSET', KEYS[3], shard, ARGV[3])
+return {shard, redis.call('HINCRBY', KEYS[4], shard, 1)}
+"""
+
+# Runs ARGV[3..] only while the shard is still leased to the worker
+_REDIS_IF_OWNER = """
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2]
+    or not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    return 0
+end
+if ARGV[3] == 'renew' then
+    redis.call('ZADD', KEYS[2], tonumber(ARGV[4]), ARGV[1])
+elseif ARGV[3] == 'complete' then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    redis.call('SADD', KEYS[5], ARGV[1])
+elseif ARGV[3] == 'retry' then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+elseif ARGV[3] == 'fail' then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    redis.call('SADD', KEYS[6], ARGV[1])
+end
+return 1
+"""
+
+
+def _redis():
+    try:
+        import redis  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise ImportError(
+            "A Redis queue needs the redis package: pip install redis"
+        ) from error
+    return redis
+
+
+class RedisShardQueue:
+    """
+    A queue of shards in Redis, shared by workers on any number of machines
+
+    Every job is kept under ``<prefix>:<job>:`` keys: a list of the pending
+    shards, a sorted set of the leased shards by lease expiry, a hash of the
+    worker holding each lease, a hash of the attempts and sets of the done
+    and failed shards. Leases are taken and released by Lua scripts, so
+    they are atomic. Any server speaking the Redis protocol will do.
+    """
+
+    def __init__(self, url: str, prefix: str = "gsmarena"):
+        """
+        :param url: The URL of the server, e.g. ``redis://localhost:6379/0``
+
+        :param prefix: The prefix of the keys
+        """
+        self.client = _redis().Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._lease = self.client.register_script(_REDIS_LEASE)
+        self._if_owner = self.client.register_script(_REDIS_IF_OWNER)
+
+    def _keys(self, job: str):
+        base = f"{self.prefix}:{job}:"
+        return [
+            base + name
+            for name in ("pending", "leases", "workers", "attempts", "done", "failed")
+        ]
+
+    def publish(self, job: str, shards: int) -> None:
+        """
+        Queues the shards of a job, unless it was published already
+
+        :param job: The name of the job, e.g. ``"listings"``
+
+        :param shards: The number of shards of the job
+        """
+        if self.client.set(f"{self.prefix}:{job}:published", shards, nx=True):
+            self.client.rpush(self._keys(job)[0], *range(shards))
+
+    def lease(
+        self,
+        job: str,
+        worker: str,
+        ttl: float = DEFAULT_TTL,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> Lease | None:
+        """
+        Leases a pending shard, or a shard whose lease expired
+
+        :param job: The name of the job
+
+        :param worker: The name of the worker
+
+        :param ttl: The number of seconds the lease lasts unless it's renewed
+
+        :param max_attempts: The number of attempts after which a shard whose
+            lease expired is failed instead of leased again
+
+        :return: The lease, None if every shard is done, leased or failed
+        """
+        result = self._lease(
+            keys=[*self._keys(job), f"{self.prefix}:{job}:errors"],
+            args=[time.time(), ttl, worker, max_attempts, LEASE_EXPIRED],
+        )
+        if not result:
+            return None
+        shard, attempt = result
+        return Lease(job, int(shard), worker, int(attempt))
+
+    def _owned(self, lease: Lease, action: str, *args) -> bool:
+        return bool(
+            self._if_owner(
+                keys=self._keys(lease.job),
+                args=[lease.shard, lease.worker, action, *args],
+            )
+        )
+
+    def renew(self, lease: Lease, ttl: float = DEFAULT_TTL) -> bool:
+        """
+        Extends a lease
+
+        :return: False if the shard was leased to another worker in the meantime
+        """
+        return self._owned(lease, "renew", time.time() + ttl)
+
+    def complete(self, lease: Lease) -> bool:
+        """
+        Marks a leased shard as done
+
+        :return: False if the shard was leased to another worker in the meantime
+        """
+        return self._owned(lease, "complete")
+
+    def fail(
+        self, lease: Lease, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    ) -> None:
+        """
+        Puts a leased shard back in the queue, or marks it as failed after too many attempts
+        """
+        self.client.hset(f"{self.prefix}:{lease.job}:errors", lease.shard, error)
+        self._owned(lease, "fail" if lease.attempt >= max_attempts else "retry")
+
+    def counts(self, job: str) -> Dict[str, int]:
+        """
+        :param job: The name of the job
+
+        :return: The number of shards of the job in each state
+        """
+        pending, leases, _, _, done, failed = self._keys(job)
+        counts = {
+            PENDING: self.client.llen(pending),
+            LEASED: self.client.zcard(leases),
+            DONE: self.client.scard(done),
+            FAILED: self.client.scard(failed),
+        }
+        return {state: count for state, count in counts.items() if count}
+
+    def clear(self) -> None:
+        """Removes every job"""
+        keys = list(self.client.scan_iter(f"{self.prefix}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def close(self) -> None:
+        """Closes the connection"""
+        self.client.close()
+
+
+def open_queue(url: str) -> SqliteShardQueue | RedisShardQueue:
+    """
+    Opens the queue at a URL
+
+    :param url: ``redis://...`` or ``rediss://...`` for Redis,
+        ``sqlite:///path`` or a plain path for SQLite
+
+    :return: The queue
+    """
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisShardQueue(url)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///") :]
+    return SqliteShardQueue(url)
+
+
+@contextmanager
+def keep_alive(
+    queue: SqliteShardQueue | RedisShardQueue, lease: Lease, ttl: float = DEFAULT_TTL
+) -> Iterator[threading.Event]:
+    """
+    Renews a lease on a background thread while the block runs
+
+    :param queue: The queue the lease was taken from
+
+    :param lease: The lease
+
+    :param ttl: The duration of the lease, it's renewed every third of it
+
+    :return: An event set when the lease was lost to another worker
+    """
+    stop = threading.Event()
+    lost = threading.Event()
+
+    def renew():
+        while not stop.wait(ttl / 3):
+            try:
+                if not queue.renew(lease, ttl):
+                    lost.set()
+                    return
+            except Exception:  # pylint: disable=broad-except
+                # The next renewal may get through, the lease isn't lost yet
+                pass
+
+    thread = threading.Thread(target=renew, name=f"lease-{lease.shard}", daemon=True)
+    thread.start()
+    try:
+        yield lost
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,176 @@
+"""Columns for every row of the specs list, discovered from the pages instead of declared
+
+:class:`~utils.classes.DeviceSpecs` has a field for each of the ~45 specs it
+knows about, anything else on the page is dropped. The specs table of
+:func:`utils.lxml_extractor.device_spec_table_from_html` instead keeps every
+row, keyed by a column named after its section and label, e.g. ``"Sound"`` and
+``"3.5mm jack"`` make ``"sound_3_5mm_jack"``. :class:`SpecSchema` records the
+columns seen across pages, so the specs tables can be written as rows.
+"""
+
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, Iterable, List, Tuple
+
+from utils.classes import DeviceSpecTable
+from utils.writers import temp_path
+
+# (section, label) -> column, every label is only normalized the first time
+# it's seen and the names are interned, so every table shares one copy of each
+_COLUMNS: Dict[Tuple[str, str], str] = {}
+
+_NOT_NAME = re.compile(r"[^a-z0-9]+")
+
+
+def column_name(section: str, label: str) -> str:
+    """
+    :param section: The header of the row's table, e.g. ``"Main Camera"``
+
+    :param label: The label of the row, e.g. ``"Video"``
+
+    :return: The column of the row, e.g. ``"main_camera_video"``
+    """
+    key = (section, label)
+    name = _COLUMNS.get(key)
+    if name is None:
+        name = _NOT_NAME.sub("_", f"{section} {label}".lower()).strip("_")
+        name = _COLUMNS[key] = sys.intern(name)
+    return name
+
+
+class SpecSchema:
+    """
+    The columns of the specs tables seen so far, in the order they were first seen
+
+    Adding every table to the schema, then writing :meth:`row` of each gives
+    rows of the same width, with None for the specs a device doesn't have.
+    The number of devices having each column, see :meth:`by_count`, tells
+    the common specs from the rare ones::
+
+        schema = SpecSchema()
+        for table in tables:
+            schema.add(table)
+        schema.save("data/spec_schema.json")
+
+    The columns keep the order they were first seen in across runs, so the
+    rows of a later run extend those of the previous ones.
+    """
+
+    def __init__(
+        self, columns: List[str] | None = None, counts: List[int] | None = None
+    ):
+        """
+        :param columns: The columns, as saved by :meth:`save`
+
+        :param counts: The number of devices having each column
+        """
+        self.columns: List[str] = []
+        self.counts: List[int] = []
+        self._index: Dict[str, int] = {}
+        columns = columns or []
+        for column, count in zip(columns, counts or [0] * len(columns)):
+            self._index[column] = len(self.columns)
+            self.columns.append(sys.intern(column))
+            self.counts.append(count)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._index
+
+    def add(self, table: DeviceSpecTable) -> List[str]:
+        """
+        Records the columns of a specs table
+
+        Every table added is counted, adding the table of a device that was
+        already counted counts it twice, see :meth:`recount`.
+
+        :param table: The specs table of a device
+
+        :return: The columns that weren't in the schema yet
+        """
+        new = []
+        for column in table.specs:
+            index = self._index.get(column)
+            if index is None:
+                index = self._append(column)
+                new.append(column)
+            self.counts[index] += 1
+        return new
+
+    def recount(self, records: Iterable[Dict[str, Any]]) -> None:
+        """
+        Counts the devices having each column again, from their latest specs
+
+        A refresh appends the specs of the devices that changed after their
+        previous ones, so each device is only counted once, with its latest
+        columns.
+
+        :param records: The records of device_specs_all.jsonl, a device's
+            latest specs after its previous ones
+        """
+        latest: Dict[Any, Tuple[int, ...]] = {}
+        for record in records:
+            latest[record["device_id"]] = tuple(
+                self._index[column]
+                if column in self._index
+                else self._append(column)
+                for column in record["specs"]
+            )
+        self.counts = [0] * len(self.columns)
+        for indexes in latest.values():
+            for index in indexes:
+                self.counts[index] += 1
+
+    def _append(self, column: str) -> int:
+        index = self._index[column] = len(self.columns)
+        self.columns.append(sys.intern(column))
+        self.counts.append(0)
+        return index
+
+    def row(self, table: DeviceSpecTable) -> Tuple[Any, ...]:
+        """
+        :param table: The specs table of a device, added to the schema
+
+        :return: The value of every column, in the order of **columns**
+        """
+        return tuple(table.specs.get(column) for column in self.columns)
+
+    def by_count(self) -> List[Tuple[str, int]]:
+        """
+        :return: The columns and the number of devices having each one, the
+            most common first, in the order they were first seen otherwise
+        """
+        return sorted(zip(self.columns, self.counts), key=lambda pair: -pair[1])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: The columns, in the order they were first seen, and their counts
+        """
+        return {"columns": list(self.columns), "counts": list(self.counts)}
+
+    def save(self, path: str) -> None:
+        """
+        Saves the schema, read back by :meth:`load`
+
+        :param path: The path of the JSON file, replaced atomically
+        """
+        with open(temp_path(path), "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=1)
+        os.replace(temp_path(path), path)
+
+    @classmethod
+    def load(cls, path: str) -> "SpecSchema":
+        """
+        :param path: The path of a file written by :meth:`save`
+
+        :return: The schema, empty if the file doesn't exist
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as file:
+            saved = json.load(file)
+        return cls(saved["columns"], saved["counts"])
@@ -0,0 +1,353 @@
+"""Batched writers of records to CSV, JSON Lines, Parquet or SQLite files, replaced atomically
+
+Every writer writes to a temporary file next to its destination and moves it
+in place once it's closed, so a reader sees either the previous file or the
+new one whole, never a half-written one, and a run that crashes leaves the
+previous file as it was. Rows are buffered and written ``batch_size`` at a
+time, in a single transaction for SQLite::
+
+    with open_writer("parquet", path, Device.field_names()) as writer:
+        writer.write_many(device.to_row() for device in devices)
+
+Parquet needs the optional **pyarrow** package: ``pip install pyarrow``
+"""
+
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+import csv
+import json
+import os
+import re
+import sqlite3
+from typing import Any, ClassVar, Dict, List, Sequence
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def slugify(text: str) -> str:
+    """
+    Makes a file name out of a text, e.g. a brand id
+
+    :param text: The text, e.g. ``"at&t-phones-57"``
+
+    :return: The lower case text with every character but letters, digits,
+        ``-`` and ``_`` replaced by ``-``, e.g. ``"at-t-phones-57"``
+    """
+    return re.sub(r"[^a-z0-9_-]+", "-", text.lower()).strip("-") or "-"
+
+
+def temp_path(path: str) -> str:
+    """
+    :param path: The path of a file
+
+    :return: The path of a temporary file in the same directory, moved over
+        the file with ``os.replace``. It's hidden, so a Parquet dataset
+        doesn't read it as one of its files
+    """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+
+
+class RecordWriter(ABC):
+    """
+    Writes rows of records to a file in batches, replacing the file atomically on close
+
+    Closing the writer makes the rows visible, leaving a ``with`` block on an
+    exception discards them. Subclasses write the batches to ``self.temp``.
+    """
+
+    extension: ClassVar[str] = ""
+
+    def __init__(
+        self,
+        path: str,
+        field_names: Sequence[str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        """
+        :param path: The path of the file, replaced when the writer is closed
+
+        :param field_names: The names of the values of every row, e.g. ``Device.field_names()``
+
+        :param batch_size: The number of rows buffered before they are written
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.temp = temp_path(path)
+        self.field_names = tuple(field_names)
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.closed = False
+        self._batch: List[Sequence[Any]] = []
+
+    def write(self, row: Sequence[Any]) -> None:
+        """
+        Buffers a row, writing the batch once it's full
+
+        :param row: The values of the fields, in the order of **field_names**
+        """
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, rows: Iterable[Sequence[Any]]) -> None:
+        """
+        Buffers rows, writing them in batches
+
+        :param rows: The rows, each in the order of **field_names**
+        """
+        for row in rows:
+            self.write(row)
+
+    def flush(self) -> None:
+        """Writes the buffered rows to the temporary file"""
+        if self._batch:
+            self._write_batch(self._batch)
+            self.rows_written += len(self._batch)
+            self._batch = []
+
+    def close(self) -> None:
+        """Writes the remaining rows and moves the file in place"""
+        if self.closed:
+            return
+        self.flush()
+        self._finish()
+        self.closed = True
+        os.replace(self.temp, self.path)
+
+    def abort(self) -> None:
+        """Discards the rows written, leaving the file as it was"""
+        if self.closed:
+            return
+        self._batch = []
+        try:
+            self._finish()
+        finally:
+            self.closed = True
+            if os.path.exists(self.temp):
+                os.remove(self.temp)
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @abstractmethod
+    def _write_batch(self, rows: List[Sequence[Any]]) -> None:
+        """Writes a batch of rows to the temporary file"""
+
+    def _finish(self) -> None:
+        """Closes the temporary file"""
+
+    @classmethod
+    @abstractmethod
+    def read(cls, path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Reads back the records of a file written by this writer
+
+        :param path: The path of the file
+
+        :return: A generator that yields one dictionary per row
+        """
+
+
+class CsvRecordWriter(RecordWriter):
+    """Writes the rows to a CSV file, the field names as its header"""
+
+    extension = ".csv"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file = open(self.temp, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.field_names)
+
+    def _write_batch(self, rows: List[Sequence[Any]]) -> None:
+        self._writer.writerows(rows)
+
+    def _finish(self) -> None:
+        self._file.close()
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, newline="", encoding="utf-8") as file:
+            yield from csv.DictReader(file)
+
+
+class JsonLinesRecordWriter(RecordWriter):
+    """Writes every row to a JSON Lines file as an object keyed by the field names"""
+
+    extension = ".jsonl"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file = open(self.temp, "w", encoding="utf-8")
+
+    def _write_batch(self, rows: List[Sequence[Any]]) -> None:
+        self._file.write(
+            "".join(
+                json.dumps(dict(zip(self.field_names, row)), ensure_ascii=False) + "\n"
+                for row in rows
+            )
+        )
+
+    def _finish(self) -> None:
+        self._file.close()
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _pyarrow():
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError as error:
+        raise ImportError(
+            "Writing Parquet files needs the pyarrow package: pip install pyarrow"
+        ) from error
+    return pyarrow
+
+
+class ParquetRecordWriter(RecordWriter):
+    """Writes the rows to a Parquet file, a row group per batch"""
+
+    extension = ".parquet"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pa = _pyarrow()
+        # Created with the schema inferred from the first batch
+        self._writer = None
+
+    def _write_batch(self, rows: List[Sequence[Any]]) -> None:
+        columns = zip(*rows)
+        table = self._pa.table(
+            {name: list(column) for name, column in zip(self.field_names, columns)}
+        )
+        if self._writer is None:
+            # A column without a value in the first batch is taken to hold strings
+            schema = self._pa.schema(
+                field.with_type(self._pa.string())
+                if self._pa.types.is_null(field.type)
+                else field
+                for field in table.schema
+            )
+            self._writer = self._pa.parquet.ParquetWriter(
+                self.temp, schema, compression="zstd"
+            )
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def _finish(self) -> None:
+        if self._writer is None:
+            # No rows, the file still has the columns
+            schema = self._pa.schema(
+                [(name, self._pa.string()) for name in self.field_names]
+            )
+            self._writer = self._pa.parquet.ParquetWriter(self.temp, schema)
+        self._writer.close()
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[Dict[str, Any]]:
+        parquet_file = _pyarrow().parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches():
+            yield from batch.to_pylist()
+
+
+class SqliteRecordWriter(RecordWriter):
+    """Writes the rows to a table of a SQLite database, a transaction per batch"""
+
+    extension = ".sqlite"
+
+    def __init__(self, *args, table: str = "records", **kwargs):
+        """
+        :param table: The name of the table
+        """
+        super().__init__(*args, **kwargs)
+        if os.path.exists(self.temp):
+            os.remove(self.temp)
+        columns = ", ".join(f'"{name}"' for name in self.field_names)
+        self._connection = sqlite3.connect(self.temp)
+        # The file is only read once it's moved in place, it doesn't need a journal
+        self._connection.execute("PRAGMA journal_mode=OFF")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute(f'CREATE TABLE "{table}" ({columns})')
+        self._insert = (
+            f'INSERT INTO "{table}" ({columns})'
+            f" VALUES ({', '.join('?' * len(self.field_names))})"
+        )
+
+    def _write_batch(self, rows: List[Sequence[Any]]) -> None:
+        with self._connection:
+            self._connection.executemany(self._insert, rows)
+
+    def _finish(self) -> None:
+        self._connection.close()
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[Dict[str, Any]]:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        connection.row_factory = sqlite3.Row
+        try:
+            (table,) = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' LIMIT 1"
+            ).fetchone()
+            for row in connection.execute(f'SELECT * FROM "{table}" ORDER BY rowid'):
+                yield dict(row)
+        finally:
+            connection.close()
+
+
+WRITERS: Dict[str, type[RecordWriter]] = {
+    "csv": CsvRecordWriter,
+    "jsonl": JsonLinesRecordWriter,
+    "parquet": ParquetRecordWriter,
+    "sqlite": SqliteRecordWriter,
+}
+
+
+def open_writer(
+    output_format: str, path: str, field_names: Sequence[str], **kwargs
+) -> RecordWriter:
+    """
+    :param output_format: ``"csv"``, ``"jsonl"``, ``"parquet"`` or ``"sqlite"``
+
+    :param path: The path of the file
+
+    :param field_names: The names of the values of every row
+
+    :return: The writer of the format
+    """
+    try:
+        writer = WRITERS[output_format]
+    except KeyError:
+        raise ValueError(
+            f"Unknown format {output_format!r}, use one of {', '.join(WRITERS)}"
+        ) from None
+    return writer(path, field_names, **kwargs)
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the records of a file written by one of the writers, by its extension
+
+    :param path: The path of the file
+
+    :return: A generator that yields one dictionary per row
+    """
+    extension = os.path.splitext(path)[1]
+    for writer in WRITERS.values():
+        if writer.extension == extension:
+            return writer.read(path)
+    raise ValueError(f"Unknown format of {path}")